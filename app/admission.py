@@ -0,0 +1,164 @@
+"""Admission control: bounded concurrency and fast load shedding per route class.
+
+Requests are sorted into lanes by path. ``/webhook`` and ``/webhook/batch``
+use the write lane; ``/messages``, ``/messages/export`` and the ``/stats``
+endpoints use the read lane. Anything else (health probes, /metrics) is
+never queued or shed.
+
+Each lane runs at most ``limit`` requests at once and parks up to
+``queue_size`` more in FIFO order. A request that finds the queue full is
+rejected at once with 429; one that waits longer than the queue timeout
+gets 503. Ingest has priority: once ``write_backlog`` webhook requests
+are queued, new reads are refused with 503 instead of joining their own
+queue, so analytical traffic backs off first when the database falls
+behind.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from app.metrics import metrics
+
+metrics.describe('admission_in_flight', 'gauge', 'Requests holding an admission slot by lane')
+metrics.describe('admission_queue_depth', 'gauge', 'Requests waiting for an admission slot by lane')
+metrics.describe('admission_limit', 'gauge', 'Configured concurrent requests per lane', aggregate='max')
+metrics.describe('admission_rejected_total', 'counter', 'Requests shed by admission control by lane and reason')
+metrics.describe_histogram(
+    'admission_wait_ms',
+    'Time requests waited for an admission slot in milliseconds',
+    (0.1, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+
+WRITE_PATHS = frozenset({"/webhook", "/webhook/batch"})
+READ_PATHS = frozenset({"/messages", "/messages/export", "/stats", "/stats/timeseries"})
+
+
+class Rejected(Exception):
+    """Raised by ``acquire`` when a request is shed; carries the HTTP status."""
+
+    def __init__(self, lane: str, reason: str, status_code: int, retry_after_s: int):
+        super().__init__(f"{lane} requests over capacity ({reason})")
+        self.lane = lane
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+
+
+class Lane:
+    """Counting semaphore with a bounded FIFO wait queue.
+
+    Slots are handed to the oldest waiter on release rather than freed, so
+    newcomers cannot overtake queued requests. Not thread-safe: lanes are
+    only used from the event loop.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.active = 0
+        self.waiters: deque = deque()
+        self.labels = f'lane="{name}"'
+
+        metrics.set_gauge('admission_limit', self.limit, labels=self.labels)
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('admission_in_flight', self.active, labels=self.labels)
+        metrics.set_gauge('admission_queue_depth', len(self.waiters), labels=self.labels)
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters)
+
+    def try_acquire(self) -> bool:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self._publish()
+            return True
+        return False
+
+    async def wait(self, timeout: Optional[float]) -> bool:
+        """Queue for a slot; False if ``timeout`` seconds passed first."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self._publish()
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except BaseException:
+            # Cancelled (e.g. the client went away) just as the slot arrived:
+            # pass it on instead of leaking it.
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+            self._publish()
+
+    def release(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+
+class AdmissionController:
+    """Routes requests to the write or read lane and sheds what does not fit.
+
+    ``queue_timeout_ms`` of 0 lets queued requests wait indefinitely;
+    ``retry_after_s`` is sent as ``Retry-After`` on every rejection.
+    Reads are shed while at least ``write_backlog`` writes are queued.
+    """
+
+    def __init__(self, write_limit: int = 64, write_queue: int = 256,
+                 read_limit: int = 8, read_queue: int = 32,
+                 queue_timeout_ms: float = 2000, retry_after_s: float = 1,
+                 write_backlog: int = 32):
+        self.write = Lane("write", write_limit, write_queue)
+        self.read = Lane("read", read_limit, read_queue)
+        self.queue_timeout = queue_timeout_ms / 1000 if queue_timeout_ms > 0 else None
+        self.retry_after_s = max(1, math.ceil(retry_after_s))
+        self.write_backlog = max(1, write_backlog)
+
+    def lane_for(self, path: str) -> Optional[Lane]:
+        if path in WRITE_PATHS:
+            return self.write
+        if path in READ_PATHS:
+            return self.read
+        return None
+
+    def _reject(self, lane: Lane, reason: str, status_code: int) -> Rejected:
+        metrics.inc_counter('admission_rejected_total', labels=f'{lane.labels},reason="{reason}"')
+        return Rejected(lane.name, reason, status_code, self.retry_after_s)
+
+    async def acquire(self, lane: Lane) -> float:
+        """Take a slot in ``lane``, waiting if needed; returns the wait in ms.
+
+        Raises Rejected when the request is shed. Every successful call
+        must be paired with ``lane.release()``.
+        """
+        if lane is self.read and self.write.queued >= self.write_backlog:
+            raise self._reject(lane, "write_priority", 503)
+        if lane.try_acquire():
+            metrics.observe('admission_wait_ms', 0, labels=lane.labels)
+            return 0.0
+        if lane.queued >= lane.queue_size:
+            raise self._reject(lane, "queue_full", 429)
+
+        started = time.perf_counter()
+        admitted = await lane.wait(self.queue_timeout)
+        wait_ms = (time.perf_counter() - started) * 1000
+        metrics.observe('admission_wait_ms', wait_ms, labels=lane.labels)
+        if not admitted:
+            raise self._reject(lane, "queue_timeout", 503)
+        return wait_ms
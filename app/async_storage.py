@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.metrics import metrics
+from app.profiling import record
+
+metrics.describe_histogram(
+    'db_queue_wait_ms',
+    'Time database calls wait for a storage thread in milliseconds',
+    (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000),
+)
+metrics.describe('db_pool_threads', 'gauge', 'Configured storage threads per pool', aggregate='max')
+
+
+class AsyncDatabase:
+    """Awaitable facade over the synchronous Database.
+
+    Reads run on a sized thread pool and writes on a dedicated writer pool
+    (one thread by default), so slow scans never block the event loop.
+    Health checks get a thread of their own so readiness probes never queue
+    behind slow scans. Time spent queued for a thread is recorded in
+    ``db_queue_wait_ms``.
+    """
+
+    def __init__(self, db, read_threads: int = 4, write_threads: int = 1):
+        self.db = db
+        self.read_pool = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="db-read")
+        self.write_pool = ThreadPoolExecutor(max_workers=write_threads, thread_name_prefix="db-write")
+        self.health_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-health")
+
+        metrics.set_gauge('db_pool_threads', read_threads, labels='pool="read"')
+        metrics.set_gauge('db_pool_threads', write_threads, labels='pool="write"')
+
+    async def _run(self, pool: ThreadPoolExecutor, pool_name: str, fn, *args):
+        submitted = time.perf_counter()
+
+        def call():
+            wait_ms = (time.perf_counter() - submitted) * 1000
+            metrics.observe('db_queue_wait_ms', wait_ms, labels=f'pool="{pool_name}"')
+            record("db_queue_wait", wait_ms)
+            return fn(*args)
+
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, context.run, call)
+
+    async def insert_message(self, message_id: str, from_msisdn: str, to_msisdn: str,
+                             ts: str, text: Optional[str]) -> bool:
+        return await self._run(self.write_pool, "write", self.db.insert_message,
+                               message_id, from_msisdn, to_msisdn, ts, text)
+
+    async def insert_messages(self, messages: list[tuple]) -> list[bool]:
+        return await self._run(self.write_pool, "write", self.db.insert_messages, messages)
+
+    async def purge_expired(self, *args) -> int:
+        return await self._run(self.write_pool, "write", self.db.purge_expired, *args)
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        return await self._run(self.write_pool, "write", self.db.incremental_vacuum, pages)
+
+    async def has_message(self, message_id: str, from_msisdn: str = "") -> bool:
+        return await self._run(self.read_pool, "read", self.db.has_message, message_id, from_msisdn)
+
+    async def cache_generation(self):
+        return await self._run(self.read_pool, "read", self.db.cache_generation)
+
+    async def read_versioned(self, method: str, *args) -> tuple:
+        """``(cache_generation, result)`` of a read method in one pool call.
+
+        The generation is read first, so a write committed while the read
+        runs makes the pair stale rather than the cache wrong.
+        """
+        def call():
+            return self.db.cache_generation(), getattr(self.db, method)(*args)
+
+        return await self._run(self.read_pool, "read", call)
+
+    async def get_messages(self, *args):
+        return await self._run(self.read_pool, "read", self.db.get_messages, *args)
+
+    async def get_messages_json(self, *args) -> bytes:
+        return await self._run(self.read_pool, "read", self.db.get_messages_json, *args)
+
+    async def export_messages(self, *args):
+        """Prepare an export on a read thread; the returned iterator is blocking."""
+        return await self._run(self.read_pool, "read", self.db.export_messages, *args)
+
+    async def get_stats(self):
+        return await self._run(self.read_pool, "read", self.db.get_stats)
+
+    async def get_stats_json(self) -> bytes:
+        return await self._run(self.read_pool, "read", self.db.get_stats_json)
+
+    async def get_timeseries_json(self, *args) -> bytes:
+        return await self._run(self.read_pool, "read", self.db.get_timeseries_json, *args)
+
+    async def is_healthy(self) -> bool:
+        return await self._run(self.health_pool, "health", self.db.is_healthy)
+
+    def close(self):
+        self.read_pool.shutdown(wait=True)
+        self.write_pool.shutdown(wait=True)
+        self.health_pool.shutdown(wait=True)
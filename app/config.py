@@ -6,6 +6,79 @@ class Config:
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     WEBHOOK_SECRET: Optional[str] = os.getenv("WEBHOOK_SECRET")
 
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "false").lower() in ("1", "true", "yes")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_BATCH_SIZE: int = int(os.getenv("LOG_BATCH_SIZE", "256"))
+    LOG_SAMPLE_SUCCESS_EVERY: int = int(os.getenv("LOG_SAMPLE_SUCCESS_EVERY", "1"))
+
+    METRICS_MULTIPROC_DIR: Optional[str] = os.getenv("METRICS_MULTIPROC_DIR") or None
+    METRICS_LATENCY_BUCKETS_MS: tuple = tuple(
+        float(bound) for bound in os.getenv(
+            "METRICS_LATENCY_BUCKETS_MS", "5,10,25,50,100,250,500,1000,2500,5000"
+        ).split(",") if bound.strip()
+    )
+    PHASE_TIMING_ENABLED: bool = os.getenv("PHASE_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+    SERVER_TIMING_HEADER: bool = os.getenv("SERVER_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+    PROFILE_SLOWEST_N: int = int(os.getenv("PROFILE_SLOWEST_N", "0"))
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+
+    METRICS_RENDER_CACHE_MS: float = float(os.getenv("METRICS_RENDER_CACHE_MS", "0"))
+
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    LOGSTORE_SEGMENT_BYTES: int = int(os.getenv("LOGSTORE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+    LOGSTORE_FSYNC_INTERVAL_MS: float = float(os.getenv("LOGSTORE_FSYNC_INTERVAL_MS", "0"))
+
+    DB_SHARDS: int = int(os.getenv("DB_SHARDS", "1"))
+    DB_SHARD_KEY: str = os.getenv("DB_SHARD_KEY", "message_id")
+
+    DB_READ_THREADS: int = int(os.getenv("DB_READ_THREADS", "4"))
+    DB_WRITE_THREADS: int = int(os.getenv("DB_WRITE_THREADS", "1"))
+
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    ADMISSION_WRITE_CONCURRENCY: int = int(os.getenv("ADMISSION_WRITE_CONCURRENCY", "64"))
+    ADMISSION_WRITE_QUEUE: int = int(os.getenv("ADMISSION_WRITE_QUEUE", "256"))
+    ADMISSION_READ_CONCURRENCY: int = int(os.getenv("ADMISSION_READ_CONCURRENCY", "8"))
+    ADMISSION_READ_QUEUE: int = int(os.getenv("ADMISSION_READ_QUEUE", "32"))
+    ADMISSION_READ_SHED_WRITE_BACKLOG: int = int(os.getenv("ADMISSION_READ_SHED_WRITE_BACKLOG", "32"))
+    ADMISSION_QUEUE_TIMEOUT_MS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+    ADMISSION_RETRY_AFTER_S: float = float(os.getenv("ADMISSION_RETRY_AFTER_S", "1"))
+
+    FTS_TOKENIZER: str = os.getenv("FTS_TOKENIZER", "trigram")
+    ROLLUP_UTC_OFFSET_MINUTES: int = int(os.getenv("ROLLUP_UTC_OFFSET_MINUTES", "330"))
+
+    TOTAL_ESTIMATE_TTL_S: float = float(os.getenv("TOTAL_ESTIMATE_TTL_S", "30"))
+    TOTAL_ESTIMATE_CACHE_SIZE: int = int(os.getenv("TOTAL_ESTIMATE_CACHE_SIZE", "1024"))
+
+    GROUP_COMMIT_ENABLED: bool = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+    GROUP_COMMIT_BATCH_SIZE: int = int(os.getenv("GROUP_COMMIT_BATCH_SIZE", "64"))
+    GROUP_COMMIT_MAX_LINGER_MS: float = float(os.getenv("GROUP_COMMIT_MAX_LINGER_MS", "5"))
+    GROUP_COMMIT_QUEUE_DEPTH: int = int(os.getenv("GROUP_COMMIT_QUEUE_DEPTH", "1024"))
+
+    DEDUPE_ENABLED: bool = os.getenv("DEDUPE_ENABLED", "true").lower() in ("1", "true", "yes")
+    DEDUPE_LRU_SIZE: int = int(os.getenv("DEDUPE_LRU_SIZE", "100000"))
+    DEDUPE_BLOOM_CAPACITY: int = int(os.getenv("DEDUPE_BLOOM_CAPACITY", "1000000"))
+    DEDUPE_BLOOM_ERROR_RATE: float = float(os.getenv("DEDUPE_BLOOM_ERROR_RATE", "0.01"))
+
+    WEBHOOK_BATCH_MAX_ITEMS: int = int(os.getenv("WEBHOOK_BATCH_MAX_ITEMS", "1000"))
+
+    READ_CACHE_SIZE: int = int(os.getenv("READ_CACHE_SIZE", "256"))
+    READ_CACHE_MAX_AGE_MS: float = float(os.getenv("READ_CACHE_MAX_AGE_MS", "0"))
+
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    RETENTION_DAYS: float = float(os.getenv("RETENTION_DAYS", "0"))
+    RETENTION_INTERVAL_S: float = float(os.getenv("RETENTION_INTERVAL_S", "300"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+    RETENTION_BATCH_PAUSE_MS: float = float(os.getenv("RETENTION_BATCH_PAUSE_MS", "50"))
+    RETENTION_ARCHIVE_DIR: Optional[str] = os.getenv("RETENTION_ARCHIVE_DIR") or None
+    RETENTION_VACUUM_PAGES: int = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))
+
     @classmethod
     def validate(cls) -> bool:
         return cls.WEBHOOK_SECRET is not None and cls.WEBHOOK_SECRET != ""
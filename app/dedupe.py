@@ -0,0 +1,89 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+from app.metrics import metrics
+
+metrics.describe('dedupe_lookups_total', 'counter', 'Duplicate filter lookups by outcome')
+metrics.describe('dedupe_bloom_false_positives_total', 'counter', 'Bloom "maybe" answers that turned out to be new messages')
+metrics.describe('dedupe_lru_size', 'gauge', 'message_ids held in the duplicate filter LRU')
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class DuplicateFilter:
+    """In-process pre-check for webhook retries.
+
+    An LRU of recently seen message_ids answers definite duplicates without
+    touching SQLite. A Bloom filter warmed from the table classifies the
+    rest: "definitely_new" goes straight to the INSERT, and only "maybe"
+    is worth an existence read first. The primary key stays the source of
+    truth, so ids stored by another worker are still caught by the INSERT.
+    """
+
+    def __init__(self, lru_size: int = 100_000, bloom_capacity: int = 1_000_000,
+                 bloom_error_rate: float = 0.01):
+        self.lru_size = lru_size
+        self.recent: OrderedDict = OrderedDict()
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+        self.warm = False
+        self.lock = threading.Lock()
+
+    def warm_from(self, message_ids: Iterable[str]):
+        """Load existing ids into the Bloom filter; until this finishes every miss is a "maybe"."""
+        for message_id in message_ids:
+            with self.lock:
+                self.bloom.add(message_id)
+        self.warm = True
+
+    def is_duplicate(self, message_id: str) -> bool:
+        """True only when message_id is known to be stored already."""
+        return self.lookup(message_id) == "hit"
+
+    def lookup(self, message_id: str) -> str:
+        """Classify message_id as "hit", "definitely_new" or "maybe"."""
+        with self.lock:
+            if message_id in self.recent:
+                self.recent.move_to_end(message_id)
+                result = "hit"
+            elif self.warm and message_id not in self.bloom:
+                result = "definitely_new"
+            else:
+                result = "maybe"
+        metrics.inc_counter('dedupe_lookups_total', labels=f'result="{result}"')
+        return result
+
+    def record(self, message_id: str, inserted: bool):
+        """Remember a message_id the database has just confirmed as stored."""
+        with self.lock:
+            false_positive = inserted and self.warm and message_id in self.bloom
+            self.bloom.add(message_id)
+            self.recent[message_id] = None
+            self.recent.move_to_end(message_id)
+            while len(self.recent) > self.lru_size:
+                self.recent.popitem(last=False)
+            size = len(self.recent)
+        if false_positive:
+            metrics.inc_counter('dedupe_bloom_false_positives_total')
+        metrics.set_gauge('dedupe_lru_size', size)
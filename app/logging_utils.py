@@ -1,9 +1,19 @@
+import atexit
+import copy
+import itertools
 import json
 import logging
+import queue
 import sys
+import threading
 from datetime import datetime
 from typing import Optional
 
+from app.metrics import metrics
+
+metrics.describe('log_records_dropped_total', 'counter', 'Log records not written, by reason')
+metrics.describe('log_records_written_total', 'counter', 'Log records written by the background log writer')
+
 class JSONFormatter(logging.Formatter):
     def format(self, record):
         log_data = {
@@ -31,12 +41,133 @@ class JSONFormatter(logging.Formatter):
 
         return json.dumps(log_data)
 
-def setup_logging(level: str = "INFO"):
+class BatchingQueueHandler(logging.Handler):
+    """Non-blocking handler: records go onto a bounded queue for a background writer.
+
+    Only every ``sample_every``-th successful "Request processed" record is
+    kept; warnings, errors and failed requests are always kept. When the
+    queue is full the record is dropped instead of blocking the caller.
+    Both kinds of drops are counted in ``log_records_dropped_total``.
+
+    Like ``QueueHandler.prepare``, records are copied and their message
+    rendered in ``emit``, so mutable args cannot change before the writer
+    formats them, and no args or tracebacks are held on the queue.
+    """
+
+    def __init__(self, stream=None, queue_size: int = 10000, batch_size: int = 256,
+                 sample_every: int = 1):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = max(1, batch_size)
+        self.sample_every = max(1, sample_every)
+        # next() on a count is atomic, so concurrent emits never share a number.
+        self._sampled = itertools.count(1)
+        self._dropped_full = metrics.counter('log_records_dropped_total', 'reason="queue_full"')
+        self._dropped_sampled = metrics.counter('log_records_dropped_total', 'reason="sampled"')
+        self._dropped_error = metrics.counter('log_records_dropped_total', 'reason="write_error"')
+        self._written = metrics.counter('log_records_written_total')
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def _keep(self, record: logging.LogRecord) -> bool:
+        if self.sample_every == 1 or record.levelno >= logging.WARNING:
+            return True
+        if record.msg != "Request processed" or getattr(record, 'status', 500) >= 400:
+            return True
+        return next(self._sampled) % self.sample_every == 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        if not self._keep(record):
+            self._dropped_sampled.inc()
+            return
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self._dropped_full.inc()
+        except Exception:
+            self.handleError(record)
+
+    def _write(self, records: list):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+            self._written.inc(len(lines))
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = [] if record is None else [record]
+            stopping = record is None
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                else:
+                    batch.append(record)
+            try:
+                self._write(batch)
+            except Exception:
+                self._dropped_error.inc(len(batch))
+            finally:
+                for _ in range(len(batch) + stopping):
+                    self.queue.task_done()
+            if stopping:
+                return
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if self._thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        super().close()
+
+
+def setup_logging(level: str = "INFO", async_mode: bool = False, queue_size: int = 10000,
+                  batch_size: int = 256, sample_every: int = 1):
     logger = logging.getLogger("webhook_api")
     logger.setLevel(getattr(logging, level.upper()))
 
-    handler = logging.StreamHandler(sys.stdout)
+    if async_mode:
+        handler = BatchingQueueHandler(
+            sys.stdout,
+            queue_size=queue_size,
+            batch_size=batch_size,
+            sample_every=sample_every,
+        )
+        atexit.register(handler.close)
+    else:
+        handler = logging.StreamHandler(sys.stdout)
     handler.setFormatter(JSONFormatter())
     logger.addHandler(handler)
 
     return logger
+
+
+def flush_logging():
+    for handler in logging.getLogger("webhook_api").handlers:
+        handler.flush()
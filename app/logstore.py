@@ -0,0 +1,750 @@
+"""Append-only, log-structured message store (``DATABASE_URL=logstore:///dir``).
+
+Messages are appended to numbered segment files and never rewritten in
+place. Each record is a fixed header followed by its payload::
+
+    crc32 | length | kind | ts_epoch_ms | created_us | id_len | from_len | message_id | from | body
+
+``body`` is the message already encoded as its /messages JSON, so reads
+copy bytes straight out of memory-mapped segments. Deletes append a
+tombstone (a record with only a message_id).
+
+The indexes live in memory and are rebuilt on startup from the headers
+and keys alone, without decoding any JSON:
+
+- ``message_id`` -> record location, which also rejects duplicates;
+- every message's ``(ts_epoch_ms, message_id)`` in one sorted list, and
+  per sender in another, for ordered pages, cursors and since/until;
+- per-bucket message counts for /stats/timeseries, overall and per sender.
+"""
+import bisect
+import csv
+import fcntl
+import heapq
+import io
+import itertools
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from app.config import config
+from app.profiling import phase
+from app.storage import (
+    EPOCH,
+    ROLLUP_BUCKETS,
+    bucket_start,
+    decode_cursor,
+    encode_cursor,
+    parse_bound,
+    render_timeseries,
+    rollup_offset_ms,
+    timeseries_range,
+    ts_to_epoch_ms,
+)
+
+logger = logging.getLogger("webhook_api")
+
+HEADER = struct.Struct("<IIBqqHH")
+PUT = 1
+DELETE = 2
+SEGMENT_NAME = re.compile(r"^segment-(\d{8})\.log$")
+
+# Keys handled per lock acquisition while scanning.
+SCAN_CHUNK = 512
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def encode_record(kind: int, ts_epoch_ms: int, created_us: int, message_id: str,
+                  from_msisdn: str = "", body: bytes = b"") -> bytes:
+    key = message_id.encode()
+    sender = from_msisdn.encode()
+    payload = key + sender + body
+    header = HEADER.pack(0, len(payload), kind, ts_epoch_ms, created_us, len(key), len(sender))[4:]
+    return struct.pack("<I", zlib.crc32(payload, zlib.crc32(header))) + header + payload
+
+
+def like_pattern(q: str) -> re.Pattern:
+    """Regex equivalent of SQLite's ``LIKE '%q%'`` (no ESCAPE clause).
+
+    ``%`` matches any run of characters and ``_`` exactly one; only ASCII
+    letters compare case-insensitively, as in SQLite without ICU.
+    """
+    parts = []
+    for char in q:
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        elif char.isascii() and char.isalpha():
+            parts.append(f"[{char.lower()}{char.upper()}]")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+class Location(NamedTuple):
+    key: tuple[int, str]
+    from_msisdn: str
+    segment: int
+    offset: int
+    size: int
+    body_start: int
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+
+class RollupSeries:
+    """Message counts per bucket start, with the starts kept sorted for range reads."""
+
+    __slots__ = ("starts", "counts")
+
+    def __init__(self):
+        self.starts: list[int] = []
+        self.counts: dict[int, int] = {}
+
+    def add(self, start: int, delta: int):
+        count = self.counts.get(start, 0) + delta
+        if count > 0:
+            if start not in self.counts:
+                # Messages mostly arrive in time order, making this an append.
+                bisect.insort(self.starts, start)
+            self.counts[start] = count
+        elif start in self.counts:
+            del self.counts[start]
+            del self.starts[bisect.bisect_left(self.starts, start)]
+
+    def range(self, low: Optional[int], high: Optional[int]) -> list[tuple[int, int]]:
+        first = 0 if low is None else bisect.bisect_left(self.starts, low)
+        last = len(self.starts) if high is None else bisect.bisect_left(self.starts, high)
+        return [(start, self.counts[start]) for start in self.starts[first:last]]
+
+
+class LogStore:
+    """Message storage on append-only segment files; see the module docstring.
+
+    One lock guards the indexes and the active segment. Writes hold it
+    for an append, the fsync and the index update; reads take it once per
+    ``SCAN_CHUNK`` keys and copy record bodies out of the mappings after
+    releasing it. A scan therefore sees messages inserted ahead of its
+    position while it runs, unlike SQLite's per-statement snapshot.
+
+    Appends are fsynced once per insert_message/insert_messages call, so
+    group commit batches them; with ``fsync_interval_ms`` set, at most once
+    per interval (and on close), trading power-loss durability of the
+    last writes for throughput.
+    """
+
+    def __init__(self, directory: str, segment_bytes: Optional[int] = None,
+                 fsync_interval_ms: Optional[float] = None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes or config.LOGSTORE_SEGMENT_BYTES
+        if fsync_interval_ms is None:
+            fsync_interval_ms = config.LOGSTORE_FSYNC_INTERVAL_MS
+        self.fsync_interval = max(0.0, fsync_interval_ms) / 1000
+
+        self._lock = threading.Lock()
+        self._index: dict[str, Location] = {}
+        self._order: list[tuple[int, str]] = []
+        self._senders: dict[str, list[tuple[int, str]]] = {}
+        # (sender or "" for all, bucket_ms) -> counts
+        self._rollups: dict[tuple[str, int], RollupSeries] = {}
+        self._rollup_offset = rollup_offset_ms()
+
+        # segment -> valid bytes on disk, and how many of them are live puts
+        self._sizes: dict[int, int] = {}
+        self._live: dict[int, int] = {}
+        self._maps: dict[int, mmap.mmap] = {}
+        self._active = 0
+        self._fd: Optional[int] = None
+        self._unsynced = False
+        self._last_sync = 0.0
+
+        self._writes = itertools.count(1)
+        self.write_generation = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd: Optional[int] = self._lock_directory()
+        try:
+            self._load()
+        except BaseException:
+            self._unlock_directory()
+            raise
+
+    def _lock_directory(self) -> int:
+        """Take the exclusive lock on ``LOCK``; raises RuntimeError if another store holds it.
+
+        Each open store keeps its own segment offsets and cuts off what looks
+        like a torn tail on startup, so a second process (another worker, or
+        app.manage against a running server) would corrupt the segments.
+        """
+        fd = os.open(os.path.join(self.directory, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError(
+                f"log store {self.directory} is already open in another process "
+                "(the log store supports a single process per directory)"
+            ) from None
+        return fd
+
+    def _unlock_directory(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def cache_generation(self) -> int:
+        # The directory lock keeps other processes out, so local writes are all there is.
+        return self.write_generation
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:08d}.log")
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _load(self):
+        """Rebuild the indexes by replaying every segment, oldest first."""
+        started = time.perf_counter()
+        segments = sorted(
+            int(match.group(1)) for match in map(SEGMENT_NAME.match, os.listdir(self.directory)) if match
+        )
+        index: dict[str, Location] = {}
+        for segment in segments:
+            self._sizes[segment] = self._replay(segment, index, last=segment == segments[-1])
+            self._live[segment] = 0
+        for location in index.values():
+            self._live[location.segment] += location.size
+
+        self._index = index
+        self._order = sorted(location.key for location in index.values())
+        for key in self._order:
+            self._senders.setdefault(index[key[1]].from_msisdn, []).append(key)
+        self._load_rollups()
+
+        self._open_segment(segments[-1] if segments else 1)
+        logger.info(
+            "Log store loaded %d messages from %d segments in %.0f ms",
+            len(index), len(segments), (time.perf_counter() - started) * 1000,
+        )
+
+    def _replay(self, segment: int, index: dict, last: bool) -> int:
+        """Apply one segment's records to ``index``; returns the length of its valid prefix.
+
+        A torn or corrupt record ends the replay of a segment. At the end of
+        the newest segment that is an interrupted append and is cut off;
+        anywhere else the rest of the segment is ignored and logged.
+        """
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        offset = 0
+        # Senders repeat a lot; decoding each once also shares the strings.
+        senders: dict[bytes, str] = {}
+        unpack_from, header_size, crc32 = HEADER.unpack_from, HEADER.size, zlib.crc32
+        if size:
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                while offset + header_size <= size:
+                    crc, length, kind, ts_epoch_ms, _, id_len, from_len = unpack_from(view, offset)
+                    end = offset + header_size + length
+                    if end > size or kind not in (PUT, DELETE) or crc32(view[offset + 4:end]) != crc:
+                        break
+                    start = offset + header_size
+                    message_id = view[start:start + id_len].decode()
+                    if kind == PUT:
+                        raw_sender = view[start + id_len:start + id_len + from_len]
+                        from_msisdn = senders.get(raw_sender)
+                        if from_msisdn is None:
+                            from_msisdn = senders[raw_sender] = raw_sender.decode()
+                        index[message_id] = Location(
+                            (ts_epoch_ms, message_id), from_msisdn, segment, offset,
+                            end - offset, start + id_len + from_len,
+                        )
+                    else:
+                        index.pop(message_id, None)
+                    offset = end
+
+        if offset < size:
+            if last:
+                logger.warning("Truncating %d bytes of an interrupted append in %s", size - offset, path)
+                os.truncate(path, offset)
+            else:
+                logger.error("Log segment %s is corrupt after byte %d; ignoring the rest", path, offset)
+        return offset
+
+    def _open_segment(self, segment: int):
+        self._fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active = segment
+        self._sizes.setdefault(segment, 0)
+        self._live.setdefault(segment, 0)
+        self._sync_directory()
+
+    def _append(self, data: bytes) -> int:
+        """Write ``data`` to the end of the active segment and return its offset.
+
+        Rolls over to a new segment once the active one reaches
+        ``segment_bytes``. A failed write is cut back off so the segment
+        never ends in a partial record. Caller holds the lock.
+        """
+        if self._sizes[self._active] >= self.segment_bytes:
+            self._sync(force=True)
+            os.close(self._fd)
+            self._open_segment(self._active + 1)
+
+        offset = self._sizes[self._active]
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+        except BaseException:
+            os.ftruncate(self._fd, offset)
+            raise
+        self._sizes[self._active] = offset + len(data)
+        self._unsynced = True
+        return offset
+
+    def _sync(self, force: bool = False):
+        if not self._unsynced:
+            return
+        now = time.monotonic()
+        if force or now - self._last_sync >= self.fsync_interval:
+            _fdatasync(self._fd)
+            self._unsynced = False
+            self._last_sync = now
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        """Read-only mapping of ``segment`` covering at least ``end`` bytes. Caller holds the lock.
+
+        A mapping that has become too short is replaced, not closed: readers
+        may still be copying from it, and it is released with its last
+        reference.
+        """
+        view = self._maps.get(segment)
+        if view is None or len(view) < end:
+            with open(self._segment_path(segment), "rb") as file:
+                view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = view
+        return view
+
+    def _load_rollups(self):
+        """Build every rollup series in bulk from the loaded indexes."""
+        offset = self._rollup_offset
+        for bucket_ms in ROLLUP_BUCKETS.values():
+            for sender, keys in [*self._senders.items(), ("", self._order)]:
+                if not keys:
+                    continue
+                counts = Counter([(ts + offset) // bucket_ms for ts, _ in keys])
+                series = self._rollups[(sender, bucket_ms)] = RollupSeries()
+                series.starts = [bucket * bucket_ms - offset for bucket in counts]
+                series.counts = dict(zip(series.starts, counts.values()))
+
+    def _count_rollups(self, ts_epoch_ms: int, from_msisdn: str, delta: int):
+        for bucket_ms in ROLLUP_BUCKETS.values():
+            start = bucket_start(ts_epoch_ms, bucket_ms, self._rollup_offset)
+            for sender in (from_msisdn, ""):
+                series = self._rollups.get((sender, bucket_ms))
+                if series is None:
+                    series = self._rollups[(sender, bucket_ms)] = RollupSeries()
+                series.add(start, delta)
+                if not series.starts:
+                    del self._rollups[(sender, bucket_ms)]
+
+    def _add(self, location: Location):
+        self._index[location.key[1]] = location
+        bisect.insort(self._order, location.key)
+        bisect.insort(self._senders.setdefault(location.from_msisdn, []), location.key)
+        self._count_rollups(location.key[0], location.from_msisdn, 1)
+        self._live[location.segment] += location.size
+
+    def _forget_sender(self, location: Location):
+        keys = self._senders[location.from_msisdn]
+        del keys[bisect.bisect_left(keys, location.key)]
+        if not keys:
+            del self._senders[location.from_msisdn]
+
+    def insert_message(self, message_id: str, from_msisdn: str, to_msisdn: str,
+                       ts: str, text: Optional[str]) -> bool:
+        return self.insert_messages([(message_id, from_msisdn, to_msisdn, ts, text)])[0]
+
+    def insert_messages(self, messages: list[tuple]) -> list[bool]:
+        """Append (message_id, from, to, ts, text) rows with a single write and fsync.
+
+        Returns one flag per input row: True if it was created, False if the
+        message_id already existed (in the store or earlier in the batch).
+        """
+        if not messages:
+            return []
+
+        created_us = time.time_ns() // 1000
+        encoded = []
+        for message_id, from_msisdn, to_msisdn, ts, text in messages:
+            body = json.dumps(
+                {"message_id": message_id, "from": from_msisdn, "to": to_msisdn, "ts": ts, "text": text},
+                ensure_ascii=False, separators=(",", ":"),
+            ).encode()
+            ts_epoch_ms = ts_to_epoch_ms(ts)
+            record = encode_record(PUT, ts_epoch_ms, created_us, message_id, from_msisdn, body)
+            encoded.append((message_id, from_msisdn, ts_epoch_ms, len(record) - len(body), record))
+
+        with self._lock:
+            results = []
+            batch = []
+            seen = set()
+            for entry in encoded:
+                if entry[0] in self._index or entry[0] in seen:
+                    results.append(False)
+                    continue
+                seen.add(entry[0])
+                results.append(True)
+                batch.append(entry)
+            if not batch:
+                return results
+
+            with phase("db_insert"):
+                offset = self._append(b"".join([entry[4] for entry in batch]))
+            with phase("db_commit"):
+                self._sync()
+
+            for message_id, from_msisdn, ts_epoch_ms, body_start, record in batch:
+                self._add(Location(
+                    (ts_epoch_ms, message_id), from_msisdn, self._active, offset,
+                    len(record), offset + body_start,
+                ))
+                offset += len(record)
+            self.write_generation = next(self._writes)
+        return results
+
+    def has_message(self, message_id: str, from_msisdn: str = "") -> bool:
+        with self._lock:
+            return message_id in self._index
+
+    def iter_message_ids(self, batch_size: int = 10000) -> Iterator[str]:
+        """Yield every stored message_id as of the call."""
+        with self._lock:
+            message_ids = list(self._index)
+        yield from message_ids
+
+    def _scan(self, from_filter: Optional[str], lower: Optional[tuple],
+              until_ms: Optional[int]) -> Iterator[tuple[Location, bytes]]:
+        """Yield ``(location, body)`` in (ts_epoch_ms, message_id) order.
+
+        Starts after ``lower`` (``(since_ms,)`` sorts before every key with
+        that timestamp, so it works as an inclusive bound) and stops before
+        ``until_ms``.
+        """
+        while True:
+            with self._lock:
+                keys = self._senders.get(from_filter, []) if from_filter else self._order
+                start = bisect.bisect_right(keys, lower) if lower is not None else 0
+                chunk = []
+                for key in keys[start:start + SCAN_CHUNK]:
+                    if until_ms is not None and key[0] >= until_ms:
+                        break
+                    location = self._index[key[1]]
+                    chunk.append((location, self._map(location.segment, location.end)))
+
+            for location, view in chunk:
+                yield location, view[location.body_start:location.end]
+            if len(chunk) < SCAN_CHUNK:
+                return
+            lower = chunk[-1][0].key
+
+    def _select(self, from_filter: Optional[str], since: Optional[str], q: Optional[str],
+                until: Optional[str], after: Optional[tuple] = None) -> Iterator[tuple[Location, bytes]]:
+        """Matching records after the ``after`` key; raises ValueError for bad since/until.
+
+        ``q`` behaves like SQLite's ``text LIKE '%q%'``: ``%`` and ``_`` are
+        wildcards and only ASCII letters match case-insensitively. Each
+        candidate is decoded to test it.
+        """
+        lower = (parse_bound("since", since),) if since else None
+        until_ms = parse_bound("until", until) if until else None
+        if after is not None and (lower is None or after > lower):
+            lower = after
+
+        rows = self._scan(from_filter, lower, until_ms)
+        if q:
+            pattern = like_pattern(q)
+            rows = (row for row in rows if self._matches(row[1], pattern))
+        return rows
+
+    @staticmethod
+    def _matches(body: bytes, pattern: re.Pattern) -> bool:
+        text = json.loads(body)["text"]
+        return text is not None and pattern.search(text) is not None
+
+    def _count(self, from_filter: Optional[str], since: Optional[str], q: Optional[str],
+               until: Optional[str]) -> int:
+        if q:
+            return sum(1 for _ in self._select(from_filter, since, q, until))
+        since_ms = parse_bound("since", since) if since else None
+        until_ms = parse_bound("until", until) if until else None
+        with self._lock:
+            keys = self._senders.get(from_filter, []) if from_filter else self._order
+            start = bisect.bisect_left(keys, (since_ms,)) if since_ms is not None else 0
+            stop = bisect.bisect_left(keys, (until_ms,)) if until_ms is not None else len(keys)
+        return max(0, stop - start)
+
+    def _page(self, limit: int, offset: int, from_filter: Optional[str], since: Optional[str],
+              q: Optional[str], cursor: Optional[str], total_mode: str, until: Optional[str]):
+        """Returns ``(bodies, total, next_cursor, has_more)``.
+
+        Counts are cheap bisections unless ``q`` is given, so ``estimate``
+        is always exact here.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        total = None if total_mode == "none" else self._count(from_filter, since, q, until)
+        rows = list(itertools.islice(
+            self._select(from_filter, since, q, until, after), offset, offset + limit + 1
+        ))
+
+        next_cursor = None
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(*rows[-1][0].key)
+        return [body for _, body in rows], total, next_cursor, has_more
+
+    def get_messages(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                     since: Optional[str] = None, q: Optional[str] = None,
+                     cursor: Optional[str] = None, total_mode: str = "exact",
+                     until: Optional[str] = None):
+        """One page ordered by (ts_epoch_ms, message_id); same contract as Database.get_messages."""
+        bodies, total, next_cursor, has_more = self._page(
+            limit, offset, from_filter, since, q, cursor, total_mode, until
+        )
+        return {
+            'data': [json.loads(body) for body in bodies],
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+
+    def get_messages_json(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                          since: Optional[str] = None, q: Optional[str] = None,
+                          cursor: Optional[str] = None, total_mode: str = "exact",
+                          until: Optional[str] = None) -> bytes:
+        """get_messages as the JSON response body, built from the stored record bodies."""
+        with phase("db_query"):
+            bodies, total, next_cursor, has_more = self._page(
+                limit, offset, from_filter, since, q, cursor, total_mode, until
+            )
+
+        return (
+            b'{"data":[' + b",".join(bodies)
+            + b'],"total":' + json.dumps(total).encode()
+            + b',"limit":' + str(limit).encode()
+            + b',"offset":' + str(offset).encode()
+            + b',"next_cursor":' + json.dumps(next_cursor).encode()
+            + b',"has_more":' + (b"true" if has_more else b"false")
+            + b"}"
+        )
+
+    def export_messages(self, fmt: str = "ndjson", from_filter: Optional[str] = None,
+                        since: Optional[str] = None, q: Optional[str] = None,
+                        after: Optional[str] = None, batch_size: int = 1000,
+                        until: Optional[str] = None) -> Iterator[bytes]:
+        """Stream every matching message as encoded chunks; same contract as Database.export_messages.
+
+        The export walks the live indexes rather than a snapshot, so
+        messages inserted ahead of it while it runs are included.
+        """
+        lower = None
+        if after is not None:
+            with self._lock:
+                location = self._index.get(after)
+            if location is None:
+                raise ValueError("unknown after message_id")
+            lower = location.key
+        rows = self._select(from_filter, since, q, until, lower)
+        return self._export_chunks(rows, fmt, batch_size)
+
+    @staticmethod
+    def _export_chunks(rows: Iterator[tuple[Location, bytes]], fmt: str,
+                       batch_size: int) -> Iterator[bytes]:
+        if fmt == "csv":
+            yield b"message_id,from,to,ts,text\r\n"
+        while True:
+            bodies = [body for _, body in itertools.islice(rows, batch_size)]
+            if not bodies:
+                break
+            if fmt == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    (m["message_id"], m["from"], m["to"], m["ts"], m["text"]) for m in map(json.loads, bodies)
+                )
+                yield buffer.getvalue().encode()
+            else:
+                yield b"\n".join(bodies) + b"\n"
+
+    def _archive_line(self, location: Location) -> str:
+        view = self._map(location.segment, location.end)
+        created_us = HEADER.unpack_from(view, location.offset)[4]
+        created_at = (EPOCH + timedelta(microseconds=created_us)).replace(tzinfo=None).isoformat() + "Z"
+        body = view[location.body_start:location.end].decode()
+        return body[:-1] + ',"created_at":' + json.dumps(created_at) + "}"
+
+    def purge_expired(self, cutoff_ms: int, batch_size: int = 500,
+                      archive: Optional[Callable[[list[str]], None]] = None) -> int:
+        """Delete up to ``batch_size`` messages with ts_epoch_ms < ``cutoff_ms``, oldest first.
+
+        Appends one tombstone per message. ``archive`` gets the NDJSON
+        lines first, exactly as with Database.purge_expired; if it raises,
+        nothing is deleted. Space comes back through incremental_vacuum.
+        """
+        with self._lock:
+            count = bisect.bisect_left(self._order, (cutoff_ms,), 0, min(batch_size, len(self._order)))
+            if not count:
+                return 0
+            expired = [self._index[key[1]] for key in self._order[:count]]
+            if archive is not None:
+                archive([self._archive_line(location) for location in expired])
+
+            self._append(b"".join([encode_record(DELETE, location.key[0], 0, location.key[1])
+                                   for location in expired]))
+            self._sync()
+
+            del self._order[:count]
+            for location in expired:
+                del self._index[location.key[1]]
+                self._forget_sender(location)
+                self._count_rollups(location.key[0], location.from_msisdn, -1)
+                self._live[location.segment] -= location.size
+            self.write_generation = next(self._writes)
+            return count
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Compact up to ``pages`` of the oldest segments; returns how many were removed.
+
+        The counterpart of SQLite's incremental vacuum: the oldest sealed
+        segment is rewritten while at most half of it is live, by appending
+        its live records to the active segment and deleting the file.
+        Going strictly oldest first is what makes dropping its tombstones
+        safe, since the records they deleted can only have been in that
+        segment or in one already removed.
+        """
+        removed = 0
+        while removed < pages:
+            with self._lock:
+                oldest = min(self._sizes)
+                if oldest == self._active or self._live[oldest] * 2 > self._sizes[oldest]:
+                    break
+                self._compact(oldest)
+            removed += 1
+        return removed
+
+    def _compact(self, segment: int):
+        size = self._sizes[segment]
+        view = self._map(segment, size) if size else None
+        live = []
+        offset = 0
+        while offset < size:
+            _, length, kind, _, _, id_len, _ = HEADER.unpack_from(view, offset)
+            if kind == PUT:
+                start = offset + HEADER.size
+                location = self._index.get(view[start:start + id_len].decode())
+                if location is not None and location.segment == segment and location.offset == offset:
+                    live.append(location)
+            offset += HEADER.size + length
+
+        if live:
+            position = self._append(b"".join([view[location.offset:location.end] for location in live]))
+            self._sync(force=True)
+            for location in live:
+                moved = location._replace(
+                    segment=self._active, offset=position,
+                    body_start=position + location.body_start - location.offset,
+                )
+                self._index[location.key[1]] = moved
+                self._live[self._active] += moved.size
+                position += moved.size
+
+        # Readers may still hold the mapping; unlinking leaves it valid.
+        self._maps.pop(segment, None)
+        del self._sizes[segment]
+        del self._live[segment]
+        os.unlink(self._segment_path(segment))
+        self._sync_directory()
+
+    def rebuild_aggregates(self):
+        """Rebuild every index from the segment files."""
+        with self._lock:
+            self._sync(force=True)
+            os.close(self._fd)
+            # Mappings are dropped rather than closed; readers may hold them.
+            self._index, self._order, self._senders, self._maps = {}, [], {}, {}
+            self._rollups = {}
+            self._sizes, self._live = {}, {}
+            self._load()
+            self.write_generation = next(self._writes)
+
+    def get_stats(self):
+        with self._lock:
+            per_sender = heapq.nsmallest(
+                10, self._senders.items(), key=lambda item: (-len(item[1]), item[0])
+            )
+            totals = {
+                'total_messages': len(self._index),
+                'senders_count': len(self._senders),
+                'messages_per_sender': [{'from': sender, 'count': len(keys)} for sender, keys in per_sender],
+            }
+            ends = [self._index[self._order[i][1]] for i in (0, -1)] if self._order else []
+            views = [(location, self._map(location.segment, location.end)) for location in ends]
+
+        first_ts, last_ts = (
+            [json.loads(view[location.body_start:location.end])["ts"] for location, view in views]
+            or [None, None]
+        )
+        return {**totals, 'first_message_ts': first_ts, 'last_message_ts': last_ts}
+
+    def get_stats_json(self) -> bytes:
+        with phase("db_query"):
+            stats = self.get_stats()
+        return json.dumps(stats, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def get_timeseries(self, bucket: str = "hour", since: Optional[str] = None,
+                       until: Optional[str] = None,
+                       from_filter: Optional[str] = None) -> list[tuple[int, int]]:
+        """Database.get_timeseries from the in-memory rollups."""
+        bucket_ms, low, high = timeseries_range(bucket, since, until)
+        with self._lock:
+            series = self._rollups.get((from_filter or "", bucket_ms))
+            return series.range(low, high) if series is not None else []
+
+    def get_timeseries_json(self, bucket: str = "hour", since: Optional[str] = None,
+                            until: Optional[str] = None, from_filter: Optional[str] = None) -> bytes:
+        with phase("db_query"):
+            points = self.get_timeseries(bucket, since, until, from_filter)
+        return render_timeseries(bucket, points, self._rollup_offset)
+
+    def is_healthy(self) -> bool:
+        return self._fd is not None and os.path.isdir(self.directory)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._sync(force=True)
+                os.close(self._fd)
+                self._fd = None
+            maps, self._maps = self._maps, {}
+            for view in maps.values():
+                view.close()
+            self._unlock_directory()
@@ -1,34 +1,79 @@
+import asyncio
 import hmac
 import hashlib
+import json
 import uuid
+import zlib
 import time
-import os
-from typing import Optional
+from typing import Literal, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, HTTPException, Query, Header, Body
-from fastapi.responses import PlainTextResponse
-# from pydantic import ValidationError
+from fastapi import FastAPI, Request, HTTPException, Query, Header
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import ValidationError
 
 from app.config import config
-from app.models import WebhookMessage, MessagesListResponse, StatsResponse
-
-from app.storage import Database
-
-
-from app.logging_utils import setup_logging
+from app.models import (
+    WebhookMessage,
+    MessagesListResponse,
+    StatsResponse,
+    TimeseriesResponse,
+    BatchItemResult,
+    BatchWebhookResponse,
+    validate_payload,
+    validate_many,
+)
+
+from app.storage import open_database
+from app.async_storage import AsyncDatabase
+from app.writer import GroupCommitWriter
+from app.dedupe import DuplicateFilter
+from app.retention import RetentionWorker
+from app.read_cache import ReadCache, etag_matches
+from app.admission import AdmissionController, Rejected
+
+
+from app.logging_utils import setup_logging, flush_logging
 from app.metrics import metrics
-
-logger = setup_logging(config.LOG_LEVEL)
-
-
-raw_db_path = config.DATABASE_URL.replace("sqlite:///", "")
-
-
-db_path = os.path.abspath(raw_db_path)
-
-
-db = Database(db_path)
+from app import profiling
+from app.profiling import phase, SlowRequestProfiler
+
+logger = setup_logging(
+    config.LOG_LEVEL,
+    async_mode=config.LOG_ASYNC,
+    queue_size=config.LOG_QUEUE_SIZE,
+    batch_size=config.LOG_BATCH_SIZE,
+    sample_every=config.LOG_SAMPLE_SUCCESS_EVERY,
+)
+
+
+db = open_database(config.DATABASE_URL)
+
+async_db: Optional[AsyncDatabase] = None
+writer: Optional[GroupCommitWriter] = None
+dedupe: Optional[DuplicateFilter] = None
+retention: Optional[RetentionWorker] = None
+read_cache: Optional[ReadCache] = None
+
+# Phases are timed whenever the histogram or the header wants them.
+phase_timing = config.PHASE_TIMING_ENABLED or config.SERVER_TIMING_HEADER
+slow_profiler = (
+    SlowRequestProfiler(config.PROFILE_DIR, config.PROFILE_SLOWEST_N, config.PROFILE_SAMPLE_RATE)
+    if config.PROFILE_SLOWEST_N > 0 else None
+)
+admission = (
+    AdmissionController(
+        write_limit=config.ADMISSION_WRITE_CONCURRENCY,
+        write_queue=config.ADMISSION_WRITE_QUEUE,
+        read_limit=config.ADMISSION_READ_CONCURRENCY,
+        read_queue=config.ADMISSION_READ_QUEUE,
+        queue_timeout_ms=config.ADMISSION_QUEUE_TIMEOUT_MS,
+        retry_after_s=config.ADMISSION_RETRY_AFTER_S,
+        write_backlog=config.ADMISSION_READ_SHED_WRITE_BACKLOG,
+    )
+    if config.ADMISSION_ENABLED else None
+)
 
 
 
@@ -52,6 +97,173 @@ def verify_signature(body: bytes, signature: str) -> bool:
     return hmac.compare_digest(expected, signature)
 
 
+def parse_webhook_body(body: bytes) -> WebhookMessage:
+    """Decode and validate an already-verified /webhook body.
+
+    Raises RequestValidationError with the same errors FastAPI produces when
+    it parses the body itself, so 422 responses are unchanged: an empty or
+    ``null`` body is a missing field, and FastAPI validates bodies with
+    ``from_attributes`` so non-objects fail with ``model_attributes_type``.
+    """
+    try:
+        data = json.loads(body) if body else None
+    except json.JSONDecodeError as exc:
+        raise RequestValidationError(
+            [{
+                "type": "json_invalid",
+                "loc": ("body", exc.pos),
+                "msg": "JSON decode error",
+                "input": {},
+                "ctx": {"error": exc.msg},
+            }],
+            body=exc.doc
+        )
+    try:
+        if data is None:
+            raise ValidationError.from_exception_data(
+                "Field required", [{"type": "missing", "loc": (), "input": None}]
+            )
+        if not isinstance(data, dict):
+            return WebhookMessage.model_validate(data, from_attributes=True)
+        return validate_payload(data)
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in exc.errors()],
+            body=data
+        )
+
+
+def format_validation_errors(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" if error['loc'] else error['msg']
+        for error in exc.errors()
+    )
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q-values.
+
+    An explicit ``gzip`` (or ``x-gzip``) entry decides; otherwise ``*``
+    does. ``q=0`` means "not acceptable".
+    """
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of byte chunks without buffering the whole body; closing it closes ``chunks``."""
+    compressor = zlib.compressobj(wbits=31)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        chunks.close()
+
+
+class BlockingStreamingResponse(StreamingResponse):
+    """Streams a blocking chunk generator and always closes it.
+
+    Starlette iterates sync iterators on worker threads but never closes
+    them, so a client that disconnected mid-export left the generator, and
+    the read-only connection behind it, open until garbage collection.
+    Thread calls are not cancellable, so no ``next`` is running by the time
+    the ``finally`` closes the generator.
+    """
+
+    def __init__(self, chunks, **kwargs):
+        super().__init__(chunks, **kwargs)
+        self.chunks = chunks
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            self.chunks.close()
+
+
+class SlotReleasingResponse:
+    """Sends ``response`` and then releases its admission slot.
+
+    The release sits in ``__call__``'s finally rather than in a wrapper
+    around the body iterator: an abandoned iterator is only finalized by
+    the garbage collector, so a client disconnecting early would hold the
+    slot until then.
+    """
+
+    def __init__(self, response: Response, lane):
+        self.response = response
+        self.lane = lane
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            self.lane.release()
+
+
+async def cached_json(request: Request, endpoint: str, key: tuple, produce) -> Response:
+    """Serve a read endpoint's JSON body from the read cache, with ETag/304.
+
+    ``produce`` is awaited only on a miss and returns ``(generation, body)``
+    from a single read-pool call; its ValueError propagates. The storage
+    generation is also read on the pool, never on the event loop.
+    """
+    entry = read_cache.get(endpoint, key, await async_db.cache_generation())
+    if entry is None:
+        entry = read_cache.put(key, *await produce())
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        metrics.inc_counter('read_cache_not_modified_total', labels=f'endpoint="{endpoint}"')
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def parse_batch_body(body: bytes) -> list:
+    """Decode a JSON array or NDJSON body into raw items.
+
+    NDJSON lines that are not valid JSON are returned as ``None`` so they
+    can be reported per item instead of failing the whole batch.
+    """
+    text = body.decode("utf-8")
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array")
+        return items
+
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items
+
+
 
 
 
@@ -62,12 +274,71 @@ def verify_signature(body: bytes, signature: str) -> bool:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global async_db, writer, dedupe, retention, read_cache
+
     if not config.validate():
         logger.error("WEBHOOK_SECRET not set - service not ready")
     else:
-        logger.info("Service starting up", extra={"db_path": db_path})
+        logger.info("Service starting up", extra={"database_url": config.DATABASE_URL})
+
+    async_db = AsyncDatabase(
+        db,
+        read_threads=config.DB_READ_THREADS,
+        # Shards commit in parallel only if single inserts can reach them concurrently.
+        write_threads=max(config.DB_WRITE_THREADS, config.DB_SHARDS),
+    )
+
+    read_cache = ReadCache(
+        max_entries=config.READ_CACHE_SIZE,
+        max_age_ms=config.READ_CACHE_MAX_AGE_MS,
+    )
+
+    warmup = None
+    if config.DEDUPE_ENABLED:
+        dedupe = DuplicateFilter(
+            lru_size=config.DEDUPE_LRU_SIZE,
+            bloom_capacity=config.DEDUPE_BLOOM_CAPACITY,
+            bloom_error_rate=config.DEDUPE_BLOOM_ERROR_RATE,
+        )
+        warmup = asyncio.create_task(asyncio.to_thread(dedupe.warm_from, db.iter_message_ids()))
+
+    if config.GROUP_COMMIT_ENABLED:
+        writer = GroupCommitWriter(
+            async_db,
+            batch_size=config.GROUP_COMMIT_BATCH_SIZE,
+            max_linger_ms=config.GROUP_COMMIT_MAX_LINGER_MS,
+            queue_depth=config.GROUP_COMMIT_QUEUE_DEPTH,
+        )
+        await writer.start()
+
+    if config.RETENTION_DAYS > 0:
+        retention = RetentionWorker(
+            async_db,
+            retention_days=config.RETENTION_DAYS,
+            interval_s=config.RETENTION_INTERVAL_S,
+            batch_size=config.RETENTION_BATCH_SIZE,
+            batch_pause_ms=config.RETENTION_BATCH_PAUSE_MS,
+            archive_dir=config.RETENTION_ARCHIVE_DIR,
+            vacuum_pages=config.RETENTION_VACUUM_PAGES,
+        )
+        await retention.start()
+
     yield
     logger.info("Service shutting down")
+    if retention is not None:
+        await retention.stop()
+        retention = None
+    if warmup is not None:
+        await warmup
+    dedupe = None
+    if writer is not None:
+        await writer.stop()
+        writer = None
+    read_cache = None
+    async_db.close()
+    async_db = None
+    db.close()
+    flush_logging()
 
 app = FastAPI(title="Webhook API", lifespan=lifespan)
 
@@ -83,14 +354,51 @@ app = FastAPI(title="Webhook API", lifespan=lifespan)
 
 
 
+# Declared before logging_middleware so it runs inside it: shed requests
+# are still logged and counted.
+@app.middleware("http")
+async def admission_middleware(request: Request, call_next):
+    lane = admission.lane_for(request.url.path) if admission is not None else None
+    if lane is None:
+        return await call_next(request)
+
+    try:
+        wait_ms = await admission.acquire(lane)
+    except Rejected as exc:
+        request.state.result = f"shed_{exc.reason}"
+        return JSONResponse(
+            {"detail": str(exc)},
+            status_code=exc.status_code,
+            headers={"Retry-After": str(exc.retry_after_s)},
+        )
+    profiling.record("admission_wait", wait_ms)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        lane.release()
+        raise
+    # Streamed exports hold their slot until the last chunk has been sent.
+    return SlotReleasingResponse(response, lane)
+
+
 @app.middleware("http")
 async def logging_middleware(request: Request, call_next):
     request_id = str(uuid.uuid4())
-    start_time = time.time()
+    timing_token = profiling.start_request() if phase_timing else None
+    profiler = slow_profiler.start() if slow_profiler is not None else None
+    start_time = time.perf_counter()
 
-    response = await call_next(request)
+    try:
+        response = await call_next(request)
+    finally:
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        if profiler is not None:
+            slow_profiler.finish(profiler, latency_ms, request.method, request.url.path, request_id)
+        if timing_token is not None:
+            timings = profiling.finish_request(timing_token, request.url.path)
 
-    latency_ms = (time.time() - start_time) * 1000
+    if timing_token is not None and config.SERVER_TIMING_HEADER:
+        response.headers["Server-Timing"] = profiling.server_timing(timings, latency_ms)
 
 
 
@@ -115,8 +423,9 @@ async def logging_middleware(request: Request, call_next):
 
     logger.info("Request processed", extra=log_extra)
 
-    metrics.inc_http_request(request.url.path, response.status_code)
-    metrics.observe_latency(latency_ms)
+    requests_total, latency = metrics.http_handles(request.url.path, request.method, response.status_code)
+    requests_total.inc()
+    latency.observe(latency_ms)
 
     return response
 
@@ -135,30 +444,73 @@ async def root():
 
 
 
-@app.post("/webhook")
+@app.post(
+    "/webhook",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": WebhookMessage.model_json_schema(by_alias=True)}},
+        }
+    },
+)
 async def webhook(
     request: Request,
-    payload: WebhookMessage = Body(...),
-    x_signature: str = Header(..., alias="X-Signature")
+    x_signature: Optional[str] = Header(None, alias="X-Signature")
 ):
-    body = await request.body()
-    signature = x_signature
-
-    if not verify_signature(body, signature):
+    # Read the raw bytes once and check the HMAC before spending any time
+    # on JSON parsing or validation; forged traffic stops here.
+    with phase("body_read"):
+        body = await request.body()
+
+    with phase("signature"):
+        signature_ok = bool(x_signature) and verify_signature(body, x_signature)
+    if not signature_ok:
         request.state.result = "invalid_signature"
         metrics.inc_webhook_request("invalid_signature")
         logger.error("Invalid signature", extra={"result": "invalid_signature"})
         raise HTTPException(status_code=401, detail="invalid signature")
 
+    try:
+        with phase("validation"):
+            payload = parse_webhook_body(body)
+    except RequestValidationError:
+        request.state.result = "validation_error"
+        metrics.inc_webhook_request("validation_error")
+        raise
+
     request.state.message_id = payload.message_id
 
-    inserted = db.insert_message(
-        payload.message_id,
-        payload.from_,
-        payload.to,
-        payload.ts,
-        payload.text
-    )
+    with phase("dedupe"):
+        verdict = dedupe.lookup(payload.message_id) if dedupe is not None else None
+        if verdict == "maybe":
+            # Answered on a read thread, so likely retries skip the writer.
+            duplicate = await async_db.has_message(payload.message_id, payload.from_)
+            if duplicate:
+                dedupe.record(payload.message_id, False)
+        else:
+            duplicate = verdict == "hit"
+    if duplicate:
+        inserted = False
+    else:
+        with phase("insert"):
+            if writer is not None:
+                inserted = await writer.submit(
+                    payload.message_id,
+                    payload.from_,
+                    payload.to,
+                    payload.ts,
+                    payload.text
+                )
+            else:
+                inserted = await async_db.insert_message(
+                    payload.message_id,
+                    payload.from_,
+                    payload.to,
+                    payload.ts,
+                    payload.text
+                )
+        if dedupe is not None:
+            dedupe.record(payload.message_id, inserted)
 
     if inserted:
         request.state.dup = False
@@ -172,23 +524,146 @@ async def webhook(
     return {"status": "ok"}
 
 
+@app.post("/webhook/batch", response_model=BatchWebhookResponse)
+async def webhook_batch(
+    request: Request,
+    x_signature: Optional[str] = Header(None, alias="X-Signature")
+):
+    body = await request.body()
+
+    if not x_signature or not verify_signature(body, x_signature):
+        request.state.result = "invalid_signature"
+        metrics.inc_webhook_request("invalid_signature")
+        logger.error("Invalid signature", extra={"result": "invalid_signature"})
+        raise HTTPException(status_code=401, detail="invalid signature")
+
+    try:
+        items = parse_batch_body(body)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="body must be a JSON array or NDJSON")
+
+    if len(items) > config.WEBHOOK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"batch exceeds {config.WEBHOOK_BATCH_MAX_ITEMS} items"
+        )
+
+    results: list[Optional[BatchItemResult]] = [None] * len(items)
+    valid: list[tuple[int, WebhookMessage]] = []
+    checked = validate_many([item for item in items if item is not None])
+    outcomes = iter(checked)
+    for index, item in enumerate(items):
+        if item is None:
+            results[index] = BatchItemResult(index=index, result="invalid", reason="invalid JSON")
+            metrics.inc_webhook_request("validation_error")
+            continue
+        payload, error = next(outcomes)
+        if error is None:
+            valid.append((index, payload))
+            continue
+        message_id = item.get("message_id") if isinstance(item, dict) else None
+        results[index] = BatchItemResult(
+            index=index,
+            message_id=message_id if isinstance(message_id, str) else None,
+            result="invalid",
+            reason=format_validation_errors(error),
+        )
+        metrics.inc_webhook_request("validation_error")
+
+    inserted = await async_db.insert_messages([
+        (payload.message_id, payload.from_, payload.to, payload.ts, payload.text)
+        for _, payload in valid
+    ])
+
+    for (index, payload), created in zip(valid, inserted):
+        if dedupe is not None:
+            dedupe.record(payload.message_id, created)
+        result = "created" if created else "duplicate"
+        results[index] = BatchItemResult(index=index, message_id=payload.message_id, result=result)
+        metrics.inc_webhook_request(result)
+
+    counts = {"created": 0, "duplicate": 0, "invalid": 0}
+    for item_result in results:
+        counts[item_result.result] += 1
+
+    request.state.result = "batch"
+    return BatchWebhookResponse(status="ok", results=results, **counts)
+
+
 @app.get("/messages", response_model=MessagesListResponse)
 async def get_messages(
+    request: Request,
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     from_: Optional[str] = Query(None, alias="from"),
     since: Optional[str] = None,
+    until: Optional[str] = None,
     q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    total: Literal["exact", "estimate", "none"] = "exact",
 ):
-    return db.get_messages(limit, offset, from_, since, q)
+    # The body is rendered by SQLite; response_model only documents it.
+    args = (limit, offset, from_, since, q, cursor, total, until)
+    try:
+        return await cached_json(
+            request, "messages", ("messages", *args),
+            lambda: async_db.read_versioned("get_messages_json", *args),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
 
 
 
+@app.get("/messages/export")
+async def export_messages(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    from_: Optional[str] = Query(None, alias="from"),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    q: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    try:
+        chunks = await async_db.export_messages(
+            format, from_, since, q, after, config.EXPORT_BATCH_SIZE, until
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="messages.{format}"'}
+    headers["Vary"] = "Accept-Encoding"
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return BlockingStreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
 @app.get("/stats", response_model=StatsResponse)
-async def get_stats():
-    return db.get_stats()
+async def get_stats(request: Request):
+    return await cached_json(request, "stats", ("stats",), lambda: async_db.read_versioned("get_stats_json"))
+
+
+@app.get("/stats/timeseries", response_model=TimeseriesResponse)
+async def get_stats_timeseries(
+    request: Request,
+    bucket: Literal["minute", "hour", "day"] = "hour",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+):
+    # Served from the rollup tables, never from the messages themselves.
+    args = (bucket, since, until, from_)
+    try:
+        return await cached_json(
+            request, "timeseries", ("timeseries", *args),
+            lambda: async_db.read_versioned("get_timeseries_json", *args),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
 
@@ -204,7 +679,7 @@ async def health_live():
 async def health_ready():
     if not config.validate():
         raise HTTPException(status_code=503, detail="WEBHOOK_SECRET not configured")
-    if not db.is_healthy():
+    if not await async_db.is_healthy():
         raise HTTPException(status_code=503, detail="Database not healthy")
     return {"status": "ready"}
 
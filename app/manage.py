@@ -0,0 +1,72 @@
+"""Maintenance commands, e.g. ``python -m app.manage rebuild-stats``."""
+import argparse
+import asyncio
+from typing import Optional
+
+from app.async_storage import AsyncDatabase
+from app.config import config
+from app.retention import RetentionWorker
+from app.storage import MessageStore, open_database
+
+
+def rebuild_stats(db: MessageStore):
+    db.rebuild_aggregates()
+    stats = db.get_stats()
+    print(f"Rebuilt aggregates: {stats['total_messages']} messages from {stats['senders_count']} senders")
+
+
+def purge_expired(db: MessageStore):
+    if config.RETENTION_DAYS <= 0:
+        print("RETENTION_DAYS is not set; nothing to purge")
+        return
+    async_db = AsyncDatabase(db, read_threads=1, write_threads=1)
+    worker = RetentionWorker(
+        async_db,
+        retention_days=config.RETENTION_DAYS,
+        batch_size=config.RETENTION_BATCH_SIZE,
+        batch_pause_ms=config.RETENTION_BATCH_PAUSE_MS,
+        archive_dir=config.RETENTION_ARCHIVE_DIR,
+        vacuum_pages=config.RETENTION_VACUUM_PAGES,
+    )
+    try:
+        purged = asyncio.run(worker.run_once())
+    finally:
+        async_db.close()
+    print(f"Purged {purged} messages older than {config.RETENTION_DAYS:g} days")
+
+
+def enable_incremental_vacuum(db: MessageStore):
+    if not hasattr(db, "enable_incremental_vacuum"):
+        print("Only SQLite databases use auto_vacuum; nothing to do")
+    elif db.enable_incremental_vacuum():
+        print("Database rewritten with auto_vacuum=INCREMENTAL")
+    else:
+        print("Database already uses auto_vacuum=INCREMENTAL")
+
+
+COMMANDS = {
+    "rebuild-stats": (rebuild_stats, "Recompute /stats aggregates and timeseries rollups from the messages table"),
+    "purge-expired": (purge_expired, "Run one retention pass now (RETENTION_* settings)"),
+    "enable-incremental-vacuum": (
+        enable_incremental_vacuum,
+        "VACUUM an existing database into auto_vacuum=INCREMENTAL (exclusive lock while it runs)",
+    ),
+}
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text)
+    args = parser.parse_args(argv)
+
+    db = open_database(config.DATABASE_URL)
+    try:
+        COMMANDS[args.command][0](db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
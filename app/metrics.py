@@ -1,55 +1,472 @@
 from collections import defaultdict
-from typing import Dict, List
+from typing import Dict, List, Optional
+import bisect
+import glob
+import itertools
+import json
+import mmap
+import os
+import struct
 import threading
+import time
+import weakref
+
+from app.config import config
+
+
+DOUBLE = struct.Struct('<d')
+
+
+class InProcessValues:
+    """Metric samples for a single process, keyed by (name, labels).
+
+    Counters are sharded per thread: each thread increments its own dict
+    without locking and ``read_all`` merges the shards at scrape time.
+    Gauges are rare writes and live in one locked dict. Slots are just
+    the keys.
+    """
 
-class MetricsCollector:
     def __init__(self):
-        self.http_requests = defaultdict(int)
-        self.webhook_requests = defaultdict(int)
-        self.latency_buckets = defaultdict(int)
-        self.latency_count = 0
+        self._local = threading.local()
+        self._shards = []
+        self._gauges = {}
+        self._lock = threading.Lock()
+        # Every write stores a fresh number (next() on a count is atomic), so
+        # racing writers can never leave the version equal to a cached one.
+        self._writes = itertools.count(1)
+        self.version = 0
+
+    def _shard(self) -> defaultdict:
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = defaultdict(float)
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, key: tuple, amount: float):
+        self._shard()[key] += amount
+        self.version = next(self._writes)
+
+    def set(self, key: tuple, value: float):
+        with self._lock:
+            self._gauges[key] = value
+        self.version = next(self._writes)
+
+    def slot(self, key: tuple) -> tuple:
+        return key
+
+    inc_slot = inc
+    set_slot = set
+
+    def read_all(self) -> list:
+        merged = defaultdict(float)
+        with self._lock:
+            shards = list(self._shards)
+            gauges = dict(self._gauges)
+        for shard in shards:
+            for key, value in shard.copy().items():
+                merged[key] += value
+        merged.update(gauges)
+        return [(os.getpid(), True, dict(merged))]
+
+
+class MmapedValues:
+    """Append-only key -> float64 map in a file only this process writes.
+
+    Layout: an 8-byte header holding the number of used bytes, then entries
+    of (uint32 key length, utf-8 key padded to 8-byte alignment, float64).
+    Values are written before the header is advanced, so readers in other
+    processes only ever see complete entries and need no lock.
+    """
+
+    HEADER_SIZE = 8
+
+    def __init__(self, path: str, initial_size: int = 64 * 1024):
+        self.path = path
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < initial_size:
+            self._file.truncate(initial_size)
+            size = initial_size
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._positions = {}
+
+        used = struct.unpack_from('<I', self._map, 0)[0]
+        if used == 0:
+            used = self.HEADER_SIZE
+            struct.pack_into('<I', self._map, 0, used)
+        self._used = used
+        for key, _, value_pos in iter_entries(self._map, used):
+            self._positions[key] = value_pos
+
+    def _add_key(self, key: str) -> int:
+        encoded = key.encode()
+        padding = (8 - (4 + len(encoded)) % 8) % 8
+        entry = struct.pack(f'<I{len(encoded) + padding}sd', len(encoded), encoded + b' ' * padding, 0.0)
+
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+
+        self._map[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into('<I', self._map, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._used - 8
+
+    def _position(self, key: str) -> int:
+        pos = self._positions.get(key)
+        return pos if pos is not None else self._add_key(key)
+
+    def position(self, key: tuple) -> int:
+        """Offset of ``key``'s value; stable for the life of the file."""
+        return self._position(json.dumps(key))
+
+    def inc_at(self, pos: int, amount: float):
+        DOUBLE.pack_into(self._map, pos, DOUBLE.unpack_from(self._map, pos)[0] + amount)
+
+    def set_at(self, pos: int, value: float):
+        DOUBLE.pack_into(self._map, pos, value)
+
+    def inc(self, key: tuple, amount: float):
+        self.inc_at(self.position(key), amount)
+
+    def set(self, key: tuple, value: float):
+        self.set_at(self.position(key), value)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def iter_entries(data, used: int):
+    pos = MmapedValues.HEADER_SIZE
+    while pos < used:
+        key_length = struct.unpack_from('<I', data, pos)[0]
+        key = bytes(data[pos + 4:pos + 4 + key_length]).decode()
+        padding = (8 - (4 + key_length) % 8) % 8
+        value_pos = pos + 4 + key_length + padding
+        value = struct.unpack_from('<d', data, value_pos)[0]
+        yield key, value, value_pos
+        pos = value_pos + 8
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MmapSlot:
+    """A series' value offset in one MmapedValues file."""
+
+    __slots__ = ('key', 'values', 'pos')
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.values: Optional[MmapedValues] = None
+        self.pos = 0
+
+
+class MultiprocessValues:
+    """Per-worker mmap files under ``directory``, aggregated at scrape time.
+
+    Each worker writes ``metrics_<pid>.db`` without cross-process locks.
+    Files of workers that have exited are kept, so counters and histograms
+    stay monotonic across restarts; their gauges are ignored. Clear the
+    directory when the whole deployment restarts.
+
+    Handles hold an MmapSlot, so a write is a locked update at an offset
+    looked up once per file; a child process reopens its own file after
+    fork and the slots re-resolve on their next write.
+    """
+
+    # Other workers write without telling us, so rendered text is never
+    # reused based on a local write counter.
+    version = None
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._pid = None
+        self._values: Optional[MmapedValues] = None
+        self._lock = threading.Lock()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: (store := ref()) is not None and store._forked())
+
+    def _forked(self):
+        # The parent's lock may have been held by another thread at fork time.
+        self._lock = threading.Lock()
+        self._values = None
+        self._pid = None
+
+    def _own(self) -> MmapedValues:
+        # Reopen after fork so a child never writes into its parent's file.
+        pid = os.getpid()
+        if pid != self._pid:
+            self._values = MmapedValues(os.path.join(self.directory, f'metrics_{pid}.db'))
+            self._pid = pid
+        return self._values
+
+    def _resolve(self, slot: MmapSlot) -> MmapedValues:
+        values = self._own()
+        slot.pos = values.position(slot.key)
+        slot.values = values
+        return values
+
+    def slot(self, key: tuple) -> MmapSlot:
+        return MmapSlot(key)
+
+    def inc_slot(self, slot: MmapSlot, amount: float):
+        with self._lock:
+            values = self._values
+            if values is None or slot.values is not values:
+                values = self._resolve(slot)
+            values.inc_at(slot.pos, amount)
+
+    def set_slot(self, slot: MmapSlot, value: float):
+        with self._lock:
+            values = self._values
+            if values is None or slot.values is not values:
+                values = self._resolve(slot)
+            values.set_at(slot.pos, value)
+
+    def inc(self, key: tuple, amount: float):
+        with self._lock:
+            self._own().inc(key, amount)
+
+    def set(self, key: tuple, value: float):
+        with self._lock:
+            self._own().set(key, value)
+
+    def read_all(self) -> list:
+        with self._lock:
+            self._own()
+        results = []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'metrics_*.db'))):
+            try:
+                pid = int(os.path.basename(path)[len('metrics_'):-len('.db')])
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except (ValueError, OSError):
+                continue
+            if len(data) < MmapedValues.HEADER_SIZE:
+                continue
+            used = min(struct.unpack_from('<I', data, 0)[0], len(data))
+            values = {tuple(json.loads(key)): value for key, value, _ in iter_entries(data, used)}
+            results.append((pid, pid == os.getpid() or pid_alive(pid), values))
+        return results
+
+
+class Counter:
+    """Pre-resolved counter series; ``inc`` is a single store update."""
+
+    __slots__ = ('store', 'key', 'slot')
+
+    def __init__(self, store, key: tuple):
+        self.store = store
+        self.key = key
+        self.slot = store.slot(key)
+
+    def inc(self, amount: float = 1):
+        self.store.inc_slot(self.slot, amount)
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.store.set_slot(self.slot, value)
+
+
+class Histogram:
+    """Pre-resolved histogram series.
+
+    Buckets are stored non-cumulatively (one increment per observation)
+    and accumulated when rendered.
+    """
+
+    __slots__ = ('store', 'bounds', 'bucket_slots', 'sum_slot', 'count_slot')
+
+    def __init__(self, store, name: str, labels: str, bounds: tuple):
+        prefix = f'{labels},' if labels else ''
+        self.store = store
+        self.bounds = bounds
+        self.bucket_slots = [store.slot((f'{name}_bucket', f'{prefix}le="{format_value(bound)}"'))
+                             for bound in bounds]
+        self.sum_slot = store.slot((f'{name}_sum', labels))
+        self.count_slot = store.slot((f'{name}_count', labels))
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        if index < len(self.bounds):
+            self.store.inc_slot(self.bucket_slots[index], 1)
+        self.store.inc_slot(self.sum_slot, value)
+        self.store.inc_slot(self.count_slot, 1)
+
+
+class MetricsCollector:
+    def __init__(self, multiprocess_dir: Optional[str] = None,
+                 latency_buckets: tuple = (100, 500), render_cache_ms: float = 0):
+        self.store = MultiprocessValues(multiprocess_dir) if multiprocess_dir else InProcessValues()
+        self.buckets = {}
+        self.descriptions = {}
+        self.handles = {}
+        self.http_series = {}
         self.lock = threading.Lock()
 
-    def inc_http_request(self, path: str, status: int):
+        self.render_cache_ms = render_cache_ms
+        self._rendered = None
+        self._rendered_version = None
+        self._rendered_at = 0.0
+
+        self.describe('http_requests_total', 'counter', 'Total HTTP requests')
+        self.describe('webhook_requests_total', 'counter', 'Total webhook requests')
+        self.describe_histogram('request_latency_ms', 'Request latency in milliseconds by path and method',
+                                latency_buckets)
+
+    def describe(self, name: str, metric_type: str, help_text: str, aggregate: str = 'sum'):
+        """Register a metric. ``aggregate`` ('sum' or 'max') merges gauges across live workers."""
         with self.lock:
-            key = f'path="{path}",status="{status}"'
-            self.http_requests[key] += 1
+            self.descriptions[name] = (metric_type, help_text, aggregate)
 
-    def inc_webhook_request(self, result: str):
+    def describe_histogram(self, name: str, help_text: str, buckets: tuple):
         with self.lock:
-            key = f'result="{result}"'
-            self.webhook_requests[key] += 1
+            self.descriptions[name] = ('histogram', help_text, 'sum')
+            self.buckets[name] = tuple(sorted(buckets))
+
+    def _handle(self, cls, name: str, labels: str):
+        handle = self.handles.get((cls, name, labels))
+        if handle is None:
+            with self.lock:
+                if cls is Histogram:
+                    handle = Histogram(self.store, name, labels, self.buckets[name])
+                else:
+                    handle = cls(self.store, (name, labels))
+                self.handles[(cls, name, labels)] = handle
+        return handle
+
+    def counter(self, name: str, labels: str = "") -> Counter:
+        return self._handle(Counter, name, labels)
+
+    def gauge(self, name: str, labels: str = "") -> Gauge:
+        return self._handle(Gauge, name, labels)
+
+    def histogram(self, name: str, labels: str = "") -> Histogram:
+        return self._handle(Histogram, name, labels)
+
+    def inc_counter(self, name: str, amount: float = 1, labels: str = ""):
+        self.counter(name, labels).inc(amount)
 
-    def observe_latency(self, latency_ms: float):
+    def set_gauge(self, name: str, value: float, labels: str = ""):
+        self.gauge(name, labels).set(value)
+
+    def observe(self, name: str, value: float, labels: str = ""):
+        self.histogram(name, labels).observe(value)
+
+    def http_handles(self, path: str, method: str, status: int) -> tuple:
+        """(requests counter, latency histogram) for one path/method/status, resolved once."""
+        key = (path, method, status)
+        handles = self.http_series.get(key)
+        if handles is None:
+            handles = self.http_series[key] = (
+                self.counter('http_requests_total', f'path="{path}",status="{status}"'),
+                self.histogram('request_latency_ms', f'path="{path}",method="{method}"'),
+            )
+        return handles
+
+    def inc_http_request(self, path: str, status: int):
+        self.inc_counter('http_requests_total', labels=f'path="{path}",status="{status}"')
+
+    def inc_webhook_request(self, result: str):
+        self.inc_counter('webhook_requests_total', labels=f'result="{result}"')
+
+    def observe_latency(self, latency_ms: float, path: str, method: str):
+        self.observe('request_latency_ms', latency_ms, labels=f'path="{path}",method="{method}"')
+
+    def _aggregate(self) -> Dict[tuple, float]:
         with self.lock:
-            self.latency_count += 1
-            if latency_ms <= 100:
-                self.latency_buckets['100'] += 1
-            if latency_ms <= 500:
-                self.latency_buckets['500'] += 1
-            self.latency_buckets['+Inf'] += 1
+            descriptions = dict(self.descriptions)
+        processes = self.store.read_all()
+
+        merged = {}
+        for _, alive, values in processes:
+            for key, value in values.items():
+                metric_type, _, aggregate = descriptions.get(key[0], ('counter', '', 'sum'))
+                if metric_type == 'gauge':
+                    if not alive:
+                        continue
+                    if aggregate == 'max' and key in merged:
+                        merged[key] = max(merged[key], value)
+                        continue
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
 
     def generate_metrics(self) -> str:
+        """Render the exposition text.
+
+        The previous text is reused while nothing has been written since
+        (in-process store), or for up to ``render_cache_ms`` regardless.
+        """
+        version = self.store.version
+        now = time.monotonic()
+        if self._rendered is not None:
+            if version is not None and version == self._rendered_version:
+                return self._rendered
+            if (now - self._rendered_at) * 1000 < self.render_cache_ms:
+                return self._rendered
+
+        values = self._aggregate()
         with self.lock:
-            lines = []
+            descriptions = list(self.descriptions.items())
 
-            lines.append('# HELP http_requests_total Total HTTP requests')
-            lines.append('# TYPE http_requests_total counter')
-            for labels, count in self.http_requests.items():
-                lines.append(f'http_requests_total{{{labels}}} {count}')
+        lines = []
+        for name, (metric_type, help_text, _) in descriptions:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'histogram':
+                lines.extend(self._histogram_lines(name, values))
+                continue
+            for (metric, labels), value in values.items():
+                if metric != name:
+                    continue
+                series = f'{name}{{{labels}}}' if labels else name
+                lines.append(f'{series} {format_value(value)}')
 
-            lines.append('# HELP webhook_requests_total Total webhook requests')
-            lines.append('# TYPE webhook_requests_total counter')
-            for labels, count in self.webhook_requests.items():
-                lines.append(f'webhook_requests_total{{{labels}}} {count}')
+        text = '\n'.join(lines) + '\n'
+        self._rendered, self._rendered_version, self._rendered_at = text, version, now
+        return text
 
-            lines.append('# HELP request_latency_ms_bucket Request latency in milliseconds')
-            lines.append('# TYPE request_latency_ms_bucket histogram')
-            for bucket, count in sorted(self.latency_buckets.items(),
-                                       key=lambda x: float(x[0]) if x[0] != '+Inf' else float('inf')):
-                lines.append(f'request_latency_ms_bucket{{le="{bucket}"}} {count}')
-            lines.append(f'request_latency_ms_count {self.latency_count}')
+    def _histogram_lines(self, name: str, values: Dict[tuple, float]) -> List[str]:
+        lines = []
+        for (metric, labels), count in values.items():
+            if metric != f'{name}_count':
+                continue
+            prefix = f'{labels},' if labels else ''
+            suffix = f'{{{labels}}}' if labels else ''
+            cumulative = 0
+            for bound in self.buckets[name]:
+                le = f'{prefix}le="{format_value(bound)}"'
+                cumulative += values.get((f'{name}_bucket', le), 0)
+                lines.append(f'{name}_bucket{{{le}}} {format_value(cumulative)}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {format_value(count)}')
+            lines.append(f'{name}_sum{suffix} {format_value(values.get((f"{name}_sum", labels), 0))}')
+            lines.append(f'{name}_count{suffix} {format_value(count)}')
+        return lines
 
-            return '\n'.join(lines) + '\n'
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
 
-metrics = MetricsCollector()
+metrics = MetricsCollector(
+    config.METRICS_MULTIPROC_DIR,
+    latency_buckets=config.METRICS_LATENCY_BUCKETS_MS,
+    render_cache_ms=config.METRICS_RENDER_CACHE_MS,
+)
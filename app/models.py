@@ -1,31 +1,93 @@
-import re
-from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from app.validators import (
+    PHONE_PATTERN,
+    TEXT_MAX_LENGTH,
+    is_valid_ist_timestamp,
+    validate_ist_timestamp,
+    validate_phone,
+)
 
 class WebhookMessage(BaseModel):
     message_id: str = Field(..., min_length=1)
     from_: str = Field(..., alias="from")
     to: str
     ts: str
-    text: Optional[str] = Field(None, max_length=4096)
+    text: Optional[str] = Field(None, max_length=TEXT_MAX_LENGTH)
 
-    @validator('from_', 'to')
+    @field_validator('from_', 'to')
+    @classmethod
     def validate_indian_phone(cls, v):
-        if not re.match(r'^\+91[6-9]\d{9}$', v):
-            raise ValueError('Must be valid Indian number: +91 followed by 10 digits')
-        return v
+        return validate_phone(v)
 
 
-    @validator('ts')
+    @field_validator('ts')
+    @classmethod
     def validate_ist_timestamp(cls, v):
-        if not v.endswith('+05:30'):
-            raise ValueError('Timestamp must be in IST (+05:30)')
+        return validate_ist_timestamp(v)
+
+
+_ALL_FIELDS = frozenset(('message_id', 'from_', 'to', 'ts', 'text'))
+_REQUIRED_FIELDS = frozenset(('message_id', 'from_', 'to', 'ts'))
+
+
+def _build(message_id: str, from_: str, to: str, ts: str, text: Optional[str],
+           fields_set: frozenset) -> WebhookMessage:
+    # What model_construct does, minus its per-field default handling.
+    message = WebhookMessage.__new__(WebhookMessage)
+    object.__setattr__(message, '__dict__', {
+        'message_id': message_id, 'from_': from_, 'to': to, 'ts': ts, 'text': text,
+    })
+    object.__setattr__(message, '__pydantic_fields_set__', set(fields_set))
+    object.__setattr__(message, '__pydantic_extra__', None)
+    object.__setattr__(message, '__pydantic_private__', None)
+    return message
+
+
+def validate_payload(data) -> WebhookMessage:
+    """Validate one decoded webhook payload.
+
+    Plain dicts holding exactly-typed, valid values are checked in Python
+    and assembled directly. Everything else, including anything pydantic
+    would coerce, goes through ``WebhookMessage.model_validate`` so
+    rejections raise the usual ValidationError.
+    """
+    if type(data) is dict:
         try:
-            datetime.fromisoformat(v)
-        except ValueError:
-            raise ValueError('Invalid ISO-8601 IST timestamp')
-        return v
+            message_id = data['message_id']
+            from_ = data['from']
+            to = data['to']
+            ts = data['ts']
+        except KeyError:
+            return WebhookMessage.model_validate(data)
+        text = data.get('text')
+        if (
+            type(message_id) is str and message_id
+            and type(from_) is str and PHONE_PATTERN.match(from_) is not None
+            and type(to) is str and PHONE_PATTERN.match(to) is not None
+            and type(ts) is str and is_valid_ist_timestamp(ts)
+            and (text is None or (type(text) is str and len(text) <= TEXT_MAX_LENGTH))
+        ):
+            fields_set = _ALL_FIELDS if 'text' in data else _REQUIRED_FIELDS
+            return _build(message_id, from_, to, ts, text, fields_set)
+    return WebhookMessage.model_validate(data)
+
+
+def validate_many(items: list) -> list[tuple[Optional[WebhookMessage], Optional[ValidationError]]]:
+    """Validate decoded payloads in one pass.
+
+    Returns a ``(message, None)`` or ``(None, error)`` pair per item, in order.
+    """
+    results = []
+    append = results.append
+    validate = validate_payload
+    for data in items:
+        try:
+            append((validate(data), None))
+        except ValidationError as exc:
+            append((None, exc))
+    return results
 
 
 class MessageResponse(BaseModel):
@@ -40,9 +102,11 @@ class MessageResponse(BaseModel):
 
 class MessagesListResponse(BaseModel):
     data: list[MessageResponse]
-    total: int
+    total: Optional[int]
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
+    has_more: bool = False
 
 class SenderCount(BaseModel):
     from_: str = Field(..., alias="from")
@@ -57,3 +121,25 @@ class StatsResponse(BaseModel):
     messages_per_sender: list[SenderCount]
     first_message_ts: Optional[str]
     last_message_ts: Optional[str]
+
+class TimeseriesPoint(BaseModel):
+    start: str
+    count: int
+
+class TimeseriesResponse(BaseModel):
+    bucket: str
+    total: int
+    data: list[TimeseriesPoint]
+
+class BatchItemResult(BaseModel):
+    index: int
+    message_id: Optional[str] = None
+    result: str
+    reason: Optional[str] = None
+
+class BatchWebhookResponse(BaseModel):
+    status: str
+    created: int
+    duplicate: int
+    invalid: int
+    results: list[BatchItemResult]
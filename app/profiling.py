@@ -0,0 +1,133 @@
+"""Per-request phase timing and sampled cProfile capture.
+
+Code marks the phases of a request with ``with phase("name"):``. While a
+request is being timed the durations are collected in a context variable,
+which AsyncDatabase copies into its storage threads, so phases recorded
+in app/storage.py land on the request that caused them. Outside a timed
+request ``phase`` returns a shared no-op context manager, so disabled
+instrumentation costs one ContextVar lookup per phase.
+"""
+import contextvars
+import cProfile
+import heapq
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+from app.metrics import metrics
+
+metrics.describe_histogram(
+    'request_phase_ms',
+    'Time spent in each request phase in milliseconds',
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000),
+)
+metrics.describe('profiles_captured_total', 'counter', 'cProfile captures kept among the slowest requests')
+
+_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_phases", default=None)
+_NO_PHASE = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: list, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings.append((self.name, (time.perf_counter() - self.started) * 1000))
+
+
+def phase(name: str):
+    """Context manager timing ``name`` within the current request, if it is being timed."""
+    timings = _timings.get()
+    if timings is None:
+        return _NO_PHASE
+    return _Phase(timings, name)
+
+
+def record(name: str, duration_ms: float):
+    """Record an already measured phase on the current request, if it is being timed."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, duration_ms))
+
+
+def start_request() -> contextvars.Token:
+    return _timings.set([])
+
+
+def finish_request(token: contextvars.Token, path: str) -> list:
+    """Stop timing, export the phases to ``request_phase_ms`` and return them."""
+    timings = _timings.get()
+    _timings.reset(token)
+    for name, duration_ms in timings:
+        metrics.observe('request_phase_ms', duration_ms, labels=f'path="{path}",phase="{name}"')
+    return timings
+
+
+def server_timing(timings: list, total_ms: float) -> str:
+    """Server-Timing header value for the collected phases."""
+    parts = [f"{name};dur={duration_ms:.3f}" for name, duration_ms in timings]
+    parts.append(f"total;dur={total_ms:.3f}")
+    return ", ".join(parts)
+
+
+class SlowRequestProfiler:
+    """Runs a sample of requests under cProfile and keeps the slowest ``keep``.
+
+    cProfile hooks the event-loop thread, so at most one request is
+    profiled at a time and its profile also contains whatever other
+    requests ran on the loop meanwhile; work done in storage threads is
+    not included (phase timings cover it). Kept profiles are written to
+    ``directory`` as ``.prof`` files readable with ``pstats``; a faster
+    request pushes out the file of the fastest one kept so far.
+    """
+
+    def __init__(self, directory: str, keep: int, sample_rate: float):
+        self.directory = directory
+        self.keep = keep
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self._seen = 0
+        self._active = False
+        self._kept: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self.sample_every or self._active:
+            return None
+        self._seen += 1
+        if self._seen % self.sample_every:
+            return None
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler: cProfile.Profile, latency_ms: float, method: str, path: str,
+               request_id: str):
+        profiler.disable()
+        self._active = False
+        with self._lock:
+            if len(self._kept) >= self.keep and latency_ms <= self._kept[0][0]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+            filename = os.path.join(
+                self.directory, f"{latency_ms:010.3f}ms-{method}-{slug}-{request_id}.prof"
+            )
+            profiler.dump_stats(filename)
+            heapq.heappush(self._kept, (latency_ms, filename))
+            if len(self._kept) > self.keep:
+                _, evicted = heapq.heappop(self._kept)
+                try:
+                    os.unlink(evicted)
+                except FileNotFoundError:
+                    pass
+        metrics.inc_counter('profiles_captured_total')
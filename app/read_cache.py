@@ -0,0 +1,80 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+from app.metrics import metrics
+
+metrics.describe('read_cache_lookups_total', 'counter', 'Read cache lookups by endpoint and outcome')
+metrics.describe('read_cache_not_modified_total', 'counter', 'Read requests answered with 304 Not Modified')
+metrics.describe('read_cache_evictions_total', 'counter', 'Read cache entries evicted to stay within READ_CACHE_SIZE')
+metrics.describe('read_cache_entries', 'gauge', 'Responses held in the read cache')
+
+
+class CachedResponse(NamedTuple):
+    generation: Hashable
+    created: float
+    body: bytes
+    etag: str
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response bytes."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ReadCache:
+    """LRU of rendered read responses, invalidated by the storage write generation.
+
+    Entries are tagged with the generation read before the body was
+    produced, and ``get`` drops them once the caller's current generation
+    differs, so anything committed meanwhile invalidates them. Callers
+    read the generation (the backend's ``cache_generation``, which also
+    sees commits from other processes) off the event loop and pass it in.
+    ``max_age_ms`` additionally expires entries by age (0 = no limit).
+    A ``max_entries`` of 0 disables storage but still hands out ETags.
+    """
+
+    def __init__(self, max_entries: int = 256, max_age_ms: float = 0):
+        self.max_entries = max(0, max_entries)
+        self.max_age = max(0.0, max_age_ms) / 1000
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, endpoint: str, key: tuple, generation: Hashable) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is not None and (
+            entry.generation != generation
+            or (self.max_age and time.monotonic() - entry.created > self.max_age)
+        ):
+            del self.entries[key]
+            metrics.set_gauge('read_cache_entries', len(self.entries))
+            entry = None
+
+        if entry is None:
+            metrics.inc_counter('read_cache_lookups_total', labels=f'endpoint="{endpoint}",result="miss"')
+            return None
+        self.entries.move_to_end(key)
+        metrics.inc_counter('read_cache_lookups_total', labels=f'endpoint="{endpoint}",result="hit"')
+        return entry
+
+    def put(self, key: tuple, generation: Hashable, body: bytes) -> CachedResponse:
+        entry = CachedResponse(generation, time.monotonic(), body, make_etag(body))
+        if self.max_entries == 0:
+            return entry
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            metrics.inc_counter('read_cache_evictions_total')
+        metrics.set_gauge('read_cache_entries', len(self.entries))
+        return entry
@@ -0,0 +1,139 @@
+import asyncio
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger("webhook_api")
+
+metrics.describe('retention_rows_purged_total', 'counter', 'Messages deleted by the retention policy')
+metrics.describe('retention_rows_archived_total', 'counter', 'Expired messages written to archive segments')
+metrics.describe('retention_pages_vacuumed_total', 'counter', 'Free pages returned to the filesystem by incremental vacuum')
+metrics.describe('retention_last_run_timestamp_seconds', 'gauge', 'Unix time the last retention pass finished', aggregate='max')
+metrics.describe_histogram(
+    'retention_run_ms',
+    'Duration of retention passes in milliseconds',
+    (10, 50, 100, 500, 1000, 5000, 10000, 30000, 60000),
+)
+
+
+class ArchiveSegment:
+    """One gzip NDJSON archive file, created on the first write.
+
+    Every write is flushed and fsynced before returning, so rows are on
+    disk before the transaction that deletes them commits.
+    """
+
+    def __init__(self, directory: str):
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        self.path = os.path.join(directory, f"messages-{stamp}-{os.getpid()}.ndjson.gz")
+        self._raw = None
+        self._gzip: Optional[gzip.GzipFile] = None
+
+    def write(self, lines: list[str]):
+        if self._gzip is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._raw = open(self.path, "ab")
+            self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self._gzip.write(("\n".join(lines) + "\n").encode())
+        self._gzip.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        metrics.inc_counter('retention_rows_archived_total', len(lines))
+
+    def close(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+            self._gzip = self._raw = None
+
+
+class RetentionWorker:
+    """Background task that enforces RETENTION_DAYS.
+
+    Every ``interval_s`` it deletes messages whose ``ts`` is older than the
+    retention window, ``batch_size`` rows per write transaction with a short
+    pause in between, optionally archiving them to a gzip NDJSON segment
+    under ``archive_dir`` first. Freed pages are then handed back with
+    incremental vacuum, ``vacuum_pages`` at a time.
+    """
+
+    def __init__(self, db, retention_days: float, interval_s: float = 300,
+                 batch_size: int = 500, batch_pause_ms: float = 50,
+                 archive_dir: Optional[str] = None, vacuum_pages: int = 1000):
+        self.db = db
+        self.retention_ms = int(retention_days * 86_400_000)
+        self.interval = max(0.0, interval_s)
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = max(0.0, batch_pause_ms) / 1000
+        self.archive_dir = archive_dir
+        self.vacuum_pages = max(1, vacuum_pages)
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the batch in flight finish, then stop the task."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _pause(self, seconds: float) -> bool:
+        """Sleep unless stopping; returns False once stop() was called."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return not self._stopping.is_set()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Retention pass failed")
+            if not await self._pause(self.interval):
+                break
+
+    async def run_once(self) -> int:
+        """Run one retention pass and return how many messages it deleted."""
+        started = time.perf_counter()
+        cutoff_ms = int(time.time() * 1000) - self.retention_ms
+        segment = ArchiveSegment(self.archive_dir) if self.archive_dir else None
+        purged = 0
+        try:
+            while True:
+                deleted = await self.db.purge_expired(
+                    cutoff_ms, self.batch_size, segment.write if segment else None
+                )
+                purged += deleted
+                metrics.inc_counter('retention_rows_purged_total', deleted)
+                if deleted < self.batch_size or not await self._pause(self.batch_pause):
+                    break
+        finally:
+            if segment is not None:
+                segment.close()
+
+        if purged:
+            while True:
+                freed = await self.db.incremental_vacuum(self.vacuum_pages)
+                metrics.inc_counter('retention_pages_vacuumed_total', freed)
+                if freed < self.vacuum_pages or not await self._pause(self.batch_pause):
+                    break
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe('retention_run_ms', elapsed_ms)
+        metrics.set_gauge('retention_last_run_timestamp_seconds', time.time())
+        if purged:
+            logger.info("Retention purged %d messages in %.0f ms", purged, elapsed_ms)
+        return purged
@@ -0,0 +1,351 @@
+"""SQLite storage spread over several database files (``DB_SHARDS`` > 1).
+
+Every message lives in exactly one shard, chosen by a stable hash of its
+message_id (the default) or of its sender (``DB_SHARD_KEY=from``). Each
+shard is an ordinary Database with its own writer thread, so inserts into
+different shards commit in parallel instead of queueing on one SQLite
+write lock.
+
+Reads scatter to the shards that can hold matches and merge the results
+by ``(ts_epoch_ms, message_id)``, which is the order every shard already
+returns, so a page is a k-way merge of per-shard pages.
+"""
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Iterator, Optional
+
+from app.profiling import phase
+from app.storage import (
+    Database,
+    encode_cursor,
+    encode_export,
+    render_messages_page,
+    render_timeseries,
+    rollup_offset_ms,
+)
+
+SHARD_KEYS = ("from", "message_id")
+
+
+def shard_paths(db_path: str, shards: int) -> list[str]:
+    """``app.db`` -> ``app.shard0.db``, ``app.shard1.db``, ..."""
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.shard{index}{ext}" for index in range(shards)]
+
+
+def _row_key(row) -> tuple[int, str]:
+    # Page and export rows end with ts_epoch_ms, message_id.
+    return row[-2], row[-1]
+
+
+class ShardedDatabase:
+    """Database-compatible store over ``shards`` (see the module docstring).
+
+    Each shard records its position, the shard count and the key in its
+    schema_meta on first use; opening it with a different layout raises
+    RuntimeError, since messages would no longer be found where the hash
+    points.
+
+    With the default ``shard_key="message_id"`` every id has exactly one
+    home shard, so its primary key keeps message_id globally unique, as in
+    a single Database; ``from`` filters and the /stats sender ranking then
+    need every shard. ``shard_key="from"`` lets a ``from`` filter read one
+    shard, but a shard cannot see another's ids, so the same message_id
+    from two senders is stored twice: only use it when ids are unique per
+    sender by construction.
+    """
+
+    def __init__(self, shards: list[Database], shard_key: str = "message_id", read_threads: int = 4):
+        if shard_key not in SHARD_KEYS:
+            raise ValueError(f"DB_SHARD_KEY must be one of {', '.join(SHARD_KEYS)}")
+        self.shards = shards
+        self.shard_key = shard_key
+        for index, shard in enumerate(shards):
+            self._claim(shard, f"{index}/{len(shards)}/{shard_key}")
+
+        self.read_threads = max(1, read_threads)
+        self._start_pools()
+
+    def _start_pools(self):
+        # One writer per shard keeps each file's writes in one thread (no
+        # busy waiting on the SQLite lock); reads fan out on a shared pool.
+        # Executors only start threads once work is submitted.
+        self.write_pools = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-shard{index}-write")
+            for index in range(len(self.shards))
+        ]
+        self.read_pool = ThreadPoolExecutor(
+            max_workers=len(self.shards) * self.read_threads, thread_name_prefix="db-shard-read"
+        )
+
+    @classmethod
+    def open(cls, db_path: str, shards: int, shard_key: str = "message_id",
+             read_threads: int = 4) -> "ShardedDatabase":
+        return cls([Database(path) for path in shard_paths(db_path, shards)], shard_key, read_threads)
+
+    @staticmethod
+    def _claim(shard: Database, layout: str):
+        with shard.get_connection() as conn:
+            row = conn.execute("SELECT value FROM schema_meta WHERE key = 'shard_layout'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO schema_meta (key, value) VALUES ('shard_layout', ?)", (layout,))
+                conn.commit()
+            elif row['value'] != layout:
+                raise RuntimeError(
+                    f"{shard.db_path} was created as shard {row['value']} (index/count/key), not {layout}"
+                )
+
+    @property
+    def write_generation(self) -> int:
+        return sum(shard.write_generation for shard in self.shards)
+
+    def cache_generation(self) -> tuple:
+        return tuple(shard.cache_generation() for shard in self.shards)
+
+    def shard_for(self, message_id: str, from_msisdn: str) -> int:
+        key = from_msisdn if self.shard_key == "from" else message_id
+        return zlib.crc32(key.encode()) % len(self.shards)
+
+    def _fan_out(self, pool_for: Callable[[int], ThreadPoolExecutor], calls: dict[int, tuple]) -> dict:
+        """Run ``{shard_index: (fn, *args)}`` concurrently; returns ``{shard_index: result}``.
+
+        Calls carry the caller's context, so phase timings land on the
+        request. The first exception is re-raised once all calls finished.
+        """
+        futures = {
+            index: pool_for(index).submit(contextvars.copy_context().run, *call)
+            for index, call in calls.items()
+        }
+        wait(futures.values())
+        return {index: future.result() for index, future in futures.items()}
+
+    def _read_all(self, method: str, *args) -> list:
+        results = self._fan_out(
+            lambda index: self.read_pool,
+            {index: (getattr(shard, method), *args) for index, shard in enumerate(self.shards)},
+        )
+        return [results[index] for index in range(len(self.shards))]
+
+    def _sender_shard(self, from_filter: Optional[str]) -> Optional[Database]:
+        """The only shard that can hold ``from_filter``'s messages, if there is one."""
+        if from_filter and self.shard_key == "from":
+            return self.shards[self.shard_for("", from_filter)]
+        return None
+
+    def insert_message(self, message_id: str, from_msisdn: str, to_msisdn: str,
+                       ts: str, text: Optional[str]) -> bool:
+        index = self.shard_for(message_id, from_msisdn)
+        return self.write_pools[index].submit(
+            contextvars.copy_context().run, self.shards[index].insert_message,
+            message_id, from_msisdn, to_msisdn, ts, text
+        ).result()
+
+    def insert_messages(self, messages: list[tuple]) -> list[bool]:
+        """Split the batch by shard and commit the parts in parallel, one transaction each.
+
+        A failing shard raises after the others have committed, so callers
+        may see part of a batch stored, as with separate inserts.
+        """
+        if not messages:
+            return []
+        positions: dict[int, list[int]] = {}
+        for position, message in enumerate(messages):
+            positions.setdefault(self.shard_for(message[0], message[1]), []).append(position)
+
+        results = self._fan_out(
+            lambda index: self.write_pools[index],
+            {
+                index: (self.shards[index].insert_messages, [messages[p] for p in shard_positions])
+                for index, shard_positions in positions.items()
+            },
+        )
+        inserted = [False] * len(messages)
+        for index, shard_positions in positions.items():
+            for position, created in zip(shard_positions, results[index]):
+                inserted[position] = created
+        return inserted
+
+    def has_message(self, message_id: str, from_msisdn: str = "") -> bool:
+        # The shard an insert of this message would go to, and conflict in.
+        return self.shards[self.shard_for(message_id, from_msisdn)].has_message(message_id)
+
+    def iter_message_ids(self, batch_size: int = 10000) -> Iterator[str]:
+        for shard in self.shards:
+            yield from shard.iter_message_ids(batch_size)
+
+    def get_page_rows(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                      since: Optional[str] = None, q: Optional[str] = None,
+                      cursor: Optional[str] = None, total_mode: str = "exact",
+                      until: Optional[str] = None):
+        """Database.get_page_rows across shards.
+
+        Each shard returns its first ``offset + limit + 1`` matches after the
+        cursor, which is enough for the merge to find the page; deep offsets
+        therefore cost every shard, so cursors scale better here.
+        """
+        shard = self._sender_shard(from_filter)
+        if shard is not None:
+            return shard.get_page_rows(limit, offset, from_filter, since, q, cursor, total_mode, until)
+
+        pages = self._read_all(
+            "get_page_rows", offset + limit + 1, 0, from_filter, since, q, cursor, total_mode, until
+        )
+        rows = list(itertools.islice(
+            heapq.merge(*[page[0] for page in pages], key=_row_key), offset, offset + limit + 1
+        ))
+        total = None if total_mode == "none" else sum(page[1] for page in pages)
+
+        next_cursor = None
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(*_row_key(rows[-1]))
+        return rows, total, next_cursor, has_more
+
+    def get_messages(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                     since: Optional[str] = None, q: Optional[str] = None,
+                     cursor: Optional[str] = None, total_mode: str = "exact",
+                     until: Optional[str] = None):
+        rows, total, next_cursor, has_more = self.get_page_rows(
+            limit, offset, from_filter, since, q, cursor, total_mode, until
+        )
+        return {
+            'data': [json.loads(row[0]) for row in rows],
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+
+    def get_messages_json(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                          since: Optional[str] = None, q: Optional[str] = None,
+                          cursor: Optional[str] = None, total_mode: str = "exact",
+                          until: Optional[str] = None) -> bytes:
+        with phase("db_query"):
+            rows, total, next_cursor, has_more = self.get_page_rows(
+                limit, offset, from_filter, since, q, cursor, total_mode, until
+            )
+        return render_messages_page([row[0] for row in rows], total, limit, offset, next_cursor, has_more)
+
+    def message_key(self, message_id: str) -> Optional[tuple[int, str]]:
+        if self.shard_key == "message_id":
+            return self.shards[self.shard_for(message_id, "")].message_key(message_id)
+        return min(filter(None, self._read_all("message_key", message_id)), default=None)
+
+    def export_messages(self, fmt: str = "ndjson", from_filter: Optional[str] = None,
+                        since: Optional[str] = None, q: Optional[str] = None,
+                        after: Optional[str] = None, batch_size: int = 1000,
+                        until: Optional[str] = None) -> Iterator[bytes]:
+        """Merge one export query per shard; each shard streams from its own snapshot."""
+        after_key = None
+        if after is not None:
+            after_key = self.message_key(after)
+            if after_key is None:
+                raise ValueError("unknown after message_id")
+
+        shard = self._sender_shard(from_filter)
+        shards = [shard] if shard is not None else self.shards
+        streams = []
+        try:
+            for shard in shards:
+                streams.append(shard.export_rows(fmt, from_filter, since, q, after_key, until, batch_size))
+        except BaseException:
+            for stream in streams:
+                stream.close()
+            raise
+        return encode_export(self._merge_streams(streams), fmt, batch_size)
+
+    @staticmethod
+    def _merge_streams(streams: list) -> Iterator:
+        try:
+            yield from heapq.merge(*streams, key=_row_key)
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def purge_expired(self, cutoff_ms: int, batch_size: int = 500,
+                      archive: Optional[Callable[[list[str]], None]] = None) -> int:
+        """Delete up to ``batch_size`` expired messages, draining one shard after another.
+
+        Returns fewer than ``batch_size`` only once no shard has anything left
+        to purge, which is what RetentionWorker relies on.
+        """
+        deleted = 0
+        for shard in self.shards:
+            deleted += shard.purge_expired(cutoff_ms, batch_size - deleted, archive)
+            if deleted >= batch_size:
+                break
+        return deleted
+
+    def incremental_vacuum(self, pages: int) -> int:
+        return sum(shard.incremental_vacuum(pages) for shard in self.shards)
+
+    def enable_incremental_vacuum(self) -> bool:
+        return any([shard.enable_incremental_vacuum() for shard in self.shards])
+
+    def rebuild_aggregates(self):
+        for shard in self.shards:
+            shard.rebuild_aggregates()
+
+    def get_stats(self):
+        by_sender = self.shard_key == "from"
+        summaries = self._read_all("stats_summary", 10 if by_sender else None)
+
+        counts: Counter = Counter()
+        for summary in summaries:
+            counts.update(dict(summary['senders']))
+        top = heapq.nsmallest(10, counts.items(), key=lambda item: (-item[1], item[0]))
+        firsts = [summary['first'] for summary in summaries if summary['first']]
+        lasts = [summary['last'] for summary in summaries if summary['last']]
+
+        return {
+            'total_messages': sum(summary['total_messages'] for summary in summaries),
+            # Senders never span shards when sharding by sender.
+            'senders_count': sum(summary['senders_count'] for summary in summaries) if by_sender else len(counts),
+            'messages_per_sender': [{'from': sender, 'count': count} for sender, count in top],
+            'first_message_ts': min(firsts)[2] if firsts else None,
+            'last_message_ts': max(lasts)[2] if lasts else None,
+        }
+
+    def get_stats_json(self) -> bytes:
+        with phase("db_query"):
+            stats = self.get_stats()
+        return json.dumps(stats, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def get_timeseries(self, bucket: str = "hour", since: Optional[str] = None,
+                       until: Optional[str] = None,
+                       from_filter: Optional[str] = None) -> list[tuple[int, int]]:
+        """Per-shard rollups summed bucket by bucket."""
+        shard = self._sender_shard(from_filter)
+        if shard is not None:
+            return shard.get_timeseries(bucket, since, until, from_filter)
+        counts: Counter = Counter()
+        for points in self._read_all("get_timeseries", bucket, since, until, from_filter):
+            counts.update(dict(points))
+        return sorted(counts.items())
+
+    def get_timeseries_json(self, bucket: str = "hour", since: Optional[str] = None,
+                            until: Optional[str] = None, from_filter: Optional[str] = None) -> bytes:
+        with phase("db_query"):
+            points = self.get_timeseries(bucket, since, until, from_filter)
+        return render_timeseries(bucket, points, rollup_offset_ms())
+
+    def is_healthy(self) -> bool:
+        # Checked in the calling thread: the read pool may be busy with scans.
+        return all(shard.is_healthy() for shard in self.shards)
+
+    def close(self):
+        """Stop the pools and close every shard; like Database, usable again afterwards."""
+        pools = [*self.write_pools, self.read_pool]
+        self._start_pools()
+        for pool in pools:
+            pool.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
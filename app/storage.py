@@ -1,9 +1,262 @@
+import base64
+import csv
+import io
+import itertools
+import json
 import os
+import logging
 import sqlite3
-from datetime import datetime
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Hashable, Iterator, Optional, Protocol
 from contextlib import contextmanager
 
+from app.config import config
+from app.profiling import phase
+
+logger = logging.getLogger("webhook_api")
+
+
+def database_path(url: str) -> str:
+    """Absolute SQLite file path for a ``sqlite:///`` DATABASE_URL."""
+    return os.path.abspath(url.replace("sqlite:///", ""))
+
+
+IST = timezone(timedelta(hours=5, minutes=30))
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def ts_to_epoch_ms(ts: str) -> int:
+    """Milliseconds since the Unix epoch for an ISO-8601 timestamp.
+
+    Timestamps without an offset are taken to be IST. Raises ValueError for
+    anything fromisoformat cannot parse.
+    """
+    parsed = datetime.fromisoformat(ts)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=IST)
+    return (parsed - EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_cursor(ts_epoch_ms: int, message_id: str) -> str:
+    """Opaque keyset cursor pointing just after the (ts_epoch_ms, message_id) row."""
+    raw = json.dumps([ts_epoch_ms, message_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def parse_bound(name: str, value: str) -> int:
+    """Epoch milliseconds for the ``since``/``until`` filter ``name``."""
+    try:
+        return ts_to_epoch_ms(value)
+    except ValueError:
+        raise ValueError(f"invalid {name}")
+
+
+def decode_cursor(cursor: str) -> tuple[int, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, message_id = json.loads(raw)
+        # Cursors issued before ts_epoch_ms existed carry the ts string.
+        if isinstance(ts, str):
+            ts = ts_to_epoch_ms(ts)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if type(ts) is not int or not isinstance(message_id, str):
+        raise ValueError("invalid cursor")
+    return ts, message_id
+
+
+# json_object escapes strings exactly like json.dumps(ensure_ascii=False),
+# which is what FastAPI's JSONResponse uses.
+MESSAGE_JSON_COLUMNS = (
+    "json_object('message_id', message_id, 'from', from_msisdn, 'to', to_msisdn,"
+    " 'ts', ts, 'text', text), ts_epoch_ms, message_id"
+)
+
+FIRST_TS_QUERY = "SELECT ts FROM messages ORDER BY ts_epoch_ms ASC, message_id ASC LIMIT 1"
+LAST_TS_QUERY = "SELECT ts FROM messages ORDER BY ts_epoch_ms DESC, message_id DESC LIMIT 1"
+
+# Archived rows keep every stored column except the derived ts_epoch_ms.
+ARCHIVE_JSON_COLUMN = (
+    "json_object('message_id', message_id, 'from', from_msisdn, 'to', to_msisdn,"
+    " 'ts', ts, 'text', text, 'created_at', created_at)"
+)
+
+TOP_SENDERS_QUERY = """
+    SELECT {columns}
+    FROM sender_stats
+    ORDER BY count DESC, from_msisdn ASC
+    LIMIT 10
+"""
+
+
+ROLLUP_BUCKETS = {"minute": 60_000, "hour": 3_600_000, "day": 86_400_000}
+
+
+def rollup_offset_ms() -> int:
+    """Offset from UTC that hour and day buckets are aligned to (IST by default)."""
+    return int(config.ROLLUP_UTC_OFFSET_MINUTES) * 60_000
+
+
+def bucket_start(ts_epoch_ms: int, bucket_ms: int, offset_ms: int) -> int:
+    return (ts_epoch_ms + offset_ms) // bucket_ms * bucket_ms - offset_ms
+
+
+def timeseries_range(bucket: str, since: Optional[str],
+                     until: Optional[str]) -> tuple[int, Optional[int], Optional[int]]:
+    """``(bucket_ms, low, high)`` for a timeseries query.
+
+    Buckets starting in ``[low, high)`` are the ones that overlap
+    ``[since, until)``; a bucket only partly inside the range is counted
+    whole. Raises ValueError for an unknown bucket or a bad bound.
+    """
+    bucket_ms = ROLLUP_BUCKETS.get(bucket)
+    if bucket_ms is None:
+        raise ValueError(f"bucket must be one of {', '.join(ROLLUP_BUCKETS)}")
+    low = parse_bound("since", since) - bucket_ms + 1 if since else None
+    high = parse_bound("until", until) if until else None
+    return bucket_ms, low, high
+
+
+def utc_offset_suffix(offset_ms: int) -> str:
+    """``+05:30``-style suffix that isoformat gives timestamps at ``offset_ms``."""
+    return datetime.fromtimestamp(0, timezone(timedelta(milliseconds=offset_ms))).isoformat()[19:]
+
+
+def render_timeseries(bucket: str, points: list[tuple[int, int]], offset_ms: int) -> bytes:
+    """/stats/timeseries response body for ``(bucket_start_ms, count)`` points."""
+    tz = timezone(timedelta(milliseconds=offset_ms))
+    return json.dumps({
+        "bucket": bucket,
+        "total": sum(count for _, count in points),
+        "data": [
+            {"start": datetime.fromtimestamp(start / 1000, tz).isoformat(), "count": count}
+            for start, count in points
+        ],
+    }, separators=(",", ":")).encode()
+
+
+def render_messages_page(messages: list[str], total: Optional[int], limit: int, offset: int,
+                         next_cursor: Optional[str], has_more: bool) -> bytes:
+    """/messages response body around already encoded messages."""
+    return (
+        '{"data":[' + ",".join(messages)
+        + '],"total":' + json.dumps(total)
+        + ',"limit":' + str(limit)
+        + ',"offset":' + str(offset)
+        + ',"next_cursor":' + json.dumps(next_cursor)
+        + ',"has_more":' + ("true" if has_more else "false")
+        + "}"
+    ).encode()
+
+
+def encode_export(rows: Iterator, fmt: str, batch_size: int) -> Iterator[bytes]:
+    """Encode export rows ``batch_size`` at a time.
+
+    NDJSON rows start with the message JSON; CSV rows start with
+    message_id, from, to, ts and text. Trailing columns are ignored.
+    Closing the encoder closes ``rows``, releasing their connection.
+    """
+    try:
+        if fmt == "csv":
+            yield b"message_id,from,to,ts,text\r\n"
+        while True:
+            rows_batch = list(itertools.islice(rows, batch_size))
+            if not rows_batch:
+                break
+            if fmt == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(row[:5] for row in rows_batch)
+                yield buffer.getvalue().encode()
+            else:
+                yield ("\n".join([row[0] for row in rows_batch]) + "\n").encode()
+    finally:
+        close = getattr(rows, "close", None)
+        if close is not None:
+            close()
+
+
+class MessageStore(Protocol):
+    """What the app needs from a storage backend; see open_database.
+
+    Methods block and may be called from several threads at once
+    (AsyncDatabase runs them on its pools). ``write_generation`` changes
+    after every committed write that changes what reads return.
+    """
+
+    write_generation: int
+
+    def cache_generation(self) -> Hashable: ...
+
+    def insert_message(self, message_id: str, from_msisdn: str, to_msisdn: str,
+                       ts: str, text: Optional[str]) -> bool: ...
+
+    def insert_messages(self, messages: list[tuple]) -> list[bool]: ...
+
+    def has_message(self, message_id: str, from_msisdn: str = "") -> bool: ...
+
+    def iter_message_ids(self, batch_size: int = 10000) -> Iterator[str]: ...
+
+    def get_messages(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                     since: Optional[str] = None, q: Optional[str] = None,
+                     cursor: Optional[str] = None, total_mode: str = "exact",
+                     until: Optional[str] = None) -> dict: ...
+
+    def get_messages_json(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                          since: Optional[str] = None, q: Optional[str] = None,
+                          cursor: Optional[str] = None, total_mode: str = "exact",
+                          until: Optional[str] = None) -> bytes: ...
+
+    def export_messages(self, fmt: str = "ndjson", from_filter: Optional[str] = None,
+                        since: Optional[str] = None, q: Optional[str] = None,
+                        after: Optional[str] = None, batch_size: int = 1000,
+                        until: Optional[str] = None) -> Iterator[bytes]: ...
+
+    def purge_expired(self, cutoff_ms: int, batch_size: int = 500,
+                      archive: Optional[Callable[[list[str]], None]] = None) -> int: ...
+
+    def incremental_vacuum(self, pages: int) -> int: ...
+
+    def rebuild_aggregates(self): ...
+
+    def get_stats(self) -> dict: ...
+
+    def get_stats_json(self) -> bytes: ...
+
+    def get_timeseries(self, bucket: str = "hour", since: Optional[str] = None,
+                       until: Optional[str] = None,
+                       from_filter: Optional[str] = None) -> list[tuple[int, int]]: ...
+
+    def get_timeseries_json(self, bucket: str = "hour", since: Optional[str] = None,
+                            until: Optional[str] = None, from_filter: Optional[str] = None) -> bytes: ...
+
+    def is_healthy(self) -> bool: ...
+
+    def close(self): ...
+
+
+def open_database(url: str) -> MessageStore:
+    """Storage backend for a DATABASE_URL.
+
+    ``logstore:///dir`` opens the append-only LogStore in that directory
+    (as with SQLite URLs, a fourth slash makes the path absolute); anything
+    else is a ``sqlite:///`` URL for the SQLite Database, split into
+    DB_SHARDS files by app.sharding when that is more than one.
+    """
+    if url.startswith("logstore:///"):
+        from app.logstore import LogStore
+        return LogStore(os.path.abspath(url[len("logstore:///"):]))
+    if config.DB_SHARDS > 1:
+        from app.sharding import ShardedDatabase
+        return ShardedDatabase.open(
+            database_path(url), config.DB_SHARDS, config.DB_SHARD_KEY, config.DB_READ_THREADS
+        )
+    return Database(database_path(url))
+
+
 class Database:
     def __init__(self, db_path: str):
         self.db_path = db_path
@@ -11,19 +264,77 @@ class Database:
         # ✅ ensure parent directory exists
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
+        # Connections are long-lived and owned by the thread that opened them:
+        # one read-write connection for inserts and one read-only connection
+        # for scans, so /messages and /stats never wait on the writer (WAL).
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        self.fts_tokenizer: Optional[str] = None
+
+        # Bumped after every committed write that changes what reads return;
+        # next() on itertools.count is atomic across writer threads.
+        self._writes = itertools.count(1)
+        self.write_generation = 0
+
+        # (from, since, until, q) -> (count, computed_at) for total="estimate"
+        self._count_cache: OrderedDict = OrderedDict()
+        self._count_cache_lock = threading.Lock()
+
         self.init_db()
 
-    @contextmanager
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+    def _connect(self, readonly: bool, shared: bool = True) -> sqlite3.Connection:
+        """Open a configured connection.
+
+        Shared connections are tracked so close() can reach them; unshared
+        ones belong to the caller, which must close them itself.
+        """
+        if readonly:
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+
+        conn.execute(f"PRAGMA busy_timeout = {int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = {int(config.SQLITE_CACHE_SIZE)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+
+        if shared:
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def get_connection(self, readonly: bool = False):
+        attr = "reader" if readonly else "writer"
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            with phase("db_connect"):
+                conn = self._connect(readonly)
+            setattr(self._local, attr, conn)
         try:
             yield conn
-        finally:
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
             conn.close()
+        self._local = threading.local()
 
     def init_db(self):
         with self.get_connection() as conn:
+            # Only takes effect for a brand-new file; existing databases are
+            # converted with enable_incremental_vacuum().
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute(f"PRAGMA journal_mode = {config.SQLITE_JOURNAL_MODE}")
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS messages (
                     message_id TEXT PRIMARY KEY,
@@ -31,63 +342,551 @@ class Database:
                     to_msisdn TEXT NOT NULL,
                     ts TEXT NOT NULL,
                     text TEXT,
-                    created_at TEXT NOT NULL
+                    created_at TEXT NOT NULL,
+                    ts_epoch_ms INTEGER
                 )
             """)
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_from_msisdn ON messages(from_msisdn)
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_ts ON messages(ts)
+                CREATE TABLE IF NOT EXISTS schema_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
             """)
             conn.commit()
 
+            self._init_ts_epoch(conn)
+            self._init_fts(conn)
+            self._init_aggregates(conn)
+            self._init_rollups(conn)
+
+    def _get_meta(self, conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM schema_meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: Optional[str]):
+        conn.execute("""
+            INSERT INTO schema_meta (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (key, value))
+
+    @staticmethod
+    def _add_column(conn: sqlite3.Connection, table: str, column: str, declaration: str):
+        columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _init_ts_epoch(self, conn: sqlite3.Connection, batch_size: int = 10000):
+        """Integer ``ts_epoch_ms`` column behind ordering and the since/until filters.
+
+        Inserts fill it in; databases created before it existed are
+        backfilled once, in batches, and the ISO-string ts indexes it
+        replaces are dropped.
+        """
+        self._add_column(conn, "messages", "ts_epoch_ms", "INTEGER")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_ts_epoch_message_id ON messages(ts_epoch_ms, message_id)
+        """)
+        conn.commit()
+
+        if self._get_meta(conn, "ts_epoch_ms") is not None:
+            return
+
+        last_rowid = 0
+        while True:
+            rows = conn.execute("""
+                SELECT rowid, ts FROM messages
+                WHERE rowid > ? AND ts_epoch_ms IS NULL
+                ORDER BY rowid
+                LIMIT ?
+            """, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                try:
+                    updates.append((ts_to_epoch_ms(row['ts']), row['rowid']))
+                except ValueError:
+                    logger.warning("Cannot parse ts for rowid %s: %r", row['rowid'], row['ts'])
+            conn.executemany("UPDATE messages SET ts_epoch_ms = ? WHERE rowid = ?", updates)
+            conn.commit()
+            last_rowid = rows[-1]['rowid']
+
+        conn.execute("DROP INDEX IF EXISTS idx_ts")
+        conn.execute("DROP INDEX IF EXISTS idx_ts_message_id")
+        self._set_meta(conn, "ts_epoch_ms", "1")
+        conn.commit()
+
+    def _init_fts(self, conn: sqlite3.Connection):
+        """Keep the messages_fts index in sync with FTS_TOKENIZER.
+
+        messages_fts is an external-content FTS5 table over messages.text,
+        maintained by triggers. It is (re)built from the table whenever it is
+        created or the configured tokenizer changes.
+        """
+        tokenizer = config.FTS_TOKENIZER.strip().lower()
+        if tokenizer in ("", "none", "off"):
+            tokenizer = None
+
+        current = self._get_meta(conn, "fts_tokenizer")
+        if tokenizer == current:
+            self.fts_tokenizer = tokenizer
+            return
+
+        conn.execute("DROP TRIGGER IF EXISTS messages_fts_ai")
+        conn.execute("DROP TRIGGER IF EXISTS messages_fts_ad")
+        conn.execute("DROP TABLE IF EXISTS messages_fts")
+
+        if tokenizer is not None:
+            try:
+                conn.execute(f"""
+                    CREATE VIRTUAL TABLE messages_fts USING fts5(
+                        text,
+                        content='messages',
+                        content_rowid='rowid',
+                        tokenize='{tokenizer}'
+                    )
+                """)
+            except sqlite3.OperationalError as exc:
+                logger.error("FTS5 unavailable, falling back to LIKE search: %s", exc)
+                conn.rollback()
+                tokenizer = None
+            else:
+                conn.execute("""
+                    CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages
+                    WHEN NEW.text IS NOT NULL
+                    BEGIN
+                        INSERT INTO messages_fts (rowid, text) VALUES (NEW.rowid, NEW.text);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages
+                    WHEN OLD.text IS NOT NULL
+                    BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', OLD.rowid, OLD.text);
+                    END
+                """)
+                conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+        self._set_meta(conn, "fts_tokenizer", tokenizer)
+        conn.commit()
+        self.fts_tokenizer = tokenizer
+
+    def _init_aggregates(self, conn: sqlite3.Connection):
+        """Summary tables behind /stats, maintained by triggers on messages.
+
+        ``sender_stats`` holds one row per sender and ``message_totals`` a
+        single global row, both updated in the same transaction as every
+        insert or delete. First/last message are tracked by ts_epoch_ms.
+        Databases created before these tables (or the current triggers)
+        existed are backfilled once via ``rebuild_aggregates``.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sender_stats (
+                from_msisdn TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sender_stats_count ON sender_stats(count DESC, from_msisdn)
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS message_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_messages INTEGER NOT NULL,
+                senders_count INTEGER NOT NULL,
+                first_ts TEXT,
+                last_ts TEXT,
+                first_ts_epoch_ms INTEGER,
+                last_ts_epoch_ms INTEGER
+            )
+        """)
+        self._add_column(conn, "message_totals", "first_ts_epoch_ms", "INTEGER")
+        self._add_column(conn, "message_totals", "last_ts_epoch_ms", "INTEGER")
+        conn.execute("""
+            INSERT OR IGNORE INTO message_totals (id, total_messages, senders_count)
+            VALUES (1, 0, 0)
+        """)
+        conn.commit()
+
+        # Version 2 tracks first/last message by ts_epoch_ms instead of
+        # comparing ts strings; older triggers are replaced and rebuilt.
+        if self._get_meta(conn, "stats_aggregates") == "2":
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DROP TRIGGER IF EXISTS messages_stats_ai")
+        conn.execute("DROP TRIGGER IF EXISTS messages_stats_ad")
+        conn.execute("""
+            CREATE TRIGGER messages_stats_ai AFTER INSERT ON messages
+            BEGIN
+                UPDATE message_totals SET
+                    total_messages = total_messages + 1,
+                    senders_count = senders_count + NOT EXISTS (
+                        SELECT 1 FROM sender_stats WHERE from_msisdn = NEW.from_msisdn
+                    ),
+                    first_ts = CASE WHEN first_ts_epoch_ms IS NULL OR NEW.ts_epoch_ms < first_ts_epoch_ms
+                                    THEN NEW.ts ELSE first_ts END,
+                    first_ts_epoch_ms = CASE WHEN first_ts_epoch_ms IS NULL OR NEW.ts_epoch_ms < first_ts_epoch_ms
+                                             THEN NEW.ts_epoch_ms ELSE first_ts_epoch_ms END,
+                    last_ts = CASE WHEN last_ts_epoch_ms IS NULL OR NEW.ts_epoch_ms > last_ts_epoch_ms
+                                   THEN NEW.ts ELSE last_ts END,
+                    last_ts_epoch_ms = CASE WHEN last_ts_epoch_ms IS NULL OR NEW.ts_epoch_ms > last_ts_epoch_ms
+                                            THEN NEW.ts_epoch_ms ELSE last_ts_epoch_ms END
+                WHERE id = 1;
+                INSERT INTO sender_stats (from_msisdn, count) VALUES (NEW.from_msisdn, 1)
+                ON CONFLICT(from_msisdn) DO UPDATE SET count = count + 1;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER messages_stats_ad AFTER DELETE ON messages
+            BEGIN
+                UPDATE sender_stats SET count = count - 1 WHERE from_msisdn = OLD.from_msisdn;
+                DELETE FROM sender_stats WHERE from_msisdn = OLD.from_msisdn AND count <= 0;
+                UPDATE message_totals SET
+                    total_messages = total_messages - 1,
+                    senders_count = senders_count - NOT EXISTS (
+                        SELECT 1 FROM sender_stats WHERE from_msisdn = OLD.from_msisdn
+                    ),
+                    first_ts = CASE WHEN OLD.ts_epoch_ms = first_ts_epoch_ms
+                                    THEN ({FIRST_TS_QUERY}) ELSE first_ts END,
+                    first_ts_epoch_ms = CASE WHEN OLD.ts_epoch_ms = first_ts_epoch_ms
+                                             THEN (SELECT MIN(ts_epoch_ms) FROM messages) ELSE first_ts_epoch_ms END,
+                    last_ts = CASE WHEN OLD.ts_epoch_ms = last_ts_epoch_ms
+                                   THEN ({LAST_TS_QUERY}) ELSE last_ts END,
+                    last_ts_epoch_ms = CASE WHEN OLD.ts_epoch_ms = last_ts_epoch_ms
+                                            THEN (SELECT MAX(ts_epoch_ms) FROM messages) ELSE last_ts_epoch_ms END
+                WHERE id = 1;
+            END
+        """)
+        self._rebuild_aggregates(conn)
+        self._set_meta(conn, "stats_aggregates", "2")
+        conn.commit()
+
+    def _init_rollups(self, conn: sqlite3.Connection):
+        """Per-bucket message counts behind /stats/timeseries, maintained by triggers.
+
+        ``message_rollups`` holds one row per (sender, bucket size, bucket
+        start) that has messages, plus the same with an empty sender for
+        all senders together, so every insert or delete touches six rows;
+        rows are removed once their count drops to zero. Keying by sender
+        first keeps a sender's newest minute, hour and day rows on
+        neighbouring pages, which keeps the per-insert cost low.
+        Buckets are aligned to ROLLUP_UTC_OFFSET_MINUTES; when that changes
+        the triggers are recreated and the table rebuilt.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS message_rollups (
+                from_msisdn TEXT NOT NULL,
+                bucket_ms INTEGER NOT NULL,
+                bucket_start_ms INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (from_msisdn, bucket_ms, bucket_start_ms)
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+
+        offset_ms = rollup_offset_ms()
+        version = f"1:{offset_ms}"
+        if self._get_meta(conn, "rollups") == version:
+            return
+
+        def bucket(row: str, bucket_ms: int) -> str:
+            return f"(({row}.ts_epoch_ms + {offset_ms}) / {bucket_ms}) * {bucket_ms} - {offset_ms}"
+
+        inserts = "".join(
+            f"""
+                INSERT INTO message_rollups (from_msisdn, bucket_ms, bucket_start_ms, count)
+                VALUES ({sender}, {bucket_ms}, {bucket("NEW", bucket_ms)}, 1)
+                ON CONFLICT DO UPDATE SET count = count + 1;"""
+            for bucket_ms in ROLLUP_BUCKETS.values() for sender in ("NEW.from_msisdn", "''")
+        )
+        deletes = "".join(
+            f"""
+                UPDATE message_rollups SET count = count - 1
+                WHERE from_msisdn = {sender} AND bucket_ms = {bucket_ms}
+                  AND bucket_start_ms = {bucket("OLD", bucket_ms)};
+                DELETE FROM message_rollups
+                WHERE from_msisdn = {sender} AND bucket_ms = {bucket_ms}
+                  AND bucket_start_ms = {bucket("OLD", bucket_ms)} AND count <= 0;"""
+            for bucket_ms in ROLLUP_BUCKETS.values() for sender in ("OLD.from_msisdn", "''")
+        )
+
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DROP TRIGGER IF EXISTS messages_rollups_ai")
+        conn.execute("DROP TRIGGER IF EXISTS messages_rollups_ad")
+        conn.execute(f"""
+            CREATE TRIGGER messages_rollups_ai AFTER INSERT ON messages
+            WHEN NEW.ts_epoch_ms IS NOT NULL
+            BEGIN{inserts}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER messages_rollups_ad AFTER DELETE ON messages
+            WHEN OLD.ts_epoch_ms IS NOT NULL
+            BEGIN{deletes}
+            END
+        """)
+        self._rebuild_rollups(conn)
+        self._set_meta(conn, "rollups", version)
+        conn.commit()
+
+    @staticmethod
+    def _rebuild_rollups(conn: sqlite3.Connection):
+        offset_ms = rollup_offset_ms()
+        conn.execute("DELETE FROM message_rollups")
+        for bucket_ms in ROLLUP_BUCKETS.values():
+            bucket = f"((ts_epoch_ms + {offset_ms}) / {bucket_ms}) * {bucket_ms} - {offset_ms}"
+            for sender in ("from_msisdn", "''"):
+                conn.execute(f"""
+                    INSERT INTO message_rollups (from_msisdn, bucket_ms, bucket_start_ms, count)
+                    SELECT {sender}, {bucket_ms}, {bucket} AS bucket_start_ms, COUNT(*)
+                    FROM messages
+                    WHERE ts_epoch_ms IS NOT NULL
+                    GROUP BY {sender}, bucket_start_ms
+                """)
+
+    def _rebuild_aggregates(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM sender_stats")
+        conn.execute("""
+            INSERT INTO sender_stats (from_msisdn, count)
+            SELECT from_msisdn, COUNT(*) FROM messages GROUP BY from_msisdn
+        """)
+        conn.execute(f"""
+            UPDATE message_totals SET
+                total_messages = (SELECT COUNT(*) FROM messages),
+                senders_count = (SELECT COUNT(*) FROM sender_stats),
+                first_ts = ({FIRST_TS_QUERY}),
+                last_ts = ({LAST_TS_QUERY}),
+                first_ts_epoch_ms = (SELECT MIN(ts_epoch_ms) FROM messages),
+                last_ts_epoch_ms = (SELECT MAX(ts_epoch_ms) FROM messages)
+            WHERE id = 1
+        """)
+
+    def cache_generation(self) -> tuple[int, int]:
+        """Value that changes after any commit to the file, from this process or another.
+
+        ``write_generation`` only sees this process's writes. PRAGMA
+        data_version on the calling thread's read-only connection changes
+        whenever any other connection commits, including other workers and
+        app.manage. It only reads the WAL index, so it is cheap enough to
+        check on every read cache lookup.
+        """
+        with self.get_connection(readonly=True) as conn:
+            return self.write_generation, conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def rebuild_aggregates(self):
+        """Recompute sender_stats, message_totals and message_rollups from the messages table."""
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._rebuild_aggregates(conn)
+            self._rebuild_rollups(conn)
+            conn.commit()
+            self.write_generation = next(self._writes)
+
+    def _text_filter(self, q: str) -> tuple[str, list]:
+        """SQL predicate for the ``q`` search.
+
+        Goes through the FTS index when it can answer the query; otherwise
+        (FTS disabled, fewer than three characters for trigram, or LIKE
+        wildcards in ``q``) keeps the original ``text LIKE`` scan so results
+        stay identical. The trigram index folds case for all of Unicode
+        while LIKE only folds ASCII, so its matches are a superset: it
+        narrows the candidates and ``text LIKE`` still decides.
+        """
+        use_fts = self.fts_tokenizer is not None and not any(c in q for c in "%_")
+        if use_fts and self.fts_tokenizer.startswith("trigram"):
+            use_fts = len(q) >= 3
+        elif use_fts:
+            use_fts = any(c.isalnum() for c in q)
+
+        if not use_fts:
+            return "text LIKE ?", [f"%{q}%"]
+
+        phrase = '"' + q.replace('"', '""') + '"'
+        clause = "rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"
+        if self.fts_tokenizer.startswith("trigram"):
+            return f"{clause} AND text LIKE ?", [phrase, f"%{q}%"]
+        return clause, [phrase]
+
     def insert_message(self, message_id: str, from_msisdn: str, to_msisdn: str,
                        ts: str, text: Optional[str]) -> bool:
         try:
             with self.get_connection() as conn:
                 created_at = datetime.utcnow().isoformat() + 'Z'
-                conn.execute("""
-                    INSERT INTO messages (message_id, from_msisdn, to_msisdn, ts, text, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (message_id, from_msisdn, to_msisdn, ts, text, created_at))
-                conn.commit()
+                with phase("db_insert"):
+                    conn.execute("""
+                        INSERT INTO messages (message_id, from_msisdn, to_msisdn, ts, text, created_at, ts_epoch_ms)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (message_id, from_msisdn, to_msisdn, ts, text, created_at, ts_to_epoch_ms(ts)))
+                with phase("db_commit"):
+                    conn.commit()
+                self.write_generation = next(self._writes)
                 return True
         except sqlite3.IntegrityError:
             return False
 
-    def get_messages(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
-                     since: Optional[str] = None, q: Optional[str] = None):
+    def insert_messages(self, messages: list[tuple]) -> list[bool]:
+        """Insert (message_id, from, to, ts, text) rows in a single transaction.
+
+        Returns one flag per input row: True if it was created, False if the
+        message_id already existed (in the table or earlier in the batch).
+        """
+        if not messages:
+            return []
+
+        created_at = datetime.utcnow().isoformat() + 'Z'
         with self.get_connection() as conn:
-            where_clauses = []
-            params = []
+            conn.execute("BEGIN IMMEDIATE")
+            seen = self._existing_ids(conn, [m[0] for m in messages])
 
-            if from_filter:
-                where_clauses.append("from_msisdn = ?")
-                params.append(from_filter)
+            results = []
+            rows = []
+            for message_id, from_msisdn, to_msisdn, ts, text in messages:
+                if message_id in seen:
+                    results.append(False)
+                    continue
+                seen.add(message_id)
+                results.append(True)
+                rows.append((message_id, from_msisdn, to_msisdn, ts, text, created_at, ts_to_epoch_ms(ts)))
 
-            if since:
-                where_clauses.append("ts >= ?")
-                params.append(since)
+            with phase("db_insert"):
+                conn.executemany("""
+                    INSERT INTO messages (message_id, from_msisdn, to_msisdn, ts, text, created_at, ts_epoch_ms)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            with phase("db_commit"):
+                conn.commit()
+            if rows:
+                self.write_generation = next(self._writes)
+            return results
 
-            if q:
-                where_clauses.append("text LIKE ?")
-                params.append(f"%{q}%")
+    @staticmethod
+    def _existing_ids(conn: sqlite3.Connection, message_ids: list[str]) -> set:
+        existing = set()
+        unique_ids = list(dict.fromkeys(message_ids))
+        for start in range(0, len(unique_ids), 500):
+            chunk = unique_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT message_id FROM messages WHERE message_id IN ({placeholders})",
+                chunk
+            ).fetchall()
+            existing.update(row['message_id'] for row in rows)
+        return existing
 
-            where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    def has_message(self, message_id: str, from_msisdn: str = "") -> bool:
+        """Whether ``message_id`` is stored; a read, so it never waits for the writer."""
+        with self.get_connection(readonly=True) as conn:
+            return conn.execute(
+                "SELECT 1 FROM messages WHERE message_id = ?", (message_id,)
+            ).fetchone() is not None
 
-            count_query = f"SELECT COUNT(*) as total FROM messages WHERE {where_sql}"
-            total = conn.execute(count_query, params).fetchone()['total']
+    def iter_message_ids(self, batch_size: int = 10000):
+        """Yield every stored message_id, reading in batches."""
+        with self.get_connection(readonly=True) as conn:
+            cursor = conn.execute("SELECT message_id FROM messages")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row['message_id']
 
-            data_query = f"""
-                SELECT message_id, from_msisdn, to_msisdn, ts, text
-                FROM messages
-                WHERE {where_sql}
-                ORDER BY ts ASC, message_id ASC
-                LIMIT ? OFFSET ?
-            """
-            params.extend([limit, offset])
-            rows = conn.execute(data_query, params).fetchall()
+    def _filters(self, from_filter: Optional[str], since: Optional[str],
+                 q: Optional[str], until: Optional[str] = None) -> tuple[str, list]:
+        """WHERE clause and parameters for the from/since/until/q filters.
+
+        ``since`` (inclusive) and ``until`` (exclusive) are compared as
+        epoch milliseconds; raises ValueError if either is not ISO-8601.
+        """
+        where_clauses = []
+        params = []
+
+        if from_filter:
+            where_clauses.append("from_msisdn = ?")
+            params.append(from_filter)
+
+        if since:
+            where_clauses.append("ts_epoch_ms >= ?")
+            params.append(parse_bound("since", since))
+
+        if until:
+            where_clauses.append("ts_epoch_ms < ?")
+            params.append(parse_bound("until", until))
+
+        if q:
+            clause, clause_params = self._text_filter(q)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+
+        where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+        return where_sql, params
+
+    def _query_page(self, conn: sqlite3.Connection, columns: str, limit: int, offset: int,
+                    from_filter: Optional[str], since: Optional[str], q: Optional[str],
+                    cursor: Optional[str], total_mode: str, until: Optional[str]):
+        """Run the count and page queries shared by get_messages and get_messages_json.
+
+        Returns ``(rows, total, next_cursor, has_more)``; ``columns`` must
+        include ``ts_epoch_ms`` and ``message_id`` so the next cursor can be
+        built.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        where_sql, params = self._filters(from_filter, since, q, until)
+
+        if total_mode == "none":
+            total = None
+        elif total_mode == "estimate":
+            total = self._estimate_count(conn, where_sql, params, from_filter, since, q, until)
+        else:
+            total = self._count(conn, where_sql, params)
+
+        if after:
+            where_sql = f"{where_sql} AND (ts_epoch_ms, message_id) > (?, ?)"
+            params.extend(after)
+
+        data_query = f"""
+            SELECT {columns}
+            FROM messages
+            WHERE {where_sql}
+            ORDER BY ts_epoch_ms ASC, message_id ASC
+            LIMIT ? OFFSET ?
+        """
+        params.extend([limit + 1, offset])
+        rows = conn.execute(data_query, params).fetchall()
+
+        next_cursor = None
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['ts_epoch_ms'], rows[-1]['message_id'])
+
+        return rows, total, next_cursor, has_more
+
+    def get_messages(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                     since: Optional[str] = None, q: Optional[str] = None,
+                     cursor: Optional[str] = None, total_mode: str = "exact",
+                     until: Optional[str] = None):
+        """Return one page ordered by (ts_epoch_ms, message_id).
+
+        ``cursor`` (a ``next_cursor`` from a previous page) seeks straight to
+        the following row through idx_ts_epoch_message_id; ``offset`` still
+        applies on top of it for backward compatibility. Raises ValueError
+        for a malformed cursor or since/until value.
+
+        ``total_mode`` controls the ``total`` field: ``exact`` runs COUNT(*),
+        ``estimate`` answers from the summary tables or a cached count at most
+        TOTAL_ESTIMATE_TTL_S old, and ``none`` skips counting (``total`` is
+        None; ``has_more`` is always set).
+        """
+        with self.get_connection(readonly=True) as conn:
+            rows, total, next_cursor, has_more = self._query_page(
+                conn, "message_id, from_msisdn, to_msisdn, ts, text, ts_epoch_ms",
+                limit, offset, from_filter, since, q, cursor, total_mode, until
+            )
 
             messages = [{
                 'message_id': row['message_id'],
@@ -101,42 +900,331 @@ class Database:
                 'data': messages,
                 'total': total,
                 'limit': limit,
-                'offset': offset
+                'offset': offset,
+                'next_cursor': next_cursor,
+                'has_more': has_more
             }
 
-    def get_stats(self):
-        with self.get_connection() as conn:
-            total_query = "SELECT COUNT(*) as total FROM messages"
-            total_messages = conn.execute(total_query).fetchone()['total']
+    def get_page_rows(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                      since: Optional[str] = None, q: Optional[str] = None,
+                      cursor: Optional[str] = None, total_mode: str = "exact",
+                      until: Optional[str] = None):
+        """The get_messages page as ``(rows, total, next_cursor, has_more)``.
+
+        Each row is ``(message_json, ts_epoch_ms, message_id)``, with the
+        message rendered by SQLite's json_object.
+        """
+        with self.get_connection(readonly=True) as conn:
+            return self._query_page(
+                conn, MESSAGE_JSON_COLUMNS,
+                limit, offset, from_filter, since, q, cursor, total_mode, until
+            )
+
+    def get_messages_json(self, limit: int = 50, offset: int = 0, from_filter: Optional[str] = None,
+                          since: Optional[str] = None, q: Optional[str] = None,
+                          cursor: Optional[str] = None, total_mode: str = "exact",
+                          until: Optional[str] = None) -> bytes:
+        """Same page as get_messages, already encoded as the JSON response body.
+
+        SQLite renders every message with json_object (``from_msisdn`` goes
+        out as ``from``), so rows are never turned into dicts or models; the
+        bytes match what FastAPI produces from MessagesListResponse.
+        """
+        with phase("db_query"):
+            rows, total, next_cursor, has_more = self.get_page_rows(
+                limit, offset, from_filter, since, q, cursor, total_mode, until
+            )
+        return render_messages_page([row[0] for row in rows], total, limit, offset, next_cursor, has_more)
+
+    def export_messages(self, fmt: str = "ndjson", from_filter: Optional[str] = None,
+                        since: Optional[str] = None, q: Optional[str] = None,
+                        after: Optional[str] = None, batch_size: int = 1000,
+                        until: Optional[str] = None) -> Iterator[bytes]:
+        """Stream every matching message, ordered by (ts_epoch_ms, message_id), as encoded chunks.
+
+        ``after`` is the last message_id a previous export delivered; raises
+        ValueError if it is unknown (or since/until is invalid). Setup runs
+        eagerly so errors surface before the first chunk.
+        """
+        after_key = None
+        if after is not None:
+            after_key = self.message_key(after)
+            if after_key is None:
+                raise ValueError("unknown after message_id")
+        rows = self.export_rows(fmt, from_filter, since, q, after_key, until, batch_size)
+        return encode_export(rows, fmt, batch_size)
+
+    def message_key(self, message_id: str) -> Optional[tuple[int, str]]:
+        """``(ts_epoch_ms, message_id)`` of a stored message, or None."""
+        with self.get_connection(readonly=True) as conn:
+            row = conn.execute(
+                "SELECT ts_epoch_ms FROM messages WHERE message_id = ?", (message_id,)
+            ).fetchone()
+        return (row['ts_epoch_ms'], message_id) if row else None
+
+    def export_rows(self, fmt: str, from_filter: Optional[str], since: Optional[str],
+                    q: Optional[str], after_key: Optional[tuple[int, str]],
+                    until: Optional[str], batch_size: int = 1000) -> Iterator[sqlite3.Row]:
+        """Rows for encode_export, ordered by (ts_epoch_ms, message_id) after ``after_key``.
+
+        Every row ends with ``ts_epoch_ms, message_id``. The query runs on a
+        dedicated read-only connection that is closed when the returned
+        iterator is exhausted or closed, so one export sees a single
+        snapshot and never holds more than ``batch_size`` rows. The query
+        starts eagerly, so filter errors are raised here.
+        """
+        where_sql, params = self._filters(from_filter, since, q, until)
+        if after_key is not None:
+            where_sql = f"{where_sql} AND (ts_epoch_ms, message_id) > (?, ?)"
+            params.extend(after_key)
+
+        if fmt == "csv":
+            columns = "message_id, from_msisdn, to_msisdn, ts, text, ts_epoch_ms, message_id"
+        else:
+            columns = MESSAGE_JSON_COLUMNS
+        conn = self._connect(readonly=True, shared=False)
+        try:
+            cursor = conn.execute(f"""
+                SELECT {columns}
+                FROM messages
+                WHERE {where_sql}
+                ORDER BY ts_epoch_ms ASC, message_id ASC
+            """, params)
+        except BaseException:
+            conn.close()
+            raise
+        return self._fetch_rows(conn, cursor, batch_size)
+
+    @staticmethod
+    def _fetch_rows(conn: sqlite3.Connection, cursor: sqlite3.Cursor,
+                    batch_size: int) -> Iterator[sqlite3.Row]:
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, where_sql: str, params: list) -> int:
+        count_query = f"SELECT COUNT(*) as total FROM messages WHERE {where_sql}"
+        return conn.execute(count_query, params).fetchone()['total']
+
+    def _estimate_count(self, conn: sqlite3.Connection, where_sql: str, params: list,
+                        from_filter: Optional[str], since: Optional[str], q: Optional[str],
+                        until: Optional[str] = None) -> int:
+        if not since and not until and not q:
+            if from_filter:
+                row = conn.execute(
+                    "SELECT count FROM sender_stats WHERE from_msisdn = ?", (from_filter,)
+                ).fetchone()
+                return row['count'] if row else 0
+            return conn.execute("SELECT total_messages FROM message_totals WHERE id = 1").fetchone()[0]
+
+        key = (from_filter, since, until, q)
+        now = time.monotonic()
+        with self._count_cache_lock:
+            cached = self._count_cache.get(key)
+            if cached is not None and now - cached[1] <= config.TOTAL_ESTIMATE_TTL_S:
+                self._count_cache.move_to_end(key)
+                return cached[0]
+
+        total = self._count(conn, where_sql, params)
+        with self._count_cache_lock:
+            self._count_cache[key] = (total, now)
+            self._count_cache.move_to_end(key)
+            while len(self._count_cache) > config.TOTAL_ESTIMATE_CACHE_SIZE:
+                self._count_cache.popitem(last=False)
+        return total
 
-            senders_query = "SELECT COUNT(DISTINCT from_msisdn) as count FROM messages"
-            senders_count = conn.execute(senders_query).fetchone()['count']
+    def purge_expired(self, cutoff_ms: int, batch_size: int = 500,
+                      archive: Optional[Callable[[list[str]], None]] = None) -> int:
+        """Delete up to ``batch_size`` messages with ts_epoch_ms < ``cutoff_ms``, oldest first.
 
-            per_sender_query = """
-                SELECT from_msisdn, COUNT(*) as count
+        Each call is one short write transaction so webhook inserts are
+        never locked out for long. ``archive``, if given, receives the NDJSON
+        lines of the rows about to go and must have persisted them when it
+        returns; if it raises, nothing is deleted. Triggers keep the FTS
+        index and stats aggregates in step. Returns the number of rows
+        deleted.
+        """
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(f"""
+                SELECT rowid, {ARCHIVE_JSON_COLUMN}
                 FROM messages
-                GROUP BY from_msisdn
-                ORDER BY count DESC
-                LIMIT 10
+                WHERE ts_epoch_ms < ?
+                ORDER BY ts_epoch_ms ASC, message_id ASC
+                LIMIT ?
+            """, (cutoff_ms, batch_size)).fetchall()
+            if not rows:
+                conn.rollback()
+                return 0
+            if archive is not None:
+                archive([row[1] for row in rows])
+            conn.executemany("DELETE FROM messages WHERE rowid = ?", [(row[0],) for row in rows])
+            conn.commit()
+            self.write_generation = next(self._writes)
+            return len(rows)
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Return up to ``pages`` free pages to the filesystem; returns how many were freed.
+
+        A no-op (returning 0) unless the database uses auto_vacuum=INCREMENTAL.
+        """
+        with self.get_connection() as conn:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # execute() would step the pragma only once (one page);
+            # executescript runs it to completion.
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+
+    def enable_incremental_vacuum(self) -> bool:
+        """Switch an existing database to auto_vacuum=INCREMENTAL.
+
+        Needs a full VACUUM, which rewrites the file under an exclusive
+        lock, so it is a maintenance command rather than a startup step.
+        VACUUM may renumber rowids, so the FTS index is rebuilt afterwards.
+        Returns False if the database already used incremental vacuum.
+        """
+        with self.get_connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            if self.fts_tokenizer is not None:
+                conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+                conn.commit()
+            return True
+
+    def get_stats(self):
+        with self.get_connection(readonly=True) as conn:
+            totals_query = """
+                SELECT total_messages, senders_count, first_ts, last_ts
+                FROM message_totals
+                WHERE id = 1
             """
-            per_sender = conn.execute(per_sender_query).fetchall()
+            totals = conn.execute(totals_query).fetchone()
+
+            per_sender = conn.execute(TOP_SENDERS_QUERY.format(columns="from_msisdn, count")).fetchall()
             messages_per_sender = [{'from': row['from_msisdn'], 'count': row['count']}
                                    for row in per_sender]
 
-            ts_query = "SELECT MIN(ts) as first_ts, MAX(ts) as last_ts FROM messages"
-            ts_result = conn.execute(ts_query).fetchone()
-
             return {
-                'total_messages': total_messages,
-                'senders_count': senders_count,
+                'total_messages': totals['total_messages'],
+                'senders_count': totals['senders_count'],
                 'messages_per_sender': messages_per_sender,
-                'first_message_ts': ts_result['first_ts'],
-                'last_message_ts': ts_result['last_ts']
+                'first_message_ts': totals['first_ts'],
+                'last_message_ts': totals['last_ts']
             }
 
+    def stats_summary(self, top_senders: Optional[int] = 10) -> dict:
+        """Aggregates for combining /stats across databases.
+
+        ``senders`` holds ``(from, count)`` for the ``top_senders`` busiest
+        senders (all of them if None), and ``first``/``last`` are the
+        ``(ts_epoch_ms, message_id, ts)`` of the end messages, or None.
+        """
+        with self.get_connection(readonly=True) as conn:
+            totals = conn.execute(
+                "SELECT total_messages, senders_count FROM message_totals WHERE id = 1"
+            ).fetchone()
+            senders_query = "SELECT from_msisdn, count FROM sender_stats ORDER BY count DESC, from_msisdn ASC"
+            if top_senders is not None:
+                senders_query += f" LIMIT {int(top_senders)}"
+            senders = [tuple(row) for row in conn.execute(senders_query)]
+            ends = [
+                conn.execute(
+                    "SELECT ts_epoch_ms, message_id, ts FROM messages"
+                    f" ORDER BY ts_epoch_ms {direction}, message_id {direction} LIMIT 1"
+                ).fetchone()
+                for direction in ("ASC", "DESC")
+            ]
+        return {
+            'total_messages': totals['total_messages'],
+            'senders_count': totals['senders_count'],
+            'senders': senders,
+            'first': tuple(ends[0]) if ends[0] else None,
+            'last': tuple(ends[1]) if ends[1] else None,
+        }
+
+    def get_stats_json(self) -> bytes:
+        """get_stats rendered by SQLite as the JSON response body."""
+        with self.get_connection(readonly=True) as conn, phase("db_query"):
+            totals = conn.execute("""
+                SELECT json_quote(total_messages), json_quote(senders_count),
+                       json_quote(first_ts), json_quote(last_ts)
+                FROM message_totals
+                WHERE id = 1
+            """).fetchone()
+            per_sender = conn.execute(
+                TOP_SENDERS_QUERY.format(columns="json_object('from', from_msisdn, 'count', count)")
+            ).fetchall()
+
+        return (
+            '{"total_messages":' + totals[0]
+            + ',"senders_count":' + totals[1]
+            + ',"messages_per_sender":[' + ",".join([row[0] for row in per_sender])
+            + '],"first_message_ts":' + totals[2]
+            + ',"last_message_ts":' + totals[3]
+            + "}"
+        ).encode()
+
+    def get_timeseries(self, bucket: str = "hour", since: Optional[str] = None,
+                       until: Optional[str] = None,
+                       from_filter: Optional[str] = None) -> list[tuple[int, int]]:
+        """``(bucket_start_ms, count)`` for non-empty buckets, oldest first, from message_rollups.
+
+        See timeseries_range for how ``since``/``until`` select buckets.
+        """
+        where_sql, params = self._timeseries_filter(bucket, since, until, from_filter)
+        with self.get_connection(readonly=True) as conn:
+            rows = conn.execute(
+                f"SELECT bucket_start_ms, count FROM message_rollups WHERE {where_sql} ORDER BY bucket_start_ms",
+                params,
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    @staticmethod
+    def _timeseries_filter(bucket: str, since: Optional[str], until: Optional[str],
+                           from_filter: Optional[str]) -> tuple[str, list]:
+        bucket_ms, low, high = timeseries_range(bucket, since, until)
+        where_sql = "from_msisdn = ? AND bucket_ms = ?"
+        params: list = [from_filter or "", bucket_ms]
+        if low is not None:
+            where_sql += " AND bucket_start_ms >= ?"
+            params.append(low)
+        if high is not None:
+            where_sql += " AND bucket_start_ms < ?"
+            params.append(high)
+        return where_sql, params
+
+    def get_timeseries_json(self, bucket: str = "hour", since: Optional[str] = None,
+                            until: Optional[str] = None, from_filter: Optional[str] = None) -> bytes:
+        """get_timeseries rendered by SQLite as the JSON response body (same bytes as render_timeseries)."""
+        where_sql, params = self._timeseries_filter(bucket, since, until, from_filter)
+        offset_ms = rollup_offset_ms()
+        with self.get_connection(readonly=True) as conn, phase("db_query"):
+            data, total = conn.execute(f"""
+                SELECT json_group_array(json_object(
+                           'start', strftime('%Y-%m-%dT%H:%M:%S', (bucket_start_ms + ?) / 1000, 'unixepoch') || ?,
+                           'count', count
+                       )),
+                       coalesce(sum(count), 0)
+                FROM (
+                    SELECT bucket_start_ms, count FROM message_rollups
+                    WHERE {where_sql}
+                    ORDER BY bucket_start_ms
+                )
+            """, [offset_ms, utc_offset_suffix(offset_ms), *params]).fetchone()
+        return ('{"bucket":' + json.dumps(bucket) + ',"total":' + str(total) + ',"data":' + data + "}").encode()
+
     def is_healthy(self) -> bool:
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(readonly=True) as conn:
                 conn.execute("SELECT 1").fetchone()
             return True
         except Exception:
@@ -0,0 +1,43 @@
+"""Field checks shared by WebhookMessage and its fast validation path.
+
+Keeping them in one place guarantees the pydantic validators and the
+pre-check in app.models.validate_payload accept exactly the same values.
+"""
+import re
+from datetime import datetime
+
+PHONE_PATTERN = re.compile(r'^\+91[6-9]\d{9}$')
+PHONE_ERROR = 'Must be valid Indian number: +91 followed by 10 digits'
+
+IST_SUFFIX = '+05:30'
+IST_ERROR = 'Timestamp must be in IST (+05:30)'
+ISO_ERROR = 'Invalid ISO-8601 IST timestamp'
+
+TEXT_MAX_LENGTH = 4096
+
+
+def validate_phone(value: str) -> str:
+    if PHONE_PATTERN.match(value) is None:
+        raise ValueError(PHONE_ERROR)
+    return value
+
+
+def is_valid_ist_timestamp(value: str) -> bool:
+    # fromisoformat is implemented in C and beats any regex-based check.
+    if not value.endswith(IST_SUFFIX):
+        return False
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_ist_timestamp(value: str) -> str:
+    if not value.endswith(IST_SUFFIX):
+        raise ValueError(IST_ERROR)
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(ISO_ERROR)
+    return value
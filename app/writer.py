@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger("webhook_api")
+
+metrics.describe('group_commit_batches_total', 'counter', 'Group-commit transactions written')
+metrics.describe('group_commit_messages_total', 'counter', 'Messages written through group commit')
+metrics.describe('group_commit_queue_depth', 'gauge', 'Messages waiting for the group-commit writer')
+metrics.describe('group_commit_queue_capacity', 'gauge', 'Configured group-commit queue depth', aggregate='max')
+metrics.describe('group_commit_batch_size_max', 'gauge', 'Configured maximum messages per group commit', aggregate='max')
+metrics.describe('group_commit_max_linger_ms', 'gauge', 'Configured maximum wait before a partial batch is committed', aggregate='max')
+
+
+class GroupCommitWriter:
+    """Write-behind queue that commits webhook inserts in batches.
+
+    Handlers call ``submit`` and await the outcome; a single writer task
+    drains the queue and commits up to ``batch_size`` rows (or whatever
+    arrived within ``max_linger_ms``) in one transaction through the
+    AsyncDatabase ``db``.
+    """
+
+    def __init__(self, db, batch_size: int = 64, max_linger_ms: float = 5,
+                 queue_depth: int = 1024):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.max_linger = max(0.0, max_linger_ms) / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_depth)
+        self._task: Optional[asyncio.Task] = None
+
+        metrics.set_gauge('group_commit_queue_capacity', queue_depth)
+        metrics.set_gauge('group_commit_batch_size_max', self.batch_size)
+        metrics.set_gauge('group_commit_max_linger_ms', max_linger_ms)
+        metrics.set_gauge('group_commit_queue_depth', 0)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the writer task."""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, message_id: str, from_msisdn: str, to_msisdn: str,
+                     ts: str, text: Optional[str]) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((message_id, from_msisdn, to_msisdn, ts, text), future))
+        metrics.set_gauge('group_commit_queue_depth', self.queue.qsize())
+        return await future
+
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_linger
+
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            metrics.set_gauge('group_commit_queue_depth', self.queue.qsize())
+            try:
+                results = await self.db.insert_messages([row for row, _ in batch])
+            except Exception as exc:
+                logger.error("Group commit failed", extra={"result": "error"})
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                metrics.inc_counter('group_commit_batches_total')
+                metrics.inc_counter('group_commit_messages_total', len(batch))
+                for (_, future), inserted in zip(batch, results):
+                    if not future.done():
+                        future.set_result(inserted)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
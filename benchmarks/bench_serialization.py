@@ -0,0 +1,68 @@
+"""/messages body cost: dicts + response_model vs SQLite-rendered JSON.
+
+Usage: python -m benchmarks.bench_serialization [--rows N] [--limit L] [--repeat R]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models import MessagesListResponse
+from app.storage import Database
+
+
+def seed(db: Database, rows: int):
+    db.insert_messages([
+        (f"m{i:07d}", f"+9198765{i % 100000:05d}", "+919876543211",
+         f"2025-01-15T10:{i % 60:02d}:{(i // 60) % 60:02d}+05:30", f"Hello number {i}")
+        for i in range(rows)
+    ])
+
+
+def via_response_model(db: Database, limit: int) -> bytes:
+    # Storage dicts, then FastAPI's response_model validation and encoding.
+    content = db.get_messages(limit=limit, total_mode="none")
+    model = MessagesListResponse.model_validate(content)
+    return JSONResponse(jsonable_encoder(model.model_dump(by_alias=True))).body
+
+
+def via_sql_json(db: Database, limit: int) -> bytes:
+    return db.get_messages_json(limit=limit, total_mode="none")
+
+
+def best_of(repeat: int, iterations: int, func, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(*args)
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"))
+        seed(db, args.rows)
+        assert via_response_model(db, args.limit) == via_sql_json(db, args.limit)
+
+        baseline = None
+        for name, func in (("response_model", via_response_model), ("sql json_object", via_sql_json)):
+            elapsed_ms = best_of(args.repeat, args.iterations, func, db, args.limit) * 1000
+            baseline = baseline or elapsed_ms
+            print(f"{name:20s} {elapsed_ms:8.3f} ms/page  {baseline / elapsed_ms:5.2f}x")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
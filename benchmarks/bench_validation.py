@@ -0,0 +1,63 @@
+"""Per-message validation cost: pydantic model_validate vs the fast path.
+
+Usage: python -m benchmarks.bench_validation [--count N] [--repeat R]
+"""
+import argparse
+import time
+
+from app.models import WebhookMessage, validate_payload, validate_many
+
+
+def make_payloads(count: int) -> list:
+    return [
+        {
+            "message_id": f"m{i}",
+            "from": f"+9198765{i % 100000:05d}",
+            "to": "+919876543211",
+            "ts": f"2025-01-15T10:{i % 60:02d}:{(i // 60) % 60:02d}+05:30",
+            "text": "Hello",
+        }
+        for i in range(count)
+    ]
+
+
+def best_of(repeat: int, func, payloads: list) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payloads)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Every case keeps its results so garbage-collection pressure is comparable.
+def run_model_validate(payloads):
+    return [WebhookMessage.model_validate(data) for data in payloads]
+
+
+def run_validate_payload(payloads):
+    return [validate_payload(data) for data in payloads]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.count)
+    cases = [
+        ("WebhookMessage.model_validate", run_model_validate),
+        ("validate_payload", run_validate_payload),
+        ("validate_many", validate_many),
+    ]
+    baseline = None
+    for name, func in cases:
+        elapsed = best_of(args.repeat, func, payloads)
+        per_message_us = elapsed / args.count * 1e6
+        baseline = baseline or per_message_us
+        print(f"{name:32s} {per_message_us:8.2f} us/msg  {baseline / per_message_us:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
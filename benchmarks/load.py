@@ -0,0 +1,302 @@
+"""Mixed-workload load benchmark for the webhook API.
+
+Drives the app in-process (through its ASGI interface, with the real
+lifespan) or a running server given with --url, and prints a JSON report
+with throughput and p50/p95/p99 latency per endpoint.
+
+Usage:
+    python -m benchmarks.load --seed-rows 100000 --duration 30
+    python -m benchmarks.load --url http://localhost:8000 --secret "$WEBHOOK_SECRET"
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+
+SENDERS = [f"+9198765{i:05d}" for i in range(500)]
+WORDS = ["hello", "order", "shipped", "invoice", "refund", "delivery", "payment", "thanks"]
+DEFAULT_MIX = "webhook=50,messages=35,stats=15"
+SEED_BATCH = 10_000
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("webhook", "messages", "stats"):
+            raise argparse.ArgumentTypeError(f"unknown endpoint in mix: {name!r}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def make_message(index: int, rng: random.Random, prefix: str = "seed") -> dict:
+    day, second = divmod(index, 86_400)
+    hour, rest = divmod(second, 3600)
+    return {
+        "message_id": f"{prefix}-{index}",
+        "from": rng.choice(SENDERS),
+        "to": "+919876543211",
+        "ts": f"2025-{1 + day // 28 % 12:02d}-{1 + day % 28:02d}T{hour:02d}:{rest // 60:02d}:{rest % 60:02d}+05:30",
+        "text": " ".join(rng.choices(WORDS, k=6)),
+    }
+
+
+def sign(body: bytes, secret: str) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def percentile(sorted_values: list[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return round(sorted_values[int(rank) - 1], 3)
+
+
+def seed_database(url: str, rows: int, rng: random.Random):
+    """Insert ``rows`` messages straight through the storage layer."""
+    from app.storage import open_database
+
+    db = open_database(url)
+    try:
+        for start in range(0, rows, SEED_BATCH):
+            batch = [make_message(i, rng) for i in range(start, min(rows, start + SEED_BATCH))]
+            db.insert_messages([
+                (m["message_id"], m["from"], m["to"], m["ts"], m["text"]) for m in batch
+            ])
+    finally:
+        db.close()
+
+
+async def seed_over_http(client: httpx.AsyncClient, rows: int, secret: str, rng: random.Random):
+    for start in range(0, rows, 1000):
+        batch = [make_message(i, rng) for i in range(start, min(rows, start + 1000))]
+        body = json.dumps(batch).encode()
+        response = await client.post(
+            "/webhook/batch", content=body,
+            headers={"Content-Type": "application/json", "X-Signature": sign(body, secret)},
+        )
+        response.raise_for_status()
+
+
+class Workload:
+    """Generates requests for one benchmark run and records their latencies."""
+
+    def __init__(self, client: httpx.AsyncClient, mix: dict[str, float], secret: str,
+                 duplicate_ratio: float, rng: random.Random):
+        self.client = client
+        self.secret = secret
+        self.duplicate_ratio = duplicate_ratio
+        self.rng = rng
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.ids = itertools.count()
+        self.prefix = f"bench-{uuid.uuid4().hex[:12]}"
+        self.sent: list[dict] = []
+        self.cursors: list[str] = []
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.shed: dict[str, int] = defaultdict(int)
+
+    async def webhook(self):
+        if self.sent and self.rng.random() < self.duplicate_ratio:
+            message = self.rng.choice(self.sent)
+        else:
+            message = make_message(next(self.ids), self.rng, prefix=self.prefix)
+            if len(self.sent) < 10_000:
+                self.sent.append(message)
+        body = json.dumps(message).encode()
+        return await self.client.post(
+            "/webhook", content=body,
+            headers={"Content-Type": "application/json", "X-Signature": sign(body, self.secret)},
+        )
+
+    async def messages(self):
+        variant = self.rng.random()
+        if variant < 0.4:
+            params = {"limit": 50}
+        elif variant < 0.6:
+            params = {"limit": 50, "from": self.rng.choice(SENDERS)}
+        elif variant < 0.75:
+            params = {"limit": 20, "q": self.rng.choice(WORDS)}
+        elif variant < 0.9:
+            params = {"limit": 100, "offset": self.rng.randrange(0, 1000), "total": "none"}
+        elif self.cursors:
+            params = {"limit": 100, "total": "none", "cursor": self.rng.choice(self.cursors)}
+        else:
+            params = {"limit": 100, "total": "none"}
+        response = await self.client.get("/messages", params=params)
+        if response.status_code == 200 and len(self.cursors) < 1000:
+            next_cursor = response.json().get("next_cursor")
+            if next_cursor:
+                self.cursors.append(next_cursor)
+        return response
+
+    async def stats(self):
+        return await self.client.get("/stats")
+
+    async def worker(self, deadline: float, remaining: itertools.count, limit: Optional[int]):
+        while time.perf_counter() < deadline:
+            if limit is not None and next(remaining) >= limit:
+                return
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, endpoint)()
+                ok = response.status_code < 400
+                if response.status_code in (429, 503):
+                    self.shed[endpoint] += 1
+            except httpx.HTTPError:
+                ok = False
+            self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    async def run(self, concurrency: int, duration: float, requests: Optional[int]) -> float:
+        deadline = time.perf_counter() + duration
+        remaining = itertools.count()
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            self.worker(deadline, remaining, requests) for _ in range(concurrency)
+        ])
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        all_latencies = []
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            all_latencies.extend(values)
+            endpoints[name] = summarize(values, self.errors[name], self.shed[name], elapsed)
+        all_latencies.sort()
+        return {
+            "endpoints": endpoints,
+            "total": summarize(all_latencies, sum(self.errors.values()), sum(self.shed.values()), elapsed),
+        }
+
+
+def summarize(sorted_values: list[float], errors: int, shed: int, elapsed: float) -> dict:
+    return {
+        "requests": len(sorted_values),
+        "errors": errors,
+        "shed": shed,
+        "throughput_rps": round(len(sorted_values) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(sorted_values) / len(sorted_values), 3) if sorted_values else None,
+        "p50_ms": percentile(sorted_values, 50),
+        "p95_ms": percentile(sorted_values, 95),
+        "p99_ms": percentile(sorted_values, 99),
+        "max_ms": round(sorted_values[-1], 3) if sorted_values else None,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_in_process(args, rng: random.Random) -> dict:
+    workdir = tempfile.mkdtemp(prefix="webhook-bench-")
+    default_name = "bench.log" if args.storage == "logstore" else "bench.db"
+    db_path = args.database or os.path.join(workdir, default_name)
+    os.environ["DATABASE_URL"] = f"{args.storage}:///{db_path}"
+    os.environ["WEBHOOK_SECRET"] = args.secret
+    # Request logs go to stdout, where the report is printed.
+    os.environ["LOG_LEVEL"] = args.log_level
+    if args.seed_rows:
+        seed_database(os.environ["DATABASE_URL"], args.seed_rows, rng)
+
+    # Config is read at import time, so the app is imported only now.
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_workload(client, args, rng)
+
+
+async def run_against_url(args, rng: random.Random) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        if args.seed_rows:
+            await seed_over_http(client, args.seed_rows, args.secret, rng)
+        return await run_workload(client, args, rng)
+
+
+async def run_workload(client: httpx.AsyncClient, args, rng: random.Random) -> dict:
+    if args.warmup:
+        warmup = Workload(client, args.mix, args.secret, args.duplicate_ratio, rng)
+        await warmup.run(args.concurrency, args.warmup, None)
+    workload = Workload(client, args.mix, args.secret, args.duplicate_ratio, rng)
+    elapsed = await workload.run(args.concurrency, args.duration, args.requests)
+    report = workload.report(elapsed)
+    report["elapsed_s"] = round(elapsed, 3)
+    return report
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--database",
+                        help="In-process only: SQLite file or log store directory (default: fresh, in a temp dir)")
+    parser.add_argument("--storage", choices=("sqlite", "logstore"), default="sqlite",
+                        help="In-process only: storage backend")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET") or "bench-secret")
+    parser.add_argument("--seed-rows", type=int, default=10_000,
+                        help="Messages inserted before the run (10k-10M)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--warmup", type=float, default=1, help="Seconds of untimed warm-up traffic")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Relative endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1,
+                        help="Share of webhooks that replay an already sent message_id")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="In-process only: app LOG_LEVEL (INFO adds per-request logging to stdout)")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.random_seed)
+    runner = run_against_url if args.url else run_in_process
+    results = asyncio.run(runner(args, rng))
+
+    report = {
+        "revision": git_revision(),
+        "target": args.url or "in-process",
+        "storage": None if args.url else args.storage,
+        "python": sys.version.split()[0],
+        "seed_rows": args.seed_rows,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "duplicate_ratio": args.duplicate_ratio,
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 import hmac
 import hashlib
+import shutil
 import tempfile
 import pytest
 from fastapi.testclient import TestClient
@@ -8,22 +9,49 @@ from fastapi.testclient import TestClient
 os.environ["WEBHOOK_SECRET"] = "testsecret"
 os.environ["DATABASE_URL"] = "sqlite:////tmp/test_app.db"
 
-from app.main import app, db
+from app.main import app
+from app.storage import Database
+
+# TEST_STORAGE_BACKEND=logstore or =sharded runs the API tests against
+# the log store or three SQLite shards.
+STORAGE_BACKEND = os.getenv("TEST_STORAGE_BACKEND", "sqlite")
 
 @pytest.fixture
 def client():
-    with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp_file:
-        db_path = tmp_file.name
-
-    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
-
-    from app.storage import Database
-    test_db = Database(db_path)
+    if STORAGE_BACKEND == "logstore":
+        db_path = tempfile.mkdtemp(suffix=".log")
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp_file:
+            db_path = tmp_file.name
+
+    from app import main
+    from app.sharding import ShardedDatabase, shard_paths
+    from app.storage import open_database
+    if STORAGE_BACKEND == "sharded":
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        test_db = ShardedDatabase.open(db_path, 3)
+    else:
+        os.environ["DATABASE_URL"] = f"{STORAGE_BACKEND}:///{db_path}"
+        test_db = open_database(os.environ["DATABASE_URL"])
+    original_db, main.db = main.db, test_db
 
     with TestClient(app) as test_client:
         yield test_client
 
-    os.unlink(db_path)
+    main.db = original_db
+    test_db.close()
+    if STORAGE_BACKEND == "logstore":
+        shutil.rmtree(db_path, ignore_errors=True)
+    for path in [db_path, *shard_paths(db_path, 3)]:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "app.db"))
+    yield database
+    database.close()
 
 def compute_signature(body: str, secret: str = "testsecret") -> str:
     return hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
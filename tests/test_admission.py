@@ -0,0 +1,177 @@
+import asyncio
+import gc
+import json
+
+import pytest
+
+from app import main
+from app.admission import AdmissionController, Rejected
+from app.metrics import metrics
+from tests.conftest import compute_signature
+
+def post_message(client, message_id: str):
+    body = json.dumps({
+        "message_id": message_id,
+        "from": "+919876543210",
+        "to": "+919876543211",
+        "ts": "2025-01-15T10:00:00+05:30",
+        "text": "Hello"
+    })
+    return client.post(
+        "/webhook",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Signature": compute_signature(body)}
+    )
+
+def test_lanes_by_path():
+    controller = AdmissionController()
+    assert controller.lane_for("/webhook") is controller.write
+    assert controller.lane_for("/webhook/batch") is controller.write
+    assert controller.lane_for("/stats") is controller.read
+    assert controller.lane_for("/messages/export") is controller.read
+    assert controller.lane_for("/health/ready") is None
+    assert controller.lane_for("/metrics") is None
+
+def test_queued_requests_are_admitted_in_order():
+    async def scenario():
+        controller = AdmissionController(write_limit=1, write_queue=2)
+        lane = controller.write
+        assert await controller.acquire(lane) == 0
+        order = []
+
+        async def request(name):
+            await controller.acquire(lane)
+            order.append(name)
+            lane.release()
+
+        waiting = [asyncio.create_task(request(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(lane)
+        assert (rejected.value.status_code, rejected.value.reason) == (429, "queue_full")
+
+        lane.release()
+        await asyncio.gather(*waiting)
+        return order, lane.active, lane.queued
+
+    assert asyncio.run(scenario()) == (["a", "b"], 0, 0)
+
+def test_queue_timeout_and_cancellation_free_their_place():
+    async def scenario():
+        controller = AdmissionController(read_limit=1, read_queue=4, queue_timeout_ms=10)
+        lane = controller.read
+        await controller.acquire(lane)
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(lane)
+        assert (rejected.value.status_code, rejected.value.reason) == (503, "queue_timeout")
+
+        abandoned = asyncio.create_task(controller.acquire(lane))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await asyncio.gather(abandoned, return_exceptions=True)
+        lane.release()
+        return lane.active, lane.queued
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+def test_reads_yield_to_queued_writes():
+    async def scenario():
+        controller = AdmissionController(write_limit=1, write_queue=4, write_backlog=2)
+        await controller.acquire(controller.write)
+        queued_writes = [asyncio.create_task(controller.acquire(controller.write)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(controller.read)
+        for queued_write in queued_writes:
+            controller.write.release()
+            await queued_write
+        controller.write.release()
+        # The write backlog has drained, so reads are admitted again.
+        await controller.acquire(controller.read)
+        return rejected.value.reason, rejected.value.status_code
+
+    assert asyncio.run(scenario()) == ("write_priority", 503)
+
+def asgi_get(path: str, receive, send):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"testserver")],
+        "client": ("testclient", 50000), "server": ("testserver", 80),
+    }
+    return main.app(scope, receive, send)
+
+def test_streamed_body_holds_its_slot_until_sent():
+    async def body():
+        for chunk in (b"a", b"b"):
+            yield chunk
+
+    async def scenario():
+        controller = AdmissionController(read_limit=1)
+        lane = controller.read
+        await controller.acquire(lane)
+        during = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            during.append(lane.active)
+
+        await main.SlotReleasingResponse(main.StreamingResponse(body()), lane)({"type": "http"}, receive, send)
+        return during, lane.active
+
+    assert asyncio.run(scenario()) == ([1, 1, 1, 1], 0)
+
+def test_early_disconnects_release_their_slots(client, monkeypatch):
+    controller = AdmissionController(read_limit=8, read_queue=256)
+    monkeypatch.setattr(main, "admission", controller)
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    async def scenario():
+        await asyncio.gather(*[asgi_get("/stats", receive, send) for _ in range(50)], return_exceptions=True)
+        # Checked before asyncio.run finalizes abandoned generators.
+        return controller.read.active, controller.read.queued
+
+    gc.disable()
+    try:
+        assert asyncio.run(scenario()) == (0, 0)
+    finally:
+        gc.enable()
+
+def test_export_releases_its_slot(client, monkeypatch):
+    controller = AdmissionController(read_limit=1, read_queue=0)
+    monkeypatch.setattr(main, "admission", controller)
+    assert post_message(client, "m-export").status_code == 200
+
+    response = client.get("/messages/export")
+    assert response.status_code == 200
+    assert b"m-export" in response.content
+    assert controller.read.active == 0
+    assert client.get("/stats").status_code == 200
+
+def test_shed_requests_get_retry_after(client, monkeypatch):
+    controller = AdmissionController(write_limit=1, write_queue=0, read_limit=1, read_queue=0, retry_after_s=2.5)
+    monkeypatch.setattr(main, "admission", controller)
+
+    assert post_message(client, "m-admitted").status_code == 200
+    assert controller.write.active == 0
+
+    controller.write.try_acquire()
+    controller.read.try_acquire()
+    response = post_message(client, "m-shed")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert client.get("/stats").status_code == 429
+    assert client.get("/health/live").status_code == 200
+    assert client.get("/metrics").status_code == 200
+
+    output = metrics.generate_metrics()
+    assert 'admission_rejected_total{lane="write",reason="queue_full"}' in output
+    assert 'admission_in_flight{lane="read"} 1' in output
+    assert 'admission_queue_depth{lane="write"} 0' in output
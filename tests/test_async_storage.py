@@ -0,0 +1,44 @@
+import asyncio
+import time
+import pytest
+
+from app.async_storage import AsyncDatabase
+from app.metrics import metrics
+from app.storage import Database
+
+@pytest.fixture
+def async_db(tmp_path):
+    database = Database(str(tmp_path / "app.db"))
+    wrapper = AsyncDatabase(database, read_threads=2)
+    yield wrapper
+    wrapper.close()
+    database.close()
+
+@pytest.mark.asyncio
+async def test_slow_reads_do_not_block_event_loop(async_db, monkeypatch):
+    monkeypatch.setattr(async_db.db, "get_stats", lambda: time.sleep(0.2) or {"total_messages": 0})
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    stats, _ = await asyncio.gather(async_db.get_stats(), ticker())
+    assert stats == {"total_messages": 0}
+    assert ticks == 10
+
+@pytest.mark.asyncio
+async def test_writes_and_reads_round_trip(async_db):
+    assert await async_db.insert_message("m1", "+919876543210", "+919876543211",
+                                         "2025-01-15T10:00:00+05:30", "Hello")
+    assert await async_db.insert_messages([
+        ("m1", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "Hello"),
+    ]) == [False]
+
+    page = await async_db.get_messages(50, 0)
+    assert page["total"] == 1
+    assert await async_db.is_healthy()
+    assert 'db_queue_wait_ms_count{pool="write"}' in metrics.generate_metrics()
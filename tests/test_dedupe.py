@@ -0,0 +1,41 @@
+from app.dedupe import BloomFilter, DuplicateFilter
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"m{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"x{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+def test_duplicate_filter_answers_recent_ids():
+    dedupe = DuplicateFilter(lru_size=2, bloom_capacity=100)
+    dedupe.warm_from([])
+
+    assert not dedupe.is_duplicate("m1")
+    dedupe.record("m1", inserted=True)
+    assert dedupe.is_duplicate("m1")
+
+    dedupe.record("m2", inserted=True)
+    dedupe.record("m3", inserted=True)
+    assert not dedupe.is_duplicate("m1")
+    assert dedupe.is_duplicate("m3")
+
+def test_duplicate_filter_never_claims_unseen_ids():
+    dedupe = DuplicateFilter(lru_size=10, bloom_capacity=100)
+    dedupe.warm_from(["m1", "m2"])
+
+    assert not dedupe.is_duplicate("m1")
+    assert not dedupe.is_duplicate("m9")
+
+def test_duplicate_filter_lookup_verdicts():
+    dedupe = DuplicateFilter(lru_size=10, bloom_capacity=100)
+    assert dedupe.lookup("m1") == "maybe"
+
+    dedupe.warm_from(["m1"])
+    assert dedupe.lookup("m1") == "maybe"
+    assert dedupe.lookup("m9") == "definitely_new"
+    dedupe.record("m1", inserted=False)
+    assert dedupe.lookup("m1") == "hit"
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+
+from app.async_storage import AsyncDatabase
+from app.writer import GroupCommitWriter
+
+def message(message_id: str):
+    return (message_id, "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "Hello")
+
+def test_insert_messages_reports_duplicates(db):
+    assert db.insert_message(*message("m1"))
+    assert db.insert_messages([message("m1"), message("m2"), message("m2")]) == [False, True, False]
+    assert db.get_messages()["total"] == 2
+
+@pytest.mark.asyncio
+async def test_group_commit_batches_and_resolves_each_submit(db):
+    writer = GroupCommitWriter(AsyncDatabase(db), batch_size=8, max_linger_ms=20, queue_depth=32)
+    await writer.start()
+    try:
+        results = await asyncio.gather(*[
+            writer.submit(*message(f"m{i % 5}")) for i in range(10)
+        ])
+    finally:
+        await writer.stop()
+
+    assert results[:5] == [True] * 5
+    assert results[5:] == [False] * 5
+    assert db.get_messages()["total"] == 5
+
+@pytest.mark.asyncio
+async def test_group_commit_stop_flushes_queue(db):
+    writer = GroupCommitWriter(AsyncDatabase(db), batch_size=4, max_linger_ms=1000, queue_depth=8)
+    await writer.start()
+    pending = asyncio.create_task(writer.submit(*message("m1")))
+    await asyncio.sleep(0)
+    await writer.stop()
+
+    assert await pending is True
+    assert db.get_messages()["total"] == 1
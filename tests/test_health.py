@@ -7,3 +7,17 @@ def test_health_ready(client):
     response = client.get("/health/ready")
     assert response.status_code == 200
     assert response.json() == {"status": "ready"}
+
+def test_health_ready_does_not_queue_behind_reads(client):
+    import threading
+    from app import main
+    from app.config import config
+
+    release = threading.Event()
+    busy = [main.async_db.read_pool.submit(release.wait, 10) for _ in range(config.DB_READ_THREADS)]
+    try:
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert not any(future.done() for future in busy)
+    finally:
+        release.set()
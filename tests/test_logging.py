@@ -0,0 +1,103 @@
+import io
+import json
+import logging
+import threading
+
+from app.logging_utils import BatchingQueueHandler, JSONFormatter
+
+def make_logger(handler: logging.Handler, name: str) -> logging.Logger:
+    handler.setFormatter(JSONFormatter())
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+def test_batching_handler_writes_json_lines():
+    stream = io.StringIO()
+    handler = BatchingQueueHandler(stream)
+    logger = make_logger(handler, "test_batching_writes")
+
+    for i in range(5):
+        logger.info("Request processed", extra={"status": 200, "path": f"/p{i}"})
+    handler.flush()
+    handler.close()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["path"] for line in lines] == [f"/p{i}" for i in range(5)]
+
+def test_batching_handler_samples_successes_but_keeps_errors():
+    stream = io.StringIO()
+    handler = BatchingQueueHandler(stream, sample_every=3)
+    logger = make_logger(handler, "test_batching_samples")
+
+    for _ in range(6):
+        logger.info("Request processed", extra={"status": 200})
+    logger.info("Request processed", extra={"status": 500})
+    logger.error("Invalid signature")
+    handler.flush()
+    handler.close()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line.get("status") for line in lines] == [200, 200, 500, None]
+
+class BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait()
+        return super().write(text)
+
+def test_batching_handler_drops_when_queue_is_full():
+    stream = BlockingStream()
+    handler = BatchingQueueHandler(stream, queue_size=1, batch_size=1)
+    logger = make_logger(handler, "test_batching_full")
+
+    for i in range(10):
+        logger.info("event %d", i)
+    stream.release.set()
+    handler.flush()
+    handler.close()
+
+    written = stream.getvalue().splitlines()
+    assert 1 <= len(written) < 10
+
+def test_batching_handler_renders_messages_when_emitted():
+    stream = BlockingStream()
+    handler = BatchingQueueHandler(stream)
+    logger = make_logger(handler, "test_batching_prepare")
+
+    state = {"step": 1}
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("state %s", state, exc_info=True)
+    state["step"] = 2
+    queued = handler.queue.queue[0]
+    assert (queued.args, queued.exc_info) == (None, None)
+    stream.release.set()
+    handler.flush()
+    handler.close()
+
+    assert json.loads(stream.getvalue())["message"] == "state {'step': 1}"
+
+def test_batching_handler_samples_exactly_across_threads():
+    stream = io.StringIO()
+    handler = BatchingQueueHandler(stream, sample_every=4)
+    logger = make_logger(handler, "test_batching_threads")
+
+    def log_many():
+        for _ in range(1000):
+            logger.info("Request processed", extra={"status": 200})
+
+    threads = [threading.Thread(target=log_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler.flush()
+    handler.close()
+
+    assert len(stream.getvalue().splitlines()) == 2000
@@ -0,0 +1,211 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app.logstore import LogStore
+from app.retention import ArchiveSegment
+from app.storage import Database, open_database
+from tests.test_storage import fastapi_body
+
+def seed(store, message_id: str, text: str = "hello", ts: str = "2025-01-15T10:00:00+05:30",
+         sender: str = "+919876543210"):
+    return store.insert_message(message_id, sender, "+919876543211", ts, text)
+
+@pytest.fixture
+def store(tmp_path):
+    log_store = LogStore(str(tmp_path / "log"))
+    yield log_store
+    log_store.close()
+
+def segment_files(store):
+    return sorted(name for name in os.listdir(store.directory) if name.endswith(".log"))
+
+def test_open_database_picks_backend(tmp_path):
+    log_store = open_database(f"logstore:///{tmp_path / 'log'}")
+    sqlite = open_database(f"sqlite:///{tmp_path / 'app.db'}")
+    try:
+        assert isinstance(log_store, LogStore)
+        assert isinstance(sqlite, Database)
+    finally:
+        log_store.close()
+        sqlite.close()
+
+def test_insert_rejects_duplicates(store):
+    assert seed(store, "m1") is True
+    assert seed(store, "m1") is False
+    assert store.insert_messages([
+        ("m2", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "a"),
+        ("m1", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "b"),
+        ("m2", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "c"),
+    ]) == [True, False, False]
+    assert sorted(store.iter_message_ids()) == ["m1", "m2"]
+
+def test_reads_match_sqlite(store, tmp_path):
+    sqlite = Database(str(tmp_path / "app.db"))
+    rows = [
+        ("m3", "+919123456789", "+919876543211", "2025-01-15T09:00:00+05:30", "Third HELLO"),
+        ("m1", "+919876543210", "+919876543211", "2025-01-15T09:00:00+05:30", "first hello"),
+        ("m2", "+919876543210", "+919876543211", "2025-01-15T03:30:00Z", "second"),
+        ("m4", "+919876543210", "+919876543211", "2025-01-16T10:00:00+05:30", None),
+        ("m5", "+919123456789", "+919876543211", "2025-01-17T10:00:00+05:30", 'quotes " ünïcødé 😀\n'),
+    ]
+    store.insert_messages(rows)
+    sqlite.insert_messages(rows)
+    try:
+        for kwargs in ({}, {"limit": 2}, {"limit": 2, "offset": 1, "total_mode": "none"},
+                       {"from_filter": "+919876543210"}, {"q": "hello"},
+                       {"since": "2025-01-15T09:00:00+05:30", "until": "2025-01-17T00:00:00+05:30"},
+                       {"total_mode": "estimate", "from_filter": "+919123456789"}):
+            assert store.get_messages(**kwargs) == sqlite.get_messages(**kwargs)
+            assert store.get_messages_json(**kwargs) == sqlite.get_messages_json(**kwargs)
+
+        cursor = store.get_messages(limit=2)["next_cursor"]
+        assert store.get_messages(limit=2, cursor=cursor) == sqlite.get_messages(limit=2, cursor=cursor)
+        assert store.get_stats() == sqlite.get_stats()
+        for fmt in ("ndjson", "csv"):
+            assert b"".join(store.export_messages(fmt, after="m1", batch_size=2)) == \
+                b"".join(sqlite.export_messages(fmt, after="m1", batch_size=2))
+    finally:
+        sqlite.close()
+
+def test_json_bodies_match_response_models(store):
+    from app.models import MessagesListResponse, StatsResponse
+
+    assert store.get_stats_json() == fastapi_body(StatsResponse, store.get_stats())
+    seed(store, "m1", 'tabs\t and \\ slashes \x01')
+    seed(store, "m2", None, ts="2025-01-16T10:00:00+05:30", sender="+919123456789")
+
+    assert store.get_messages_json(limit=1) == fastapi_body(MessagesListResponse, store.get_messages(limit=1))
+    assert store.get_stats_json() == fastapi_body(StatsResponse, store.get_stats())
+
+def test_invalid_filters_raise_value_error(store):
+    with pytest.raises(ValueError):
+        store.get_messages(since="yesterday")
+    with pytest.raises(ValueError):
+        store.get_messages(cursor="not-a-cursor")
+    with pytest.raises(ValueError):
+        store.export_messages(after="missing")
+
+def test_indexes_are_rebuilt_on_restart(tmp_path):
+    directory = str(tmp_path / "log")
+    first = LogStore(directory, segment_bytes=256)
+    for i in range(20):
+        seed(first, f"m{i:02d}", ts=f"2025-01-15T10:00:{59 - i:02d}+05:30")
+    # Drops the five oldest, m19 to m15.
+    assert first.purge_expired(cutoff_ms=2**62, batch_size=5) == 5
+    expected = first.get_messages(limit=100)
+    first.close()
+    assert len(segment_files(first)) > 1
+
+    second = LogStore(directory, segment_bytes=256)
+    try:
+        assert second.get_messages(limit=100) == expected
+        assert expected["total"] == 15
+        assert seed(second, "m00") is False
+        assert seed(second, "m19") is True
+    finally:
+        second.close()
+
+def test_torn_tail_is_truncated(tmp_path):
+    directory = str(tmp_path / "log")
+    first = LogStore(directory)
+    seed(first, "m1")
+    seed(first, "m2")
+    first.close()
+
+    path = os.path.join(directory, segment_files(first)[-1])
+    intact = os.path.getsize(path)
+    with open(path, "r+b") as segment:
+        segment.truncate(intact - 3)
+
+    second = LogStore(directory)
+    try:
+        assert list(second.iter_message_ids()) == ["m1"]
+        assert seed(second, "m2") is True
+    finally:
+        second.close()
+    third = LogStore(directory)
+    assert third.get_messages()["total"] == 2
+    third.close()
+
+def test_purge_archives_and_compaction_reclaims_segments(tmp_path):
+    directory = str(tmp_path / "log")
+    store = LogStore(directory, segment_bytes=512)
+    for i in range(30):
+        seed(store, f"old{i:02d}", text=f"old {i}", ts="2020-01-01T10:00:00+05:30")
+    for i in range(3):
+        seed(store, f"new{i}", ts="2030-01-01T10:00:00+05:30")
+    segments_before = len(segment_files(store))
+
+    archive = ArchiveSegment(str(tmp_path / "archive"))
+    cutoff = 1609459200000  # 2021-01-01
+    assert store.purge_expired(cutoff, 20, archive.write) == 20
+    assert store.purge_expired(cutoff, 20, archive.write) == 10
+    assert store.purge_expired(cutoff, 20, archive.write) == 0
+    archive.close()
+
+    with gzip.open(archive.path, "rt") as archived:
+        lines = [json.loads(line) for line in archived]
+    assert [line["message_id"] for line in lines] == [f"old{i:02d}" for i in range(30)]
+    assert lines[0]["text"] == "old 0" and lines[0]["created_at"].endswith("Z")
+
+    assert store.incremental_vacuum(1000) > 0
+    assert len(segment_files(store)) < segments_before
+    assert store.get_messages()["total"] == 3
+    store.close()
+
+    reopened = LogStore(directory, segment_bytes=512)
+    try:
+        assert [m["message_id"] for m in reopened.get_messages()["data"]] == ["new0", "new1", "new2"]
+        assert reopened.get_stats()["senders_count"] == 1
+    finally:
+        reopened.close()
+
+def test_write_generation_follows_writes(store):
+    generation = store.write_generation
+    seed(store, "m1")
+    assert store.write_generation != generation
+
+    generation = store.write_generation
+    seed(store, "m1")
+    assert store.write_generation == generation
+
+def test_search_matches_sqlite_like(store, tmp_path):
+    sqlite = Database(str(tmp_path / "app.db"))
+    rows = [
+        ("m1", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "Über naïve CAFÉ"),
+        ("m2", "+919876543210", "+919876543211", "2025-01-15T10:01:00+05:30", "100% sure_thing"),
+        ("m3", "+919876543210", "+919876543211", "2025-01-15T10:02:00+05:30", "line\nbreak"),
+        ("m4", "+919876543210", "+919876543211", "2025-01-15T10:03:00+05:30", "über ß"),
+    ]
+    store.insert_messages(rows)
+    sqlite.insert_messages(rows)
+    try:
+        for q in ("ü", "Ü", "über", "ÜBER", "café", "CAFÉ", "NAÏVE", "ss", "%", "0%s", "e_t", "sure_", "1_0",
+                  "e%b", "line_break", "b.r", "[a]"):
+            assert store.get_messages(q=q) == sqlite.get_messages(q=q), q
+        assert store.get_messages(q="ü")["total"] == 1
+    finally:
+        sqlite.close()
+
+def test_directory_is_locked_against_other_processes(store):
+    import subprocess
+    import sys
+
+    with pytest.raises(RuntimeError, match="already open"):
+        LogStore(store.directory)
+
+    opener = f"from app.logstore import LogStore; LogStore({store.directory!r})"
+    result = subprocess.run([sys.executable, "-c", opener], capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "already open in another process" in result.stderr
+
+    seed(store, "m1")
+    store.close()
+    reopened = LogStore(store.directory)
+    try:
+        assert reopened.get_stats()["total_messages"] == 1
+    finally:
+        reopened.close()
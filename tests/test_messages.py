@@ -104,3 +104,177 @@ def test_messages_ordering(client):
     assert data["data"][0]["message_id"] == "m1"
     assert data["data"][1]["message_id"] == "m3"
     assert data["data"][2]["message_id"] == "m2"
+
+def seed_ist_message(client, message_id: str, from_num: str, ts: str, text: str):
+    body = json.dumps({
+        "message_id": message_id,
+        "from": from_num,
+        "to": "+919876543211",
+        "ts": ts,
+        "text": text
+    })
+
+    response = client.post(
+        "/webhook",
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            "X-Signature": compute_signature(body)
+        }
+    )
+    assert response.status_code == 200
+
+def test_messages_cursor_pagination(client):
+    seed_ist_message(client, "c1", "+919876543210", "2025-01-15T09:00:00+05:30", "First")
+    seed_ist_message(client, "c2", "+919876543210", "2025-01-15T10:00:00+05:30", "Second")
+    seed_ist_message(client, "c3", "+919876543210", "2025-01-15T10:00:00+05:30", "Third")
+    seed_ist_message(client, "c4", "+919123456789", "2025-01-15T11:00:00+05:30", "Fourth")
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/messages?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url).json()
+        assert data["total"] == 4
+        seen.extend(msg["message_id"] for msg in data["data"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == ["c1", "c2", "c3", "c4"]
+
+def test_messages_last_page_has_no_cursor(client):
+    seed_ist_message(client, "c1", "+919876543210", "2025-01-15T09:00:00+05:30", "First")
+
+    data = client.get("/messages?limit=1").json()
+    assert data["next_cursor"] is None
+
+def test_messages_invalid_cursor(client):
+    response = client.get("/messages?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_messages_total_modes(client):
+    seed_ist_message(client, "t1", "+919876543210", "2025-01-15T09:00:00+05:30", "Hello")
+    seed_ist_message(client, "t2", "+919876543210", "2025-01-15T10:00:00+05:30", "Hello again")
+    seed_ist_message(client, "t3", "+919123456789", "2025-01-15T11:00:00+05:30", "Bye")
+
+    data = client.get("/messages?limit=2&total=none").json()
+    assert data["total"] is None
+    assert data["has_more"] is True
+    assert len(data["data"]) == 2
+
+    data = client.get("/messages?limit=2&offset=2&total=none").json()
+    assert data["has_more"] is False
+
+    assert client.get("/messages?total=estimate").json()["total"] == 3
+    assert client.get("/messages?total=estimate&from=%2B919876543210").json()["total"] == 2
+    assert client.get("/messages?total=estimate&q=Hello").json()["total"] == 2
+
+def test_messages_invalid_total_mode(client):
+    response = client.get("/messages?total=sometimes")
+    assert response.status_code == 422
+
+def seed_export_messages(client):
+    seed_ist_message(client, "e1", "+919876543210", "2025-01-15T09:00:00+05:30", "First, with comma")
+    seed_ist_message(client, "e2", "+919123456789", "2025-01-15T10:00:00+05:30", "Second")
+    seed_ist_message(client, "e3", "+919876543210", "2025-01-15T11:00:00+05:30", 'Third "quoted"\nline')
+
+def test_messages_export_ndjson(client):
+    seed_export_messages(client)
+
+    response = client.get("/messages/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["message_id"] for line in lines] == ["e1", "e2", "e3"]
+    assert lines[0] == client.get("/messages").json()["data"][0]
+
+def test_messages_export_filters_and_resume(client):
+    seed_export_messages(client)
+
+    response = client.get("/messages/export", params={"from": "+919876543210"})
+    assert [json.loads(line)["message_id"] for line in response.text.splitlines()] == ["e1", "e3"]
+
+    response = client.get("/messages/export", params={"after": "e1"})
+    assert [json.loads(line)["message_id"] for line in response.text.splitlines()] == ["e2", "e3"]
+
+    response = client.get("/messages/export", params={"after": "missing"})
+    assert response.status_code == 400
+
+def test_messages_export_csv(client):
+    import csv
+    import io
+
+    seed_export_messages(client)
+
+    response = client.get("/messages/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["message_id", "from", "to", "ts", "text"]
+    assert [row[0] for row in rows[1:]] == ["e1", "e2", "e3"]
+    assert rows[3][4] == 'Third "quoted"\nline'
+
+def test_messages_export_gzip(client):
+    import gzip
+
+    seed_export_messages(client)
+
+    with client.stream("GET", "/messages/export", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+
+    assert gzip.decompress(raw).decode() == client.get(
+        "/messages/export", headers={"Accept-Encoding": "identity"}
+    ).text
+
+def test_messages_export_honours_gzip_q_values(client):
+    from app.main import accepts_gzip
+
+    seed_export_messages(client)
+    for accept_encoding, gzipped in (("gzip;q=0", False), ("gzip; q=0.0, identity", False),
+                                     ("br, gzip;q=0.5", True), ("*", True), ("*, gzip;q=0", False),
+                                     ("identity", False), ("GZIP;Q=1", True)):
+        assert accepts_gzip(accept_encoding) is gzipped, accept_encoding
+        with client.stream("GET", "/messages/export", headers={"Accept-Encoding": accept_encoding}) as response:
+            assert ("content-encoding" in response.headers) is gzipped
+            assert response.headers["vary"] == "Accept-Encoding"
+
+def test_messages_export_closes_stream_on_disconnect():
+    import asyncio
+    from app.main import BlockingStreamingResponse, gzip_chunks
+    from app.storage import encode_export
+
+    closed = []
+
+    def rows():
+        try:
+            for index in range(10_000):
+                yield (json.dumps({"message_id": f"m{index}"}),)
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        disconnected = asyncio.Event()
+        sent = []
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message.get("body"):
+                disconnected.set()
+                await asyncio.sleep(0.01)
+
+        chunks = gzip_chunks(encode_export(rows(), "ndjson", 10))
+        await BlockingStreamingResponse(chunks)({"type": "http"}, receive, send)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert closed == [True]
+    assert len(sent) < 100
+    assert sent[-1].get("more_body", True)
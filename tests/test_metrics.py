@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+
+import pytest
+
+from app.metrics import MetricsCollector
+
+def record_in_worker(directory: str):
+    worker = MetricsCollector(directory)
+    worker.describe('jobs_total', 'counter', 'Jobs')
+    worker.describe('queue_depth', 'gauge', 'Queue depth')
+    worker.inc_counter('jobs_total', 2, labels='kind="a"')
+    worker.set_gauge('queue_depth', 7)
+    worker.observe_latency(250, "/webhook", "POST")
+
+def test_in_process_metrics_render():
+    collector = MetricsCollector()
+    requests_total, latency = collector.http_handles("/webhook", "POST", 200)
+    requests_total.inc()
+    latency.observe(50)
+    latency.observe(250)
+    latency.observe(900)
+
+    text = collector.generate_metrics()
+    assert 'http_requests_total{path="/webhook",status="200"} 1' in text
+    assert 'request_latency_ms_bucket{path="/webhook",method="POST",le="100"} 1' in text
+    assert 'request_latency_ms_bucket{path="/webhook",method="POST",le="500"} 2' in text
+    assert 'request_latency_ms_bucket{path="/webhook",method="POST",le="+Inf"} 3' in text
+    assert 'request_latency_ms_sum{path="/webhook",method="POST"} 1200' in text
+    assert 'request_latency_ms_count{path="/webhook",method="POST"} 3' in text
+
+def test_handles_are_resolved_once():
+    collector = MetricsCollector()
+    assert collector.http_handles("/stats", "GET", 200) is collector.http_handles("/stats", "GET", 200)
+    assert collector.counter("jobs_total", 'kind="a"') is collector.counter("jobs_total", 'kind="a"')
+
+def test_counters_from_threads_are_merged():
+    import threading
+
+    collector = MetricsCollector()
+    counter = collector.counter("http_requests_total", 'path="/",status="200"')
+    threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 'http_requests_total{path="/",status="200"} 4000' in collector.generate_metrics()
+
+def test_rendered_text_is_reused_until_a_write():
+    collector = MetricsCollector(latency_buckets=(1, 10))
+    first = collector.generate_metrics()
+    assert collector.generate_metrics() is first
+
+    collector.observe_latency(5, "/", "GET")
+    second = collector.generate_metrics()
+    assert second is not first
+    assert 'request_latency_ms_bucket{path="/",method="GET",le="10"} 1' in second
+
+def test_multiprocess_metrics_aggregate_workers(tmp_path):
+    directory = str(tmp_path)
+    process = multiprocessing.get_context("spawn").Process(target=record_in_worker, args=(directory,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    collector = MetricsCollector(directory)
+    collector.describe('jobs_total', 'counter', 'Jobs')
+    collector.describe('queue_depth', 'gauge', 'Queue depth')
+    collector.inc_counter('jobs_total', 1, labels='kind="a"')
+    collector.set_gauge('queue_depth', 3)
+    collector.observe_latency(50, "/webhook", "POST")
+
+    text = collector.generate_metrics()
+    assert 'jobs_total{kind="a"} 3' in text
+    assert 'queue_depth 3' in text
+    assert 'request_latency_ms_bucket{path="/webhook",method="POST",le="100"} 1' in text
+    assert 'request_latency_ms_bucket{path="/webhook",method="POST",le="500"} 2' in text
+    assert 'request_latency_ms_count{path="/webhook",method="POST"} 2' in text
+
+def test_multiprocess_file_survives_reopen(tmp_path):
+    first = MetricsCollector(str(tmp_path))
+    first.inc_counter('http_requests_total', 5, labels='path="/",status="200"')
+    first.store._own().close()
+
+    second = MetricsCollector(str(tmp_path))
+    second.inc_counter('http_requests_total', 1, labels='path="/",status="200"')
+    assert 'http_requests_total{path="/",status="200"} 6' in second.generate_metrics()
+
+def test_multiprocess_handles_write_at_resolved_offset(tmp_path):
+    collector = MetricsCollector(str(tmp_path))
+    counter = collector.counter('http_requests_total', 'path="/",status="200"')
+    counter.inc()
+    slot = counter.slot
+    values = collector.store._own()
+    assert (slot.values, slot.pos) == (values, values.position(counter.key))
+    counter.inc(2)
+    assert slot.values is values
+    assert 'http_requests_total{path="/",status="200"} 3' in collector.generate_metrics()
+
+def test_multiprocess_slots_reresolve_after_fork(tmp_path):
+    if not hasattr(os, "fork"):
+        pytest.skip("needs fork")
+    collector = MetricsCollector(str(tmp_path))
+    counter = collector.counter('http_requests_total', 'path="/",status="200"')
+    counter.inc()
+
+    process = multiprocessing.get_context("fork").Process(target=counter.inc, args=(2,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    counter.inc()
+    assert len(os.listdir(tmp_path)) == 2
+    assert 'http_requests_total{path="/",status="200"} 4' in collector.generate_metrics()
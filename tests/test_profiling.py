@@ -0,0 +1,102 @@
+import json
+import os
+import pstats
+
+from app import main, profiling
+from app.config import config
+from app.metrics import metrics
+from app.profiling import SlowRequestProfiler, phase
+from tests.conftest import compute_signature
+
+def post_message(client, message_id: str):
+    body = json.dumps({
+        "message_id": message_id,
+        "from": "+919876543210",
+        "to": "+919876543211",
+        "ts": "2025-01-15T10:00:00+05:30",
+        "text": "Hello"
+    })
+    return client.post(
+        "/webhook",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Signature": compute_signature(body)}
+    )
+
+def test_phase_is_a_no_op_outside_timed_requests():
+    with phase("anything"):
+        pass
+    assert phase("a") is phase("b")
+
+def test_phases_are_collected_per_request():
+    token = profiling.start_request()
+    with phase("work"):
+        pass
+    profiling.record("queued", 1.5)
+    timings = profiling.finish_request(token, "/unit")
+
+    assert [name for name, _ in timings] == ["work", "queued"]
+    assert phase("work") is phase("other")
+    header = profiling.server_timing(timings, 2.0)
+    assert header.startswith("work;dur=")
+    assert header.endswith("queued;dur=1.500, total;dur=2.000")
+
+def test_server_timing_header_lists_webhook_phases(client, monkeypatch):
+    monkeypatch.setattr(main, "phase_timing", True)
+    monkeypatch.setattr(config, "SERVER_TIMING_HEADER", True)
+
+    response = post_message(client, "m-timing")
+
+    assert response.status_code == 200
+    names = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    for expected in ("body_read", "signature", "validation", "dedupe", "insert", "db_insert", "db_commit"):
+        assert expected in names
+    assert names[-1] == "total"
+
+    stats = client.get("/stats")
+    assert "db_query" in stats.headers["Server-Timing"]
+    assert 'request_phase_ms_count{path="/webhook",phase="signature"}' in metrics.generate_metrics()
+
+def test_no_server_timing_header_by_default(client):
+    response = post_message(client, "m-plain")
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+def test_phase_histograms_without_header(client, monkeypatch):
+    monkeypatch.setattr(main, "phase_timing", True)
+    monkeypatch.setattr(config, "SERVER_TIMING_HEADER", False)
+
+    response = client.get("/messages")
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert 'request_phase_ms_count{path="/messages",phase="db_query"}' in metrics.generate_metrics()
+
+def test_slow_request_profiler_keeps_slowest(tmp_path):
+    profiler = SlowRequestProfiler(str(tmp_path), keep=2, sample_rate=1)
+    for latency_ms in (5.0, 50.0, 1.0, 20.0):
+        profile = profiler.start()
+        assert profile is not None
+        profiler.finish(profile, latency_ms, "GET", "/messages", f"req-{latency_ms}")
+
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 2
+    assert "req-50.0" in files[1] and "req-20.0" in files[0]
+    pstats.Stats(str(tmp_path / files[0]))
+
+def test_slow_request_profiler_samples(tmp_path):
+    profiler = SlowRequestProfiler(str(tmp_path), keep=5, sample_rate=0.25)
+    started = [profiler.start() for _ in range(4)]
+    assert sum(profile is not None for profile in started) == 1
+    profile = next(profile for profile in started if profile is not None)
+    profiler.finish(profile, 3.0, "POST", "/webhook", "req")
+    assert len(os.listdir(tmp_path)) == 1
+
+def test_profiles_are_captured_through_the_middleware(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "slow_profiler", SlowRequestProfiler(str(tmp_path), keep=1, sample_rate=1))
+
+    assert post_message(client, "m-profiled").status_code == 200
+    assert client.get("/stats").status_code == 200
+
+    files = os.listdir(tmp_path)
+    assert len(files) == 1
+    assert files[0].endswith(".prof")
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from app.read_cache import ReadCache, etag_matches, make_etag
+from tests.conftest import compute_signature
+
+def post_message(client, message_id: str):
+    body = json.dumps({
+        "message_id": message_id,
+        "from": "+919876543210",
+        "to": "+919876543211",
+        "ts": "2025-01-15T10:00:00+05:30",
+        "text": "Hello"
+    })
+    response = client.post(
+        "/webhook",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Signature": compute_signature(body)}
+    )
+    assert response.status_code == 200
+
+def test_read_cache_invalidates_on_generation_change():
+    cache = ReadCache(max_entries=8)
+
+    assert cache.get("stats", ("stats",), 0) is None
+    cache.put(("stats",), 0, b"{}")
+    assert cache.get("stats", ("stats",), 0).body == b"{}"
+
+    assert cache.get("stats", ("stats",), 1) is None
+
+@pytest.mark.parametrize("shards", [0, 3])
+def test_cache_generation_sees_other_connections(tmp_path, shards):
+    from app.sharding import ShardedDatabase
+    from app.storage import Database
+
+    def open_store():
+        path = str(tmp_path / "app.db")
+        return ShardedDatabase.open(path, shards) if shards else Database(path)
+
+    reader, other_process = open_store(), open_store()
+    try:
+        cache = ReadCache(max_entries=8)
+        cache.put(("stats",), reader.cache_generation(), reader.get_stats_json())
+        assert cache.get("stats", ("stats",), reader.cache_generation()) is not None
+
+        other_process.insert_message("m1", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "hi")
+        assert reader.write_generation == 0
+        assert cache.get("stats", ("stats",), reader.cache_generation()) is None
+    finally:
+        reader.close()
+        other_process.close()
+
+def test_read_cache_evicts_least_recently_used():
+    cache = ReadCache(max_entries=2)
+    cache.put(("a",), 0, b"a")
+    cache.put(("b",), 0, b"b")
+    assert cache.get("x", ("a",), 0) is not None
+    cache.put(("c",), 0, b"c")
+
+    assert cache.get("x", ("b",), 0) is None
+    assert cache.get("x", ("a",), 0) is not None
+    assert cache.get("x", ("c",), 0) is not None
+
+def test_read_cache_honours_max_age(monkeypatch):
+    from app import read_cache
+
+    now = [100.0]
+    monkeypatch.setattr(read_cache.time, "monotonic", lambda: now[0])
+    cache = ReadCache(max_entries=2, max_age_ms=500)
+    cache.put(("a",), 0, b"a")
+
+    now[0] += 0.4
+    assert cache.get("x", ("a",), 0) is not None
+    now[0] += 0.2
+    assert cache.get("x", ("a",), 0) is None
+
+def test_etag_matching():
+    etag = make_etag(b"body")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(make_etag(b"other"), etag)
+
+def test_stats_etag_and_not_modified(client):
+    first = client.get("/stats")
+    etag = first.headers["etag"]
+
+    repeat = client.get("/stats", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert repeat.headers["etag"] == etag
+
+    post_message(client, "m1")
+    changed = client.get("/stats", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["total_messages"] == 1
+    assert changed.headers["etag"] != etag
+
+def test_messages_cache_is_keyed_by_parameters(client):
+    post_message(client, "m1")
+    post_message(client, "m2")
+
+    page = client.get("/messages", params={"limit": 1, "offset": 0})
+    same = client.get("/messages", params={"offset": 0, "limit": 1})
+    other = client.get("/messages", params={"limit": 1, "offset": 1})
+
+    assert page.headers["etag"] == same.headers["etag"]
+    assert page.json()["data"][0]["message_id"] == "m1"
+    assert other.json()["data"][0]["message_id"] == "m2"
+
+    assert client.get("/messages", params={"cursor": "!!"}).status_code == 400
+
+def test_read_cache_hits_are_counted(client):
+    client.get("/stats")
+    client.get("/stats")
+
+    text = client.get("/metrics").text
+    assert 'read_cache_lookups_total{endpoint="stats",result="hit"}' in text
+    assert 'read_cache_lookups_total{endpoint="stats",result="miss"}' in text
+
+def test_generation_is_read_on_the_read_pool(client, monkeypatch):
+    import threading
+    from app import main
+
+    threads = []
+    cache_generation = main.async_db.db.cache_generation
+
+    def tracking_cache_generation():
+        threads.append(threading.current_thread().name)
+        return cache_generation()
+
+    monkeypatch.setattr(main.async_db.db, "cache_generation", tracking_cache_generation)
+    assert client.get("/stats").status_code == 200
+    assert client.get("/stats").status_code == 200
+    assert len(threads) == 3
+    assert all(name.startswith("db-read") for name in threads)
@@ -0,0 +1,111 @@
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from app.async_storage import AsyncDatabase
+from app.metrics import metrics
+from app.retention import RetentionWorker
+from app.storage import Database
+
+OLD_TS = "2020-01-15T10:00:00+05:30"
+NEW_TS = "2099-01-15T10:00:00+05:30"
+CUTOFF_MS = 1700000000000
+
+def seed(db, count: int, ts: str, prefix: str, padding: int = 0):
+    db.insert_messages([
+        (f"{prefix}{i:04d}", "+919876543210", "+919876543211", ts, f"hello {prefix}{i:04d}" + "x" * padding)
+        for i in range(count)
+    ])
+
+def purged_total() -> float:
+    for line in metrics.generate_metrics().splitlines():
+        if line.startswith("retention_rows_purged_total "):
+            return float(line.split()[1])
+    return 0.0
+
+def test_new_databases_use_incremental_vacuum(db):
+    with db.get_connection() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def test_purge_expired_deletes_one_bounded_batch(db):
+    seed(db, 5, OLD_TS, "old")
+    seed(db, 2, NEW_TS, "new")
+
+    archived = []
+    assert db.purge_expired(CUTOFF_MS, batch_size=3, archive=archived.extend) == 3
+    assert [json.loads(line)["message_id"] for line in archived] == ["old0000", "old0001", "old0002"]
+    assert json.loads(archived[0])["created_at"]
+
+    assert db.purge_expired(CUTOFF_MS, batch_size=3) == 2
+    assert db.purge_expired(CUTOFF_MS, batch_size=3) == 0
+
+    stats = db.get_stats()
+    assert stats["total_messages"] == 2
+    assert stats["first_message_ts"] == NEW_TS
+    assert db.get_messages(q="hello old")["total"] == 0
+
+def test_purge_expired_keeps_rows_when_archive_fails(db):
+    seed(db, 2, OLD_TS, "old")
+
+    def broken_archive(lines):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        db.purge_expired(CUTOFF_MS, archive=broken_archive)
+    assert db.get_stats()["total_messages"] == 2
+
+def test_enable_incremental_vacuum_converts_and_keeps_search(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum = NONE")
+    conn.execute("CREATE TABLE placeholder (x)")
+    conn.commit()
+    conn.close()
+
+    legacy = Database(path)
+    seed(legacy, 50, OLD_TS, "old")
+    with legacy.get_connection() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+
+    assert legacy.enable_incremental_vacuum()
+    assert not legacy.enable_incremental_vacuum()
+    with legacy.get_connection() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert legacy.get_messages(q="hello old0042")["total"] == 1
+    legacy.close()
+
+@pytest.mark.asyncio
+async def test_retention_pass_archives_purges_and_vacuums(db, tmp_path):
+    seed(db, 300, OLD_TS, "old", padding=4000)
+    seed(db, 3, NEW_TS, "new")
+
+    purged_before = purged_total()
+    archive_dir = tmp_path / "archive"
+    async_db = AsyncDatabase(db)
+    worker = RetentionWorker(async_db, retention_days=365, batch_size=100,
+                             batch_pause_ms=0, archive_dir=str(archive_dir), vacuum_pages=10)
+    try:
+        assert await worker.run_once() == 300
+        assert await worker.run_once() == 0
+    finally:
+        async_db.close()
+
+    segments = list(archive_dir.iterdir())
+    assert len(segments) == 1
+    with gzip.open(segments[0], "rt") as archive:
+        assert len(archive.read().splitlines()) == 300
+
+    assert db.get_stats()["total_messages"] == 3
+    assert purged_total() - purged_before == 300
+    with db.get_connection() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+@pytest.mark.asyncio
+async def test_retention_worker_stops_promptly(db):
+    async_db = AsyncDatabase(db)
+    worker = RetentionWorker(async_db, retention_days=1, interval_s=3600)
+    await worker.start()
+    await worker.stop()
+    async_db.close()
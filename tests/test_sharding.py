@@ -0,0 +1,99 @@
+import pytest
+
+from app.sharding import ShardedDatabase, shard_paths
+from app.storage import Database
+
+SENDERS = ["+919876543210", "+919876543211", "+919123456789", "+919000000001", "+919000000002"]
+
+def rows(count: int = 40):
+    return [
+        (f"m{i:03d}", SENDERS[i % len(SENDERS)], "+919876543211",
+         f"2025-01-{15 + i % 3:02d}T10:{i % 7:02d}:00+05:30", f"hello {i}" if i % 4 else None)
+        for i in range(count)
+    ]
+
+@pytest.fixture(params=["from", "message_id"])
+def stores(request, tmp_path):
+    single = Database(str(tmp_path / "single.db"))
+    sharded = ShardedDatabase.open(str(tmp_path / "app.db"), 3, request.param)
+    data = rows()
+    assert sharded.insert_messages(data) == single.insert_messages(data)
+    yield single, sharded
+    single.close()
+    sharded.close()
+
+def test_pages_match_single_database(stores):
+    single, sharded = stores
+    for kwargs in ({}, {"limit": 7}, {"limit": 5, "offset": 9}, {"limit": 5, "total_mode": "none"},
+                   {"from_filter": SENDERS[1]}, {"q": "hello 1"}, {"total_mode": "estimate"},
+                   {"since": "2025-01-16T00:00:00+05:30", "until": "2025-01-17T10:03:00+05:30"}):
+        assert sharded.get_messages_json(**kwargs) == single.get_messages_json(**kwargs)
+
+    cursor = None
+    while True:
+        page = sharded.get_messages(limit=6, cursor=cursor)
+        assert page == single.get_messages(limit=6, cursor=cursor)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+def test_stats_and_exports_match_single_database(stores):
+    single, sharded = stores
+    assert sharded.get_stats() == single.get_stats()
+    assert sharded.get_stats_json() == single.get_stats_json()
+    for fmt in ("ndjson", "csv"):
+        for kwargs in ({}, {"after": "m007"}, {"from_filter": SENDERS[2]}):
+            assert b"".join(sharded.export_messages(fmt, batch_size=4, **kwargs)) == \
+                b"".join(single.export_messages(fmt, batch_size=4, **kwargs))
+    with pytest.raises(ValueError):
+        sharded.export_messages(after="missing")
+
+def test_messages_are_routed_by_shard_key(tmp_path):
+    sharded = ShardedDatabase.open(str(tmp_path / "app.db"), 3, "from")
+    try:
+        sharded.insert_messages(rows())
+        for sender in SENDERS:
+            holding = [shard for shard in sharded.shards if shard.get_messages(from_filter=sender)["total"]]
+            assert holding == [sharded.shards[sharded.shard_for("", sender)]]
+        assert sum(shard.get_stats()["total_messages"] for shard in sharded.shards) == 40
+        assert sharded.insert_message("m001", SENDERS[1], "+919876543211", "2025-01-15T10:00:00+05:30", "x") is False
+    finally:
+        sharded.close()
+
+def test_layout_change_is_rejected(tmp_path):
+    path = str(tmp_path / "app.db")
+    ShardedDatabase.open(path, 2, "from").close()
+    with pytest.raises(RuntimeError):
+        ShardedDatabase.open(path, 2, "message_id")
+    assert [p.endswith(f".shard{i}.db") for i, p in enumerate(shard_paths(path, 2))] == [True, True]
+
+def test_purge_drains_every_shard(stores):
+    _, sharded = stores
+    generation = sharded.write_generation
+    cutoff = 1736955000000  # 2025-01-15T21:00:00+05:30, after every message of the 15th
+    purged = []
+    while True:
+        deleted = sharded.purge_expired(cutoff, 5)
+        purged.append(deleted)
+        if deleted < 5:
+            break
+    assert sum(purged) == 14
+    assert sharded.get_messages(until="2025-01-16T00:00:00+05:30")["total"] == 0
+    assert sharded.write_generation != generation
+
+def test_message_id_is_unique_across_senders_by_default(tmp_path):
+    single = Database(str(tmp_path / "single.db"))
+    sharded = ShardedDatabase.open(str(tmp_path / "app.db"), 3)
+    try:
+        data = [
+            (f"m{i % 7}", sender, "+919876543211", "2025-01-15T10:00:00+05:30", "hi")
+            for i, sender in enumerate(SENDERS * 3)
+        ]
+        assert sharded.insert_messages(data) == single.insert_messages(data)
+        assert sharded.insert_message("m0", SENDERS[4], "+919876543211", "2025-01-15T10:00:00+05:30", "x") is False
+        assert sharded.get_stats() == single.get_stats()
+        assert sharded.get_messages(limit=100) == single.get_messages(limit=100)
+        assert sharded.get_stats()["total_messages"] == 7
+    finally:
+        single.close()
+        sharded.close()
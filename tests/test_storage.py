@@ -0,0 +1,263 @@
+import sqlite3
+import pytest
+
+from app.storage import Database
+
+def test_wal_journal_mode(db):
+    with db.get_connection() as conn:
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode.lower() == "wal"
+
+def test_connections_are_reused(db):
+    with db.get_connection() as first:
+        pass
+    with db.get_connection() as second:
+        pass
+    assert first is second
+
+    with db.get_connection(readonly=True) as reader:
+        pass
+    assert reader is not first
+
+def test_readonly_connection_rejects_writes(db):
+    with pytest.raises(sqlite3.OperationalError):
+        with db.get_connection(readonly=True) as conn:
+            conn.execute("DELETE FROM messages")
+
+def test_reader_sees_committed_insert(db):
+    assert db.insert_message("m1", "+919876543210", "+919876543211",
+                             "2025-01-15T10:00:00+05:30", "Hello")
+    assert not db.insert_message("m1", "+919876543210", "+919876543211",
+                                 "2025-01-15T10:00:00+05:30", "Hello")
+    assert db.get_messages()["total"] == 1
+
+def test_close_reopens_lazily(db):
+    db.close()
+    assert db.is_healthy()
+
+def seed(db, message_id: str, text: str, ts: str = "2025-01-15T10:00:00+05:30"):
+    db.insert_message(message_id, "+919876543210", "+919876543211", ts, text)
+
+def search_ids(db, q: str):
+    return [m["message_id"] for m in db.get_messages(q=q)["data"]]
+
+def test_fts_search_matches_substrings(db):
+    seed(db, "m1", "Hello World")
+    seed(db, "m2", "Goodbye")
+    seed(db, "m3", "say hello again")
+    seed(db, "m4", None)
+
+    assert db.fts_tokenizer == "trigram"
+    assert search_ids(db, "hello") == ["m1", "m3"]
+    assert search_ids(db, "llo wor") == ["m1"]
+    assert search_ids(db, "He") == ["m1", "m3"]
+    assert search_ids(db, '"quoted"') == []
+    assert db.get_messages(q="Hello")["total"] == 2
+
+def test_fts_search_keeps_like_case_rules(db):
+    seed(db, "m1", "naïve café école")
+    seed(db, "m2", "NAÏVE")
+
+    # LIKE only folds ASCII letters; the trigram index folds all of them.
+    assert search_ids(db, "NAÏVE") == ["m2"]
+    assert search_ids(db, "naÏve") == ["m2"]
+    assert search_ids(db, "NAïVE") == ["m1"]
+    assert search_ids(db, "CAFÉ") == []
+    assert search_ids(db, "École") == []
+    assert search_ids(db, "CAFé") == ["m1"]
+    assert search_ids(db, "É") == []
+
+def test_fts_backfills_existing_rows(tmp_path, monkeypatch):
+    from app.config import config
+
+    path = str(tmp_path / "app.db")
+    monkeypatch.setattr(config, "FTS_TOKENIZER", "none")
+    plain = Database(path)
+    seed(plain, "m1", "Hello World")
+    assert plain.fts_tokenizer is None
+    assert search_ids(plain, "World") == ["m1"]
+    plain.close()
+
+    monkeypatch.setattr(config, "FTS_TOKENIZER", "trigram")
+    indexed = Database(path)
+    assert indexed.fts_tokenizer == "trigram"
+    assert search_ids(indexed, "World") == ["m1"]
+    indexed.close()
+
+def test_fts_delete_keeps_index_in_sync(db):
+    seed(db, "m1", "Hello World")
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM messages WHERE message_id = 'm1'")
+        conn.commit()
+        conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')")
+
+    assert search_ids(db, "Hello") == []
+
+def test_stats_aggregates_follow_inserts_and_deletes(db):
+    db.insert_message("m1", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "a")
+    db.insert_message("m2", "+919876543210", "+919876543211", "2025-01-15T09:00:00+05:30", "b")
+    db.insert_message("m3", "+919123456789", "+919876543211", "2025-01-15T11:00:00+05:30", "c")
+    db.insert_message("m3", "+919123456789", "+919876543211", "2025-01-15T11:00:00+05:30", "c")
+
+    stats = db.get_stats()
+    assert stats["total_messages"] == 3
+    assert stats["senders_count"] == 2
+    assert stats["messages_per_sender"] == [
+        {"from": "+919876543210", "count": 2},
+        {"from": "+919123456789", "count": 1},
+    ]
+    assert stats["first_message_ts"] == "2025-01-15T09:00:00+05:30"
+    assert stats["last_message_ts"] == "2025-01-15T11:00:00+05:30"
+
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM messages WHERE message_id IN ('m2', 'm3')")
+        conn.commit()
+
+    stats = db.get_stats()
+    assert stats["total_messages"] == 1
+    assert stats["senders_count"] == 1
+    assert stats["first_message_ts"] == "2025-01-15T10:00:00+05:30"
+    assert stats["last_message_ts"] == "2025-01-15T10:00:00+05:30"
+
+def test_rebuild_aggregates_matches_messages(db):
+    seed(db, "m1", "a")
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM sender_stats")
+        conn.execute("UPDATE message_totals SET total_messages = 0, senders_count = 0")
+        conn.commit()
+
+    db.rebuild_aggregates()
+    stats = db.get_stats()
+    assert stats["total_messages"] == 1
+    assert stats["messages_per_sender"] == [{"from": "+919876543210", "count": 1}]
+
+def fastapi_body(model_cls, content) -> bytes:
+    # What FastAPI sends for a response_model route returning ``content``.
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    model = model_cls.model_validate(content)
+    return JSONResponse(jsonable_encoder(model.model_dump(by_alias=True))).body
+
+def test_messages_json_matches_response_model(db):
+    from app.models import MessagesListResponse
+
+    seed(db, "m1", "plain")
+    seed(db, "m2", 'quotes " and \\ slashes / tabs\t newlines\n \x01 ünïcødé 😀')
+    db.insert_message("m3", "+919123456789", "+919876543211", "2025-01-16T10:00:00+05:30", None)
+
+    for kwargs in ({}, {"limit": 2}, {"limit": 1, "offset": 1, "total_mode": "none"},
+                   {"from_filter": "+919123456789"}, {"q": "plain"}):
+        expected = fastapi_body(MessagesListResponse, db.get_messages(**kwargs))
+        assert db.get_messages_json(**kwargs) == expected
+
+    page = db.get_messages(limit=1)
+    assert db.get_messages_json(limit=1, cursor=page["next_cursor"]) == \
+        fastapi_body(MessagesListResponse, db.get_messages(limit=1, cursor=page["next_cursor"]))
+
+def test_stats_json_matches_response_model(db):
+    from app.models import StatsResponse
+
+    assert db.get_stats_json() == fastapi_body(StatsResponse, db.get_stats())
+
+    seed(db, "m1", "one")
+    seed(db, "m2", "two", ts="2025-01-16T10:00:00+05:30")
+    db.insert_message("m3", "+919123456789", "+919876543211", "2025-01-17T10:00:00+05:30", None)
+    assert db.get_stats_json() == fastapi_body(StatsResponse, db.get_stats())
+
+def test_export_streams_in_batches_on_its_own_connection(db):
+    for i in range(5):
+        seed(db, f"m{i}", f"text {i}", ts=f"2025-01-15T10:00:0{i}+05:30")
+
+    chunks = db.export_messages(batch_size=2)
+    first = next(chunks)
+    assert first.count(b"\n") == 2
+
+    seed(db, "m9", "written during the export", ts="2025-01-15T10:00:09+05:30")
+    rest = b"".join(chunks)
+    assert (first + rest).count(b"\n") == 5
+
+    with pytest.raises(ValueError):
+        db.export_messages(after="missing")
+
+def test_ts_epoch_backfilled_for_existing_databases(tmp_path):
+    path = str(tmp_path / "app.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE messages (
+            message_id TEXT PRIMARY KEY, from_msisdn TEXT NOT NULL, to_msisdn TEXT NOT NULL,
+            ts TEXT NOT NULL, text TEXT, created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_ts ON messages(ts)")
+    conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", [
+        ("m1", "+919876543210", "+919876543211", "2025-01-15T10:00:00.500+05:30", "a", "x"),
+        ("m2", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "b", "x"),
+    ])
+    conn.commit()
+    conn.close()
+
+    migrated = Database(path)
+    with migrated.get_connection() as conn:
+        rows = dict(conn.execute("SELECT message_id, ts_epoch_ms FROM messages").fetchall())
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(messages)")}
+    assert rows == {"m1": 1736915400500, "m2": 1736915400000}
+    assert "idx_ts" not in indexes
+    assert "idx_ts_epoch_message_id" in indexes
+
+    assert [m["message_id"] for m in migrated.get_messages()["data"]] == ["m2", "m1"]
+    stats = migrated.get_stats()
+    assert stats["first_message_ts"] == "2025-01-15T10:00:00+05:30"
+    assert stats["last_message_ts"] == "2025-01-15T10:00:00.500+05:30"
+    migrated.close()
+
+def test_since_and_until_compare_instants(db):
+    # Lexically "10:00:00.5+05:30" < "10:00:00Z", but it is 5.5 hours earlier.
+    seed(db, "m1", "a", ts="2025-01-15T10:00:00.5+05:30")
+    seed(db, "m2", "b", ts="2025-01-15T12:00:00+05:30")
+    seed(db, "m3", "c", ts="2025-01-15T16:00:00+05:30")
+
+    def ids(**kwargs):
+        return [m["message_id"] for m in db.get_messages(**kwargs)["data"]]
+
+    assert ids(since="2025-01-15T06:30:00Z") == ["m2", "m3"]
+    assert ids(since="2025-01-15T10:00:00.5+05:30", until="2025-01-15T16:00:00+05:30") == ["m1", "m2"]
+    assert ids(until="2025-01-15T12:00:00") == ["m1"]
+    with pytest.raises(ValueError):
+        db.get_messages(since="yesterday")
+
+def test_stats_first_and_last_follow_epoch(db):
+    seed(db, "m1", "a", ts="2025-01-15T12:00:00+05:30")
+    seed(db, "m2", "b", ts="2025-01-15T09:00:00.25+05:30")
+    seed(db, "m3", "c", ts="2025-01-15T09:00:00+05:30")
+
+    stats = db.get_stats()
+    assert stats["first_message_ts"] == "2025-01-15T09:00:00+05:30"
+    assert stats["last_message_ts"] == "2025-01-15T12:00:00+05:30"
+
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM messages WHERE message_id = 'm3'")
+        conn.commit()
+    assert db.get_stats()["first_message_ts"] == "2025-01-15T09:00:00.25+05:30"
+
+def test_legacy_string_cursor_still_accepted(db):
+    import base64
+    import json
+
+    seed(db, "m1", "a", ts="2025-01-15T09:00:00+05:30")
+    seed(db, "m2", "b", ts="2025-01-15T10:00:00+05:30")
+    legacy = base64.urlsafe_b64encode(
+        json.dumps(["2025-01-15T09:00:00+05:30", "m1"]).encode()
+    ).decode().rstrip("=")
+
+    assert [m["message_id"] for m in db.get_messages(cursor=legacy)["data"]] == ["m2"]
+
+def test_page_query_uses_epoch_index(db):
+    with db.get_connection(readonly=True) as conn:
+        plan = " ".join(row[3] for row in conn.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT message_id FROM messages WHERE ts_epoch_ms >= ?
+            ORDER BY ts_epoch_ms, message_id LIMIT 10
+        """, (0,)))
+    assert "idx_ts_epoch_message_id" in plan
+    assert "TEMP B-TREE" not in plan
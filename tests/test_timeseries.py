@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from app.config import config
+from app.logstore import LogStore
+from app.sharding import ShardedDatabase
+from app.storage import Database
+from tests.conftest import compute_signature
+
+ROWS = [
+    ("m1", "+919876543210", "+919876543211", "2025-01-15T10:05:00+05:30", "a"),
+    ("m2", "+919876543210", "+919876543211", "2025-01-15T10:05:30+05:30", "b"),
+    ("m3", "+919123456789", "+919876543211", "2025-01-15T10:59:00+05:30", "c"),
+    ("m4", "+919123456789", "+919876543211", "2025-01-15T11:00:00+05:30", None),
+    ("m5", "+919876543210", "+919876543211", "2025-01-16T00:10:00+05:30", "d"),
+]
+
+def points(body: bytes) -> list[tuple[str, int]]:
+    return [(point["start"], point["count"]) for point in json.loads(body)["data"]]
+
+def post_message(client, message_id: str, ts: str):
+    body = json.dumps({
+        "message_id": message_id,
+        "from": "+919876543210",
+        "to": "+919876543211",
+        "ts": ts,
+        "text": "Hello"
+    })
+    return client.post(
+        "/webhook",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Signature": compute_signature(body)}
+    )
+
+@pytest.fixture(params=["sqlite", "logstore", "sharded"])
+def store(request, tmp_path):
+    if request.param == "logstore":
+        backend = LogStore(str(tmp_path / "log"))
+    elif request.param == "sharded":
+        backend = ShardedDatabase.open(str(tmp_path / "app.db"), 3)
+    else:
+        backend = Database(str(tmp_path / "app.db"))
+    backend.insert_messages(ROWS)
+    yield backend
+    backend.close()
+
+def test_buckets_are_aligned_to_ist(store):
+    assert points(store.get_timeseries_json("hour")) == [
+        ("2025-01-15T10:00:00+05:30", 3),
+        ("2025-01-15T11:00:00+05:30", 1),
+        ("2025-01-16T00:00:00+05:30", 1),
+    ]
+    assert points(store.get_timeseries_json("day", from_filter="+919876543210")) == [
+        ("2025-01-15T00:00:00+05:30", 2),
+        ("2025-01-16T00:00:00+05:30", 1),
+    ]
+    assert json.loads(store.get_timeseries_json("minute"))["total"] == 5
+
+def test_range_includes_overlapping_buckets(store):
+    # since falls inside the 10:05 minute and until is exclusive.
+    assert store.get_timeseries(
+        "minute", since="2025-01-15T10:05:45+05:30", until="2025-01-15T11:00:00+05:30"
+    ) == [(1736915700000, 2), (1736918940000, 1)]
+    assert store.get_timeseries("hour", from_filter="+919000000000") == []
+    with pytest.raises(ValueError):
+        store.get_timeseries("week")
+    with pytest.raises(ValueError):
+        store.get_timeseries("hour", since="yesterday")
+
+def test_purge_and_rebuild_keep_rollups_exact(store):
+    assert store.purge_expired(1736916000000, 10) == 2  # before 10:10 IST on the 15th
+    expected = [("2025-01-15T10:00:00+05:30", 1), ("2025-01-15T11:00:00+05:30", 1),
+                ("2025-01-16T00:00:00+05:30", 1)]
+    assert points(store.get_timeseries_json("hour")) == expected
+    assert points(store.get_timeseries_json("minute", from_filter="+919876543210")) == [
+        ("2025-01-16T00:10:00+05:30", 1)
+    ]
+    store.rebuild_aggregates()
+    assert points(store.get_timeseries_json("hour")) == expected
+
+def test_offset_change_rebuilds_rollups(tmp_path, monkeypatch):
+    path = str(tmp_path / "app.db")
+    first = Database(path)
+    first.insert_messages(ROWS)
+    first.close()
+
+    monkeypatch.setattr(config, "ROLLUP_UTC_OFFSET_MINUTES", 0)
+    reopened = Database(path)
+    try:
+        # 00:10 IST on the 16th is still the 15th in UTC.
+        assert points(reopened.get_timeseries_json("day")) == [("2025-01-15T00:00:00+00:00", 5)]
+    finally:
+        reopened.close()
+
+def test_timeseries_endpoint(client):
+    for index, ts in enumerate(["2025-01-15T10:05:00+05:30", "2025-01-15T10:40:00+05:30",
+                                "2025-01-15T12:00:00+05:30"]):
+        assert post_message(client, f"m-ts-{index}", ts).status_code == 200
+
+    response = client.get("/stats/timeseries", params={"bucket": "hour", "from": "+919876543210"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "bucket": "hour",
+        "total": 3,
+        "data": [
+            {"start": "2025-01-15T10:00:00+05:30", "count": 2},
+            {"start": "2025-01-15T12:00:00+05:30", "count": 1},
+        ],
+    }
+    assert client.get("/stats/timeseries").json()["bucket"] == "hour"
+    assert client.get("/stats/timeseries", params={"bucket": "week"}).status_code == 422
+    assert client.get("/stats/timeseries", params={"since": "not-a-time"}).status_code == 400
+
+    etag = response.headers["ETag"]
+    cached = client.get("/stats/timeseries", params={"bucket": "hour", "from": "+919876543210"},
+                        headers={"If-None-Match": etag})
+    assert cached.status_code == 304
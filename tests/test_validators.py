@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+
+from app.models import WebhookMessage, validate_payload, validate_many
+from app.validators import is_valid_ist_timestamp
+
+
+def fromisoformat_accepts(value):
+    if not value.endswith("+05:30"):
+        return False
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def pydantic_outcome(data):
+    try:
+        return WebhookMessage.model_validate(data).model_dump(by_alias=True), None
+    except ValidationError as exc:
+        return None, exc.json()
+
+
+def fast_outcome(data):
+    try:
+        return validate_payload(data).model_dump(by_alias=True), None
+    except ValidationError as exc:
+        return None, exc.json()
+
+
+@pytest.mark.parametrize("value", [
+    "2025-01-15T10:00:00+05:30",
+    "2025-01-15T10:00:00.123+05:30",
+    "2025-01-15T10:00:00.1234567+05:30",
+    "2024-02-29T23:59:59+05:30",
+    "2023-02-29T10:00:00+05:30",
+    "1900-02-29T10:00:00+05:30",
+    "2000-02-29T10:00:00+05:30",
+    "2025-04-31T10:00:00+05:30",
+    "2025-13-01T10:00:00+05:30",
+    "2025-01-15T24:00:00+05:30",
+    "2025-01-15T10:60:00+05:30",
+    "2025-01-15T10:00:60+05:30",
+    "0000-01-01T00:00:00+05:30",
+    "2025-01-15 10:00:00+05:30",
+    "2025-01-15T10:00+05:30",
+    "20250115T100000+05:30",
+    "2025-01-15T10:00:00Z",
+    "2025-01-15T10:00:00+00:00",
+    "2025-01-15T10:00:00",
+    "+05:30",
+    "2025-01-15T10:00:00+05:30+05:30",
+    "２０２５-01-15T10:00:00+05:30",
+])
+def test_timestamp_check_matches_fromisoformat(value):
+    assert is_valid_ist_timestamp(value) == fromisoformat_accepts(value)
+
+
+VALID = {
+    "message_id": "m1",
+    "from": "+919876543210",
+    "to": "+919876543211",
+    "ts": "2025-01-15T10:00:00+05:30",
+    "text": "Hello",
+}
+
+
+@pytest.mark.parametrize("data", [
+    VALID,
+    {k: v for k, v in VALID.items() if k != "text"},
+    {**VALID, "text": None},
+    {**VALID, "text": "x" * 4096},
+    {**VALID, "text": "x" * 4097},
+    {**VALID, "message_id": ""},
+    {**VALID, "message_id": 42},
+    {**VALID, "from": "+14155550100"},
+    {**VALID, "to": "+919876543210\n"},
+    {**VALID, "ts": "2025-01-15T10:00:00Z"},
+    {**VALID, "ts": "2025-02-30T10:00:00+05:30"},
+    {**VALID, "ts": 1736915400},
+    {**VALID, "from_": "+919876543210"},
+    {**VALID, "extra": "ignored"},
+    {k: v for k, v in VALID.items() if k != "to"},
+    [VALID],
+    "not an object",
+    None,
+])
+def test_fast_path_matches_pydantic(data):
+    assert fast_outcome(data) == pydantic_outcome(data)
+
+
+def test_fast_path_returns_webhook_message():
+    message = validate_payload(VALID)
+
+    assert isinstance(message, WebhookMessage)
+    assert message.from_ == VALID["from"]
+    assert message == WebhookMessage.model_validate(VALID)
+    assert message.model_fields_set == WebhookMessage.model_validate(VALID).model_fields_set
+
+
+def test_fast_path_tracks_omitted_text():
+    data = {k: v for k, v in VALID.items() if k != "text"}
+
+    assert validate_payload(data).model_fields_set == WebhookMessage.model_validate(data).model_fields_set
+
+
+def test_validate_many_reports_each_item():
+    results = validate_many([VALID, {**VALID, "ts": "2025-01-15T10:00:00Z"}])
+
+    assert results[0][0].message_id == "m1"
+    assert results[0][1] is None
+    assert results[1][0] is None
+    assert results[1][1].errors()[0]["msg"] == "Value error, Timestamp must be in IST (+05:30)"
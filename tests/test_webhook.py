@@ -1,4 +1,5 @@
 import json
+import time
 from tests.conftest import compute_signature
 
 def test_webhook_invalid_signature(client):
@@ -105,3 +106,128 @@ def test_webhook_missing_signature(client):
     )
 
     assert response.status_code == 401
+
+def test_webhook_duplicate_answered_by_filter(client):
+    from app import main
+
+    body = json.dumps({
+        "message_id": "dedupe-1",
+        "from": "+919876543210",
+        "to": "+919876543211",
+        "ts": "2025-01-15T10:00:00+05:30",
+        "text": "Hello"
+    })
+    headers = {
+        "Content-Type": "application/json",
+        "X-Signature": compute_signature(body)
+    }
+
+    assert client.post("/webhook", data=body, headers=headers).status_code == 200
+    assert main.dedupe.is_duplicate("dedupe-1")
+
+    response = client.post("/webhook", data=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    assert client.get("/messages").json()["total"] == 1
+    assert 'dedupe_lookups_total{result="hit"}' in client.get("/metrics").text
+
+def test_webhook_checks_database_only_for_maybe_seen_ids(client, monkeypatch):
+    from app import main
+
+    for _ in range(100):
+        if main.dedupe.warm:
+            break
+        time.sleep(0.01)
+    main.db.insert_message("stored-1", "+919876543210", "+919876543211", "2025-01-15T10:00:00+05:30", "Hi")
+    main.dedupe.bloom.add("stored-1")
+
+    checked = []
+    has_message = main.async_db.has_message
+
+    async def tracking_has_message(message_id, from_msisdn=""):
+        checked.append(message_id)
+        return await has_message(message_id, from_msisdn)
+
+    monkeypatch.setattr(main.async_db, "has_message", tracking_has_message)
+    for message_id in ("stored-1", "new-1"):
+        body = json.dumps({
+            "message_id": message_id,
+            "from": "+919876543210",
+            "to": "+919876543211",
+            "ts": "2025-01-15T10:00:00+05:30",
+            "text": "Hello"
+        })
+        response = client.post(
+            "/webhook",
+            content=body,
+            headers={"Content-Type": "application/json", "X-Signature": compute_signature(body)}
+        )
+        assert response.status_code == 200
+
+    assert checked == ["stored-1"]
+    assert main.dedupe.is_duplicate("stored-1")
+    assert client.get("/messages").json()["total"] == 2
+
+def test_webhook_signature_checked_before_body_parsing(client):
+    response = client.post(
+        "/webhook",
+        data="{not json",
+        headers={
+            "Content-Type": "application/json",
+            "X-Signature": "invalid_signature"
+        }
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "invalid signature"
+
+def test_webhook_validation_error_shape(client):
+    body = json.dumps({
+        "message_id": "m4",
+        "from": "+919876543210",
+        "to": "+919876543211",
+        "ts": "2025-01-15T10:00:00Z",
+        "text": "Hello"
+    })
+
+    response = client.post(
+        "/webhook",
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            "X-Signature": compute_signature(body)
+        }
+    )
+
+    assert response.status_code == 422
+    error = response.json()["detail"][0]
+    assert error["loc"] == ["body", "ts"]
+    assert error["msg"] == "Value error, Timestamp must be in IST (+05:30)"
+
+def test_webhook_empty_and_non_object_bodies_match_fastapi(client):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.models import WebhookMessage
+
+    reference = FastAPI()
+
+    @reference.post("/webhook")
+    def webhook(message: WebhookMessage):
+        return {}
+
+    with TestClient(reference) as reference_client:
+        for body in ("", "null", "[1]", "123", '"text"', "true"):
+            expected = reference_client.post("/webhook", content=body, headers={"Content-Type": "application/json"})
+            response = client.post(
+                "/webhook",
+                content=body,
+                headers={"Content-Type": "application/json", "X-Signature": compute_signature(body)}
+            )
+            assert response.status_code == expected.status_code == 422
+            assert response.json() == expected.json(), body
+
+    error = client.post("/webhook", content="", headers={"X-Signature": compute_signature("")}).json()["detail"][0]
+    assert (error["type"], error["loc"], error["input"]) == ("missing", ["body"], None)
+    assert "url" in error
+    error = client.post("/webhook", content="[1]", headers={"X-Signature": compute_signature("[1]")}).json()["detail"][0]
+    assert error["type"] == "model_attributes_type"
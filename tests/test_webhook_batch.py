@@ -0,0 +1,78 @@
+import json
+from tests.conftest import compute_signature
+
+def make_message(message_id: str, from_num: str = "+919876543210"):
+    return {
+        "message_id": message_id,
+        "from": from_num,
+        "to": "+919876543211",
+        "ts": "2025-01-15T10:00:00+05:30",
+        "text": "Hello"
+    }
+
+def post_batch(client, body: str, content_type: str = "application/json"):
+    return client.post(
+        "/webhook/batch",
+        content=body,
+        headers={
+            "Content-Type": content_type,
+            "X-Signature": compute_signature(body)
+        }
+    )
+
+def test_batch_json_array(client):
+    body = json.dumps([
+        make_message("b1"),
+        make_message("b2"),
+        make_message("b1"),
+        make_message("b3", from_num="invalid"),
+    ])
+
+    response = post_batch(client, body)
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["created"] == 2
+    assert data["duplicate"] == 1
+    assert data["invalid"] == 1
+    assert [item["result"] for item in data["results"]] == ["created", "created", "duplicate", "invalid"]
+    assert "Indian number" in data["results"][3]["reason"]
+
+    assert client.get("/messages").json()["total"] == 2
+
+def test_batch_ndjson(client):
+    body = "\n".join([
+        json.dumps(make_message("n1")),
+        "not json",
+        json.dumps(make_message("n2")),
+    ])
+
+    response = post_batch(client, body, content_type="application/x-ndjson")
+    assert response.status_code == 200
+
+    results = response.json()["results"]
+    assert [item["result"] for item in results] == ["created", "invalid", "created"]
+    assert results[1]["reason"] == "invalid JSON"
+
+def test_batch_duplicates_existing_rows(client):
+    post_batch(client, json.dumps([make_message("d1")]))
+
+    response = post_batch(client, json.dumps([make_message("d1"), make_message("d2")]))
+    assert [item["result"] for item in response.json()["results"]] == ["duplicate", "created"]
+
+def test_batch_invalid_signature(client):
+    response = client.post(
+        "/webhook/batch",
+        content=json.dumps([make_message("s1")]),
+        headers={"Content-Type": "application/json", "X-Signature": "invalid"}
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "invalid signature"
+
+def test_batch_missing_signature(client):
+    response = client.post("/webhook/batch", content=json.dumps([make_message("s2")]))
+    assert response.status_code == 401
+
+def test_batch_malformed_body(client):
+    response = post_batch(client, '[{"message_id": ')
+    assert response.status_code == 422